@@ -0,0 +1,133 @@
+import networkx as nx
+import numpy as np
+import hashlib
+import os
+from collections import deque
+
+
+# Folder holding precomputed distance matrices, keyed by the hash of each map
+CACHEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MapCache")
+
+# Distance used for territories which cannot reach each other
+UNREACHABLE = np.iinfo(np.int16).max
+
+
+def toMask(territories) -> int:
+    """
+    Converts an iterable of territory IDs to an integer bitmask where bit n is set if
+    territory n is included.
+    """
+    mask = 0
+    for terr in territories:
+        mask |= 1 << terr
+    return mask
+
+
+def fromMask(mask : int) -> set[int]:
+    """
+    Converts an integer bitmask back into a set of territory IDs.
+    """
+    territories = set()
+    while mask:
+        # Isolates lowest set bit, its position is the territory ID
+        lowBit = mask & -mask
+        territories.add(lowBit.bit_length() - 1)
+        mask ^= lowBit
+    return territories
+
+
+def mapHash(graph : nx.Graph, bonuses : dict) -> str:
+    """
+    Hashes the structure of a map so that precomputed data can be cached between runs.
+    """
+    edges = sorted(tuple(sorted(edge)) for edge in graph.edges())
+    bonusTerrs = sorted((bonus, sorted(vals["territories"])) for bonus, vals in bonuses.items())
+    return hashlib.sha256(repr((sorted(graph.nodes()), edges, bonusTerrs)).encode()).hexdigest()[:16]
+
+
+class MapIndex:
+    """
+    Static data about a map which is precomputed once so that set operations become integer
+    ANDs and path lengths become lookups.
+
+    Attributes:
+        hash (str): Hash of the map structure, used as the disk cache key.
+        neighbourMasks (list[int]): Bitmask of the neighbours of each territory, indexed by territory ID.
+        bonusMasks (dict): Bitmask of the territories in each bonus.
+        bonusOf (list[str]): The bonus each territory belongs to, indexed by territory ID.
+        borderMask (int): Bitmask of all territories bordering another bonus.
+        allMask (int): Bitmask of every territory on the map.
+        distances (np.ndarray): All pairs hop distance matrix indexed by territory ID.
+    """
+    def __init__(self, graph : nx.Graph, bonuses : dict):
+        self.hash = mapHash(graph, bonuses)
+        size = max(graph.nodes()) + 1
+
+        self.neighbourMasks = [0] * size
+        self.bonusOf = [None] * size
+        for node in graph.nodes():
+            self.neighbourMasks[node] = toMask(graph.neighbors(node))
+            self.bonusOf[node] = graph.nodes[node]["bonus"]
+
+        self.bonusMasks = {bonus: toMask(vals["territories"]) for bonus, vals in bonuses.items()}
+        self.allMask = toMask(graph.nodes())
+
+        # A territory is a border if it has any neighbour outside of its own bonus
+        self.borderMask = toMask(node for node in graph.nodes()
+                                 if self.neighbourMasks[node] & ~self.bonusMasks[self.bonusOf[node]])
+
+        self.distances = self.loadDistances(graph, size)
+
+
+    def loadDistances(self, graph : nx.Graph, size : int) -> np.ndarray:
+        """
+        Loads the distance matrix from the disk cache, computing and saving it if not present.
+        """
+        cachePath = os.path.join(CACHEDIR, f"{self.hash}.npy")
+        if os.path.exists(cachePath):
+            distances = np.load(cachePath)
+            if distances.shape == (size, size):
+                return distances
+
+        distances = allPairsDistances(graph, size)
+
+        # Caching is best effort, a read only install still works without it
+        try:
+            os.makedirs(CACHEDIR, exist_ok=True)
+            np.save(cachePath, distances)
+        except OSError:
+            pass
+
+        return distances
+
+
+    def neighbourMaskOf(self, territories : int) -> int:
+        """
+        Gets the mask of all territories adjacent to any territory in the given mask.
+        """
+        mask = 0
+        while territories:
+            lowBit = territories & -territories
+            mask |= self.neighbourMasks[lowBit.bit_length() - 1]
+            territories ^= lowBit
+        return mask
+
+
+def allPairsDistances(graph : nx.Graph, size : int) -> np.ndarray:
+    """
+    Computes the hop distance between every pair of territories with a breadth first search
+    from every node.
+    """
+    distances = np.full((size, size), UNREACHABLE, dtype=np.int16)
+
+    for source in graph.nodes():
+        distances[source, source] = 0
+        queue = deque([source])
+        while queue:
+            node = queue.popleft()
+            for neighbour in graph.neighbors(node):
+                if distances[source, neighbour] == UNREACHABLE:
+                    distances[source, neighbour] = distances[source, node] + 1
+                    queue.append(neighbour)
+
+    return distances
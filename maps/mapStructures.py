@@ -2,6 +2,7 @@ import networkx as nx
 from enum import Enum
 from typing import TypedDict
 from .classic import *
+from .mapIndex import MapIndex, fromMask
 
 class MapType(Enum):
     """
@@ -35,31 +36,29 @@ class Map:
     Attributes:
         graph (nx.Graph): A networkx graph representing the map, with each node representing a territory.
         bonuses (dict): A dictionary corresponding each bonus to the troops awarded if all territories are held. 
+        index (MapIndex): Precomputed masks and distances for fast lookups.
     """
     def __init__(self, mapType : MapType):
         match mapType:
             case MapType.CLASSIC:
                 self.mapType = mapType
-                self.graph = Classic
+                # Copied so that each game owns its territory data rather than sharing the module graph
+                self.graph = Classic.copy()
                 self.bonuses = classicBonusDict
                 
             # Currently do not have asia implemented but showing how it would be instantiated.
             case MapType.ASIA:
                 self.mapType = mapType
-                self.graph = Classic
+                self.graph = Classic.copy()
                 self.bonuses = classicBonusDict # should be AsiaBonusVals
                 
         # Adds territory names for interface        
         self.territoryNames = [node["name"] for _, node in sorted(self.graph.nodes(data=True), key=lambda x: x[0])]
 
 
-        # Adds list of border territories for calculations
-        self.borderTerr = set()
-        # Iterates through all nodes, checking if it has a border with a non-bonus territory
-        for node in self.graph.nodes():
-            # map.graph.nodes[node]["bonus"] gets bonus of node
-            # map.bonuses[bonus]["territories"] gets territories for bonus 
-            # Function checks if a node has any neighbours not in the bonus. If so, it is 
-            # a border territory.
-            if any(neighbour not in self.bonuses[(self.graph.nodes[node]["bonus"])]["territories"] for neighbour in self.graph.neighbors(node)):          
-                self.borderTerr.add(node)
+        # Precomputes neighbour, bonus and border masks and all pairs distances
+        self.index = MapIndex(self.graph, self.bonuses)
+
+        # Adds set of border territories for calculations. A node is a border territory 
+        # if it has any neighbours not in its own bonus.
+        self.borderTerr = fromMask(self.index.borderMask)
@@ -1,11 +1,14 @@
 import click
 from .interface import *
 from .structures import GameState
-from .riskAI import riskAgent
+from .riskAi import riskAgent
+from .beamAI import beamAgent
+from .mctsAI import mctsAgent
 from .simpleAI import attackGraphSimple
 from .multiAI import attackGraphMulti
 from .randAI import randAI
 from .drawInterface import drawArborescence
+from .snapshot import loadSnapshot, saveSnapshot
 
 # Defines how long an agent should take at maximum
 TIMECONSTRAINT = 5
@@ -15,6 +18,10 @@ def getAgentTurn(gameState : GameState, agentType : str) -> Move:
     match agentType:
         case "actionAI":
             return riskAgent(gameState, TIMECONSTRAINT)
+        case "beamAI":
+            return beamAgent(gameState, TIMECONSTRAINT)
+        case "mctsAI":
+            return mctsAgent(gameState, TIMECONSTRAINT)
         case "randAI":
             return randAI(gameState)
         case _:
@@ -29,7 +36,7 @@ def funcPrompt() -> int:
     click.echo("4. Test the multi stack msa on a static position")
     click.echo("5. Evaluate a static position using the heuristic")
     click.echo("6. Use the debugging features for a variable player game")
-    click.echo("7. <Misc to be added>")
+    click.echo("7. Play a game with the beam search agent against other players")
     click.echo("8. Exit")
     return click.prompt("Choice", type=click.IntRange(min=1, max=7))
 
@@ -71,21 +78,24 @@ def msaSimpleDebug(gameState : GameState):
     # Gets list of territories to capture
     territories = getTerritories(gameState.map)
     # Gets simple attack graph
-    attackGraph, stack, sumTroops = attackGraphSimple(gameState, territories)
+    attackGraph, stack, sumTroops = attackGraphSimple(gameState, territories, debug=True)
     # Outputs results
     drawArborescence(gameState, attackGraph, 100)
     print("Min sum troops found is", sumTroops)
     click.echo("Finished drawing simple arborescence")
 
 def msaMultiDebug(gameState : GameState):
-    # Operates as simple msa. Currenlty not working.
-    click.echo("NOTE: This function is broken as incorrect graph algorithm has been used to generate pathing. This will require further research. ")
+    # Operates as simple msa, attacking from several stacks
     drawBoard(gameState)
     territories = getTerritories(gameState.map)
-    attackGraph, stacks, sumTroops = attackGraphMulti(gameState, territories)
-    drawArborescence(gameState, attackGraph, 300)
-    print("Min sum troops found is", sumTroops)
-    print("Stacks used are", stacks)
+    result = attackGraphMulti(gameState, territories, debug=True)
+    if result is None:
+        click.echo("The territories cannot be reached from the stacks")
+        return
+    attackTrees, requirements = result
+    drawArborescence(gameState, nx.compose_all(list(attackTrees.values())), 300)
+    print("Troops needed by each stack are", requirements)
+    print("Stacks used are", set(attackTrees))
 
     click.echo("Finished drawing multi arborescence")
 
@@ -99,10 +109,14 @@ def debugVariableGame():
 
 
 @click.command()
-def main():
+@click.option("--load", type=click.Path(exists=True, dir_okay=False), default=None, help="Snapshot to load the game from instead of entering it.")
+@click.option("--save", type=click.Path(dir_okay=False), default=None, help="File to save the snapshot of the game to once it is set up, .json or binary.")
+def main(load, save):
     # Initialises gamestate which holds all relevant info 
     # about game in progress
-    gameState = setupGameState()
+    gameState = loadSnapshot(load) if load is not None else setupGameState()
+    if save is not None:
+        saveSnapshot(gameState, save)
     
     # Chooses and executes desired game functionality
     match funcPrompt():
@@ -119,7 +133,7 @@ def main():
         case 6:
             debugVariableGame(gameState)
         case 7:
-            pass
+            variableAgentGame(gameState, "beamAI")
         case 8:
             print("Exiting...")
     
@@ -1,8 +1,11 @@
 # Framework to encode all abstract actions, provide pruning 
 # # techniques and describe their purpose. 
 from enum import Enum
+import numpy as np
 from typing import TypeAlias, Set, Optional
 from .structures import GameState, Territories
+from maps.mapIndex import fromMask, toMask
+from .stackPaths import stackPathsCached
 
 
 class ActionType(Enum):
@@ -96,7 +99,13 @@ def generateKPSet(player : int, gameState: GameState) -> Set[KillPlayer]:
 
 
 def kpData(gameState : GameState, kp : KillPlayer) -> Optional[Territories]:
-    return gameState.playerDict[kp.player]["territories"]
+    """
+    Finds all territories of the player, or None if the stacks cannot reach every one.
+    """
+    territories = gameState.playerDict[kp.player]["territories"]
+    if not stackPathsCached(gameState).reachable(territories):
+        return None
+    return territories
 
 
 class TakeBonus(Action):
@@ -119,13 +128,13 @@ class TakeBonus(Action):
         self.bonus = bonus
         self.player = player
 
-        def __eq__(self, other):
-                if not isinstance(other, TakeBonus):
-                    return False
-                return self.bonus == other.bonus
-            
-        def __hash__(self):
-            return hash((self.player, self.bonus))
+    def __eq__(self, other):
+        if not isinstance(other, TakeBonus):
+            return False
+        return (self.player, self.bonus) == (other.player, other.bonus)
+    
+    def __hash__(self):
+        return hash((self.player, self.bonus))
 
 
 def generateTBSet(player : int, gameState: GameState) -> Set[TakeBonus]:
@@ -134,19 +143,35 @@ def generateTBSet(player : int, gameState: GameState) -> Set[TakeBonus]:
     """
     
     actions = set()
+    
+    # Owner of every bonus is tracked incrementally in bitboard mode
+    if gameState.bitboard:
+        for bonus in gameState.map.bonuses.keys():
+            if bonus not in gameState.playerDict[player]["bonusesHeld"]:
+                actions.add(TakeBonus(bonus, gameState.bonusOwner.get(bonus)))
+        return actions
+    
     for bonus in gameState.map.bonuses.keys():
         if bonus not in gameState.playerDict[player]["bonusesHeld"]:
             owningPlayer = None
-            for player in gameState.playersAlive:
-                if bonus in gameState.playerDict[player]["bonusesHeld"]:
-                    owningPlayer = player
+            for aliveP in gameState.playersAlive:
+                if bonus in gameState.playerDict[aliveP]["bonusesHeld"]:
+                    owningPlayer = aliveP
                     break
             actions.add(TakeBonus(bonus, owningPlayer))
 
     return actions
 
 def tbData(gameState : GameState, tb : TakeBonus) -> Optional[Territories]:
-    return gameState.map.bonuses[tb.bonus]["territories"]
+    """
+    Finds the territories of the bonus the agent does not own, or None if the stacks cannot 
+    reach every one.
+    """
+    owner = gameState.board.owner
+    territories = {terr for terr in gameState.map.bonuses[tb.bonus]["territories"] if owner[terr] != gameState.agentID}
+    if not stackPathsCached(gameState).reachable(territories):
+        return None
+    return territories
 
 class BreakBonus(Action):
     """
@@ -169,10 +194,10 @@ class BreakBonus(Action):
     def __eq__(self, other):
         if not isinstance(other, BreakBonus):
             return False
-        return self.bonus == other.bonus
+        return (self.player, self.bonus) == (other.player, other.bonus)
 
     def __hash__(self):
-            return hash((self.player, self.bonus))
+        return hash((self.player, self.bonus))
 
 
 def generateBBSet(player : int, gameState: GameState) -> Set[BreakBonus]:
@@ -187,17 +212,19 @@ def generateBBSet(player : int, gameState: GameState) -> Set[BreakBonus]:
 
 
 def bbDataWeakest(gameState : GameState, bb : BreakBonus) -> Optional[Territories]:
-    bonusBorders = gameState.map.bonuses[bb.bonus]["territories"] & gameState.map.borderTerr
+    """
+    Finds the border of the bonus which costs the fewest troops to capture, with ties going to
+    the border cheapest to reach from a stack. Returns None if no stack reaches the bonus.
+    """
+    index = gameState.map.index
+    paths = stackPathsCached(gameState)
+    bonusBorders = [terr for terr in sorted(fromMask(index.bonusMasks[bb.bonus] & index.borderMask)) 
+                    if paths.nearest[terr] < np.inf]
     
-    minTroops = float("inf")
-    minTerr = None
+    if len(bonusBorders) == 0:
+        return None
     
-    for terr in bonusBorders:
-        if gameState.map.graph.nodes[terr]["troops"] < minTroops:
-            minTroops = gameState.map.graph.nodes[terr]["troops"]
-            minTerr = terr
-        
-    return {minTerr}
+    return {min(bonusBorders, key=lambda terr: (paths.weights[terr], paths.nearest[terr]))}
 
 
 
@@ -229,26 +256,15 @@ class ExpandBorders(Action):
 def ebData(gameState : GameState, eb : ExpandBorders) -> Optional[Territories]:
     """
     Finds the territory which is a bonus border adjacent to the agent's territories
-    with the least troops to capture. 
+    cheapest to capture from the agent's stacks. 
     """
-    borders = set()
+    board = gameState.board
+    index = gameState.map.index
+    borders = fromMask(index.borderMask & toMask(board.frontier(gameState.agentID).tolist()))
     
-    for border in gameState.map.borderTerr:
-        if gameState.map.graph.nodes[border]["player"] != gameState.agentID:
-            if any(neighbour in gameState.playerDict[gameState.agentID]["territories"] for neighbour in gameState.map.graph.neighbors(border)):
-                borders.add(border)
-                
-                
-    if len(borders) == 0:
+    minTerr = stackPathsCached(gameState).cheapest(borders)
+    if minTerr is None:
         return None
-    
-    minTroops = float("inf")
-    minTerr = None
-    
-    for terr in borders:
-        if gameState.map.graph.nodes[terr]["troops"] < minTroops:
-            minTroops = gameState.map.graph.nodes[terr]["troops"]
-            minTerr = terr
         
     return {minTerr}
 
@@ -298,25 +314,21 @@ def generateTCSet() -> Set[TakeCard]:
 
 def tcData(gameState : GameState) -> Optional[Territories]:
     """
-    Calculates the adjacent territory with the least troops to take attack.
+    Calculates the adjacent territory cheapest to take from the agent's stacks, or with the 
+    least troops when no stack can reach one.
     """
-    neighbours = set()
-    
-    for owned in gameState.playerDict[gameState.agentID]["territories"]:
-        for neighbour in gameState.map.graph.neighbors(owned):
-            if gameState.map.graph.nodes[neighbour]["player"] != gameState.agentID:
-                neighbours.add(neighbour)
+    # All enemy territories adjacent to the agent
+    neighbours = gameState.board.frontier(gameState.agentID)
     
+    if len(neighbours) == 0:
+        return {None}
     
-    minTroops = float("inf")
-    minTerr = None
-    
-    for terr in neighbours:
-        if gameState.map.graph.nodes[terr]["troops"] < minTroops:
-            minTroops = gameState.map.graph.nodes[terr]["troops"]
-            minTerr = terr
+    minTerr = stackPathsCached(gameState).cheapest(neighbours.tolist())
+    if minTerr is None:
+        # First territory with the fewest troops, matching ascending ID iteration
+        minTerr = neighbours[np.argmin(gameState.board.troops[neighbours])]
         
-    return {minTerr}
+    return {int(minTerr)}
 
 
     
@@ -1,7 +1,10 @@
 from .structures import *
 from .actions import *
 from typing import List
+import numpy as np
 from .heuristic import findBorders, findInternalTerritories
+from .stackPaths import stackSelect, stackPathsCached
+from maps.mapIndex import fromMask
 
 
 
@@ -19,10 +22,11 @@ def firstTrade(gameState : GameState) -> Optional[Trade]:
     if len(cards) < 3:
         return None
 
-    # Count the number of each type of card
-    typeDict = {CardType.INFANTRY: {}, CardType.CAVALRY: {}, CardType.ARTILLERY: {}, CardType.WILD: {}}
+    # Count the number of each type of card. Lists rather than sets, as the two wild cards 
+    # compare equal and would otherwise count as one
+    typeDict = {CardType.INFANTRY: [], CardType.CAVALRY: [], CardType.ARTILLERY: [], CardType.WILD: []}
     for card in cards:
-        typeDict[card.type].add(card)
+        typeDict[card.type].append(card)
         
         
 
@@ -38,16 +42,17 @@ def firstTrade(gameState : GameState) -> Optional[Trade]:
             tradeList.append(bonusCards[0])
             seenTypes.add(bonusCards[0].type)
             # Removes from game structures as it is used
-            gameState.playerDict[gameState.agentID]["cards"].remove(bonusCards[0])
+            gameState.removeCard(bonusCards[0])
 
-        # Gets first possible cards of other types without bonuses if possible
-        for card in cards:
+        # Gets first possible cards of other types without bonuses if possible. Loops over
+        # a copy as cards are removed from the hand while looping
+        for card in list(cards):
             if card.type not in seenTypes and card not in bonusCards:
                 tradeList.append(card)
                 seenTypes.add(card.type)
                 
                 # Removes from player's hand as it is used
-                gameState.playerDict[gameState.agentID]["cards"].remove(card)
+                gameState.removeCard(card)
 
                 
                 if len(seenTypes) == 3:
@@ -60,7 +65,7 @@ def firstTrade(gameState : GameState) -> Optional[Trade]:
                 seenTypes.add(card.type)
                 
                 # Removes from player's hand as it is used
-                gameState.playerDict[gameState.agentID]["cards"].remove(card)
+                gameState.removeCard(card)
 
                 
                 if len(seenTypes) == 3:
@@ -84,22 +89,22 @@ def firstTrade(gameState : GameState) -> Optional[Trade]:
             if len(bonusCards) > 0:
                 # Adds a single bonus card
                 currTrade.append(bonusCards[0])
-                gameState.playerDict[gameState.agentID]["cards"].remove(card)
-                typeDict[cType].remove(card)
+                gameState.removeCard(bonusCards[0])
+                typeDict[cType].remove(bonusCards[0])
 
             # Attempts to add non bonus cards to complete trade
             for card in typeDict[cType]:
                 if card not in bonusCards:
                     currTrade.append(card)
-                    gameState.playerDict[gameState.agentID]["cards"].remove(card)
+                    gameState.removeCard(card)
                     
                     if len(currTrade) == 3:
                         return tuple(currTrade)
                     
             # If not, adds unused bonus carsd too to trade
-            for card in bonusCards:
+            for card in bonusCards[1:]:
                 currTrade.append(card)
-                gameState.playerDict[gameState.agentID]["cards"].remove(card)
+                gameState.removeCard(card)
                 
                 if len(currTrade) == 3:
                     return tuple(currTrade)
@@ -107,7 +112,7 @@ def firstTrade(gameState : GameState) -> Optional[Trade]:
             # If not enough cards of the one type, adds wilds until trade is made
             for card in typeDict[CardType.WILD]:
                 currTrade.append(card)
-                gameState.playerDict[gameState.agentID]["cards"].remove(card)
+                gameState.removeCard(card)
                 
                 if len(currTrade) == 3:
                     return tuple(currTrade)
@@ -170,7 +175,7 @@ def draftTroopsAmount(gameState : GameState, tradeList : List[Trade]) -> int:
     
     # Calculate the additional troops to be drafted based on the trade list
     for trade in tradeList:
-        troopsToDraft += trade.bonus
+        troopsToDraft += tradeAmount(trade)
         
     return troopsToDraft
 
@@ -188,87 +193,20 @@ def ownedTerrConnected(player : int, gameState : GameState, terr1 : int, terr2 :
     # Check if there is a path between terr1 and terr2 in the subgraph
     return nx.has_path(playerSubgraph, terr1, terr2)
 
-    
-
-
-
-
-    
-    
-    
-    
-
-
-
-def stackSelect(gameState : GameState, player: int) -> Territories:
-    """
-    Generally, optimal play is to have a very high troop
-    density, with troops placement tending to be 1 in all internal and non-important territories, and 
-    as high as possible for critical and mobile locations. Selects the territories which are considered
-    a "stack" with a significant amount of troops. This is both relative to the player and the game. Stacks
-    should have a significant % of the players troops, and it should also be considered in comparison to 
-    other players totals. Beyond a certain point, say 10 troops these territories have significant mobility and attacking 
-    power and should also be considered stacks. 
-    """
-    # This defines a stack to have at least 10% of the player's total troops. Should and can be changed during testing. 
-    totalTroopPercent = 10
-    percCutoff = gameState.playerDict[player]["troops"] // totalTroopPercent
-    
-    # Any territories with more than 10 troops are considered stacks
-    largeStackSize = 10
-    
-    stacks = {
-    terr for terr in gameState.playerDict[player]["territories"]
-    if gameState.map.graph.nodes[terr]["troops"] >= percCutoff or gameState.map.graph.nodes[terr]["troops"] >= largeStackSize
-    }   
-    
-    return stacks
-
-
-def weightNode(node : int, gameState : GameState, territories : Territories) -> int:
-    """
-    Given a node, calculates the weight of the node based on the current game state and territories. 
-    """
-    # Weights are calculated based on the number of troops in the territory, the number of adjacent 
-    # enemy territories, and the number of adjacent friendly territories. 
-    nodeWeight = 0
-    
-    # If the territory is owned by the player, the weight is the number of troops in the territory
-    if gameState.map.graph.nodes[node]["player"] == gameState.agentID:
-        nodeWeight = gameState.map.graph.nodes[node]["troops"]
-        
-    # If the territory is not owned by the player, the weight is the number of troops in the territory 
-    # plus the number of adjacent friendly territories minus the number of adjacent enemy territories
-    else:
-        nodeWeight = gameState.map.graph.nodes[node]["troops"]
-        
-        for neighbour in gameState.map.graph.neighbors(node):
-            if neighbour in territories:
-                nodeWeight += 1
-            elif gameState.map.graph.nodes[neighbour]["player"] != gameState.agentID:
-                nodeWeight -= 1
-                
-    return nodeWeight
-
 
 # Separated from rest due to function usage
 def bbDataClosest(gameState : GameState, bb : BreakBonus) -> Optional[Territories]:
-    bonusBorders = gameState.map.bonuses[bb.bonus]["territories"] & gameState.map.borderTerr
-    
-    stacks = stackSelect(gameState, gameState.agentID)
-    
-    minLen = float("inf")
-    minAtt = None
-    
-    for stack in stacks:
-        for terr in bonusBorders:
-            pathLen = nx.shortest_path(gameState.map.graph, source=stack, target=terr)
-            if pathLen < minLen:
-                minLen = pathLen
-                minAtt = terr
+    """
+    Finds the border of the bonus cheapest to capture from any stack, counting the troops 
+    expected to be lost along the way. 
+    """
+    index = gameState.map.index
+    bonusBorders = fromMask(index.bonusMasks[bb.bonus] & index.borderMask)
     
+    minAtt = stackPathsCached(gameState).cheapest(bonusBorders)
     if minAtt is None:
-        return None    
+        return None
+    
     return {minAtt}
 
 
@@ -312,9 +250,17 @@ def contestedBonuses(player : int, gameState : GameState) -> set[str]:
     """Gets list of which bonuses are planned to be taken by the agent"""
     contestedBonuses = set()
     
+    if gameState.bitboard:
+        ownedMask = gameState.playerDict[player]["territoryMask"]
+        for bonus, bonusMask in gameState.map.index.bonusMasks.items():
+            # Planned bonuses cannot already be taken, and more than half must be owned
+            if bonus not in gameState.playerDict[player]["bonusesHeld"] and (bonusMask & ownedMask).bit_count() * 2 > bonusMask.bit_count():
+                contestedBonuses.add(bonus)
+        return contestedBonuses
+    
     for bonus in gameState.map.bonuses:
         # Planned bonuses cannot already be taken
-        if bonus not in gameState.playerDict[player]["bonuses"]:
+        if bonus not in gameState.playerDict[player]["bonusesHeld"]:
             # Check how many territories are owned by the agent
             terrsOwned = len(gameState.map.bonuses[bonus]["territories"] & gameState.playerDict[player]["territories"])
             # If the agent owns more than half of the territories in the bonus, it is contested
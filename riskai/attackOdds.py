@@ -0,0 +1,151 @@
+# Exact odds of planned attacks. The attacks of a move made by simpleAI.graphToAttack form an
+# arborescence from each attacking stack, and since the battles of different branches share no
+# troops, the probability of capturing every target is found exactly by dynamic programming
+# over the troops held at each territory, using the distributions of attackers remaining.
+from .structures import *
+from .dice import captureMatrix
+from typing import Dict
+import numpy as np
+
+
+# Smallest troop distributions held, sizes are powers of two so capture matrices are shared
+MINSIZE = 32
+
+# Troop amounts tried for each split when optimising how troops are divided between branches
+SPLITCANDIDATES = 16
+
+
+def distributionSize(troops : int) -> int:
+    """
+    Length of the troop distributions needed to hold every amount up to troops.
+    """
+    size = MINSIZE
+    while size <= troops:
+        size *= 2
+    return size
+
+
+def attackTree(attack : Attack) -> Tuple[list[int], Dict[int, list[Tuple[int, int]]]]:
+    """
+    Gets the stacks attacked from and, for every territory, the territories attacked from it
+    with the troops moved into each, in the order they are attacked. Attacks from several
+    stacks form a forest, whose trees share no troops.
+    """
+    children = {}
+    for fromTerr, toTerr, _, moved in attack:
+        children.setdefault(fromTerr, []).append((toTerr, moved))
+    targets = {toTerr for _, toTerr, _, _ in attack}
+    return ([terr for terr in children if terr not in targets], children)
+
+
+def branchOutcomes(size : int, moved : int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    For every number of attackers remaining after a capture, the troops moved into the captured
+    territory and the troops left behind, moving as GameState.apply does.
+    """
+    remaining = np.arange(size)
+    move = np.minimum(max(moved, 1), remaining)
+    return (move, np.minimum(1 + remaining - move, size - 1))
+
+
+def successVector(troops : np.ndarray, children : dict, node : int, size : int) -> np.ndarray:
+    """
+    Probability of capturing every territory below node for each number of troops held on node.
+    Branches are worked through from the last, as each attack leaves behind the troops the later
+    branches attack with.
+    """
+    # Probability the branches still to attack succeed, for the troops left on node
+    later = np.ones(size)
+    for child, moved in reversed(children.get(node, [])):
+        captures = captureMatrix(int(troops[child]), size)
+        move, left = branchOutcomes(size, moved)
+        outcomes = successVector(troops, children, child, size)[move] * later[left]
+        # Holding t troops attacks with t - 1, and a failed attack leaves nothing to attack with
+        later = np.concatenate(([0.0], captures[:size - 1] @ outcomes))
+    return later
+
+
+def attackSuccessProbability(troops : np.ndarray, attack : Attack) -> float:
+    """
+    Exact probability that every attack captures its target with fair dice, from the troops on
+    every territory with any draft already placed, such as GameState.board.troops.
+    """
+    if len(attack) == 0:
+        return 1.0
+    stacks, children = attackTree(attack)
+    size = distributionSize(max(int(troops[stack]) for stack in stacks))
+    return float(np.prod([successVector(troops, children, stack, size)[int(troops[stack])] for stack in stacks]))
+
+
+def branchOdds(troops : np.ndarray, attack : Attack) -> Dict[int, Tuple[float, float]]:
+    """
+    Gets, for every target, the probability it is captured and the expected troops moved into
+    it when it is, found by pushing the distribution of troops held down the arborescence.
+    """
+    if len(attack) == 0:
+        return {}
+    stacks, children = attackTree(attack)
+    size = distributionSize(max(int(troops[stack]) for stack in stacks))
+
+    odds = {}
+    pending = []
+    for stack in stacks:
+        held = np.zeros(size)
+        held[int(troops[stack])] = 1
+        pending.append((stack, held))
+    while pending:
+        node, held = pending.pop()
+        for child, moved in children.get(node, []):
+            captures = captureMatrix(int(troops[child]), size)
+            remaining = held[1:] @ captures[:size - 1]
+            move, left = branchOutcomes(size, moved)
+            arrived = np.bincount(move, weights=remaining, minlength=size)
+
+            # Failed attacks leave one troop behind, which later branches cannot attack with
+            failed = held.sum() - remaining.sum()
+            held = np.bincount(left, weights=remaining, minlength=size)
+            held[1] += failed
+
+            captured = float(arrived.sum())
+            odds[child] = (captured, float(arrived @ np.arange(size)) / captured if captured > 0 else 0.0)
+            pending.append((child, arrived))
+    return odds
+
+
+def optimiseSplits(troops : np.ndarray, attack : Attack) -> Tuple[Attack, float]:
+    """
+    Chooses the troops moved into each target that is not the last attacked from its territory,
+    so as to maximise the probability of capturing every target. Last branches always move every
+    troop they can. Each split is improved in turn over a spread of amounts until none improves.
+    Returns the attacks with the chosen moves and their probability of success.
+    """
+    if len(attack) == 0:
+        return (attack, 1.0)
+    stacks, children = attackTree(attack)
+    stackTroops = max(int(troops[stack]) for stack in stacks)
+    size = distributionSize(stackTroops)
+
+    def success() -> float:
+        return float(np.prod([successVector(troops, children, stack, size)[int(troops[stack])] for stack in stacks]))
+
+    # Only splits before the last branch of each territory can change the outcome
+    splits = [(node, i) for node, branches in children.items() for i in range(len(branches) - 1)]
+    candidates = sorted(set(np.linspace(1, stackTroops, SPLITCANDIDATES).astype(int).tolist()))
+
+    best = success()
+    improved = True
+    while improved:
+        improved = False
+        for node, i in splits:
+            child, current = children[node][i]
+            for moved in candidates:
+                if moved == current:
+                    continue
+                children[node][i] = (child, moved)
+                value = success()
+                if value > best + 1e-12:
+                    best, current, improved = value, moved, True
+            children[node][i] = (child, current)
+
+    chosen = {toTerr: moved for branches in children.values() for toTerr, moved in branches}
+    return ([(fromTerr, toTerr, dice, chosen[toTerr]) for fromTerr, toTerr, dice, _ in attack], best)
@@ -0,0 +1,167 @@
+from .structures import *
+from .actions import *
+from .riskAi import generateActionDict, validateActionSet, calculateActionSeq, evalAction, actionTargets, scoreCandidates, noAttackMove
+from .agentHelper import draftTroopsAmount
+from .dice import captureLoss
+from .deadline import Deadline
+from typing import Dict
+import click
+
+
+# Most plans kept in the frontier between levels of the search
+BEAMWIDTH = 8
+
+# Actions which can be combined into larger plans, matching the sequences of ids
+COMBINABLE = (ActionType.KILLPLAYER, ActionType.TAKEBONUS, ActionType.BREAKBONUS, ActionType.EXPANDBORDERS)
+
+
+class Plan:
+    """
+    A set of abstract actions built up by the beam search one action at a time.
+
+    Attributes:
+        actions (frozenset): The actions in the plan.
+        targets (frozenset): Every territory the actions attack.
+        cost (float): Expected troops spent capturing the targets, from the dice tables.
+        estimate (float): Cheap optimistic value of the plan used to order plans before calculating them.
+        parent (Plan): The plan this was extended from, None for single actions.
+        move (Move): The calculated move, None until the plan has been calculated.
+        captured (set): Territories attacked by the calculated move.
+        value (float): Score of the calculated move.
+    """
+    def __init__(self, actions : frozenset, targets : frozenset, cost : float, parent : Optional["Plan"]):
+        self.actions = actions
+        self.targets = targets
+        self.cost = cost
+        self.estimate = sum(evalAction(action) for action in actions) - cost
+        self.parent = parent
+        self.move = None
+        self.captured = set()
+        self.value = float('-inf')
+
+
+def availableTroops(gameState : GameState) -> int:
+    """
+    Optimistic count of the troops one stack could attack with this turn: the largest owned
+    stack, everything drafted and the best trade for every set of three cards held.
+    """
+    board = gameState.board
+    largestStack = int(board.troops[board.owner == gameState.agentID].max(initial=1))
+    return largestStack - 1 + draftTroopsAmount(gameState, []) + 10 * (len(gameState.cards) // 3)
+
+
+def captureCost(troops : list[int], targets : frozenset) -> float:
+    """
+    Expected troops spent capturing all targets, being the attackers lost on each plus the
+    troop left behind on it.
+    """
+    return sum(captureLoss(troops[terr]) + 1 for terr in targets)
+
+
+def expandPlans(frontier : list[Plan], targets : Dict[Action, frozenset], troops : list[int], available : int) -> list[Plan]:
+    """
+    Extends every plan in the frontier by each combinable action it does not hold, dropping
+    plans whose actions conflict or which cost more troops than are available.
+    """
+    children = {}
+    for plan in frontier:
+        if any(action.action not in COMBINABLE for action in plan.actions):
+            continue
+
+        for action in targets:
+            if action.action not in COMBINABLE or action in plan.actions:
+                continue
+            actions = plan.actions | {action}
+            if actions in children or not validateActionSet(actions):
+                continue
+
+            newTargets = plan.targets | targets[action]
+            cost = captureCost(troops, newTargets)
+            if cost <= available:
+                children[actions] = Plan(actions, newTargets, cost, plan)
+
+    return list(children.values())
+
+
+def calculatePlan(gameState : GameState, plan : Plan) -> Optional[Tuple[Move, int]]:
+    """
+    Calculates the move of a plan, returning it with the value of its actions, or None if the
+    plan is not viable. If the parent's move already attacks every new target, the parent's
+    attack graph covers this plan too and is reused rather than planned again.
+    """
+    actionEval = sum(evalAction(action) for action in plan.actions)
+    parent = plan.parent
+    if parent is not None and parent.move is not None and plan.targets <= parent.captured:
+        plan.move, plan.captured = parent.move, parent.captured
+        return (plan.move, actionEval)
+
+    result = calculateActionSeq(gameState, plan.actions, len(plan.actions))
+    if result is None:
+        return None
+    move, sumTroops, _ = result
+
+    # Same viability cut as ids
+    if sumTroops * 2 > gameState.playerDict[gameState.agentID]["troops"]:
+        return None
+
+    plan.move = move
+    plan.captured = {attack[1] for attack in move[1]}
+    return (move, actionEval)
+
+
+def beamSearch(gameState : GameState, timeConstraint : float | Deadline, width : int = BEAMWIDTH) -> Tuple[Move, float]:
+    """
+    Best first search over abstract actions. Plans start as single actions and grow by one
+    action per level. At each level new plans are ordered by the value of their actions less
+    their expected troop cost, and calculated in that order until width viable plans are found,
+    which are scored by the batch heuristic and become the frontier for the next level. Unlike
+    ids, plans extend the best plans of the previous level rather than every combination.
+    """
+    deadline = Deadline.of(timeConstraint)
+    actionDict = generateActionDict(gameState.agentID, gameState)
+    bestMove = noAttackMove(gameState, actionDict)
+
+    actions = set().union(*actionDict.values()) - actionDict[ActionType.NOATTACK]
+    targets = actionTargets(gameState, actions)
+    troops = gameState.board.troops.tolist()
+    available = availableTroops(gameState)
+
+    frontier = [Plan(frozenset({action}), targets[action], captureCost(troops, targets[action]), None)
+                for action in targets if captureCost(troops, targets[action]) <= available]
+    depth = 1
+
+    while frontier:
+        frontier.sort(key=lambda plan: plan.estimate, reverse=True)
+
+        # Plans are calculated most promising first until the beam is full
+        viable, candidates = [], []
+        for plan in frontier:
+            if len(viable) == width or deadline.expired():
+                break
+            result = calculatePlan(gameState, plan)
+            if result is not None:
+                viable.append(plan)
+                candidates.append(result)
+
+        if candidates:
+            evals = scoreCandidates(gameState, candidates)
+            for plan, value in zip(viable, evals.tolist()):
+                plan.value = value
+                if value > bestMove[1]:
+                    bestMove = (plan.move, value)
+
+        if deadline.expired():
+            click.echo(f"Beam search stopped at depth {depth} as the time constraint was met")
+            return bestMove
+
+        frontier = expandPlans(viable, targets, troops, available)
+        depth += 1
+
+    return bestMove
+
+
+def beamAgent(gameState : GameState, timeConstraint : float | Deadline) -> Move:
+    """
+    Gets a move from the beam search, as an alternative agent to riskAgent.
+    """
+    return beamSearch(gameState, timeConstraint)[0]
@@ -0,0 +1,252 @@
+# Array backed core of the board. Holds territory owners and troop counts in numpy
+# arrays indexed by territory ID so that hot paths in the agents can avoid going
+# through networkx attribute dictionaries for every read.
+import numpy as np
+import networkx as nx
+from collections.abc import MutableMapping
+import functools
+
+
+# Node attributes which are stored in the board arrays rather than the graph
+DYNAMICATTRS = ("troops", "player")
+
+# Zobrist hashing constants. Keys are drawn for every (territory, owner, troop bucket), 
+# troop counts below EXACTTROOPS each get their own bucket while larger counts share a 
+# bucket per power of two. 
+MAXPLAYERS = 10
+EXACTTROOPS = 64
+NUMBUCKETS = EXACTTROOPS + 32
+ZOBRISTSEED = 7484835
+
+
+def troopBucket(troops : int) -> int:
+    """
+    Gets the Zobrist troop bucket for an amount of troops.
+    """
+    if troops < EXACTTROOPS:
+        return max(troops, 0)
+    return EXACTTROOPS + troops.bit_length() - EXACTTROOPS.bit_length()
+
+
+@functools.cache
+def zobristTable(size : int) -> list:
+    """
+    Random 64 bit keys indexed by [territory][owner][troop bucket]. Seeded so hashes are 
+    the same between runs and processes. 
+    """
+    rng = np.random.default_rng(ZOBRISTSEED)
+    return rng.integers(0, 2**64, size=(size, MAXPLAYERS, NUMBUCKETS), dtype=np.uint64).tolist()
+
+
+@functools.cache
+def handTable(size : int) -> list:
+    """
+    Random 64 bit keys for cards indexed by [territory][card type], with wild cards on territory 0, 
+    and keys for the agent indexed by [size][agentID]. 
+    """
+    rng = np.random.default_rng(ZOBRISTSEED + 1)
+    return rng.integers(0, 2**64, size=(size + 1, MAXPLAYERS), dtype=np.uint64).tolist()
+
+
+class Board:
+    """
+    Compact representation of who owns each territory and how many troops are on it.
+    All arrays are indexed by territory ID. As territory IDs start at 1, index 0 is a
+    dummy entry which is owned by player -1 and has no neighbours.
+
+    Attributes:
+        owner (np.ndarray): The player ID owning each territory.
+        troops (np.ndarray): The amount of troops on each territory.
+        indptr (np.ndarray): CSR row pointers. Neighbours of territory n are held in
+        indices[indptr[n]:indptr[n + 1]].
+        indices (np.ndarray): CSR column indices holding the neighbour IDs of each territory.
+        rows (np.ndarray): The territory each entry of indices belongs to, so that every
+        directed edge (rows[i], indices[i]) can be operated on at once.
+        nodes (np.ndarray): All territory IDs in ascending order.
+        hash (int): Zobrist hash of the owners and troop buckets of all territories. Kept up to 
+        date by setTroops and setOwner, so all writes to the arrays should go through them.
+    """
+    def __init__(self, owner : np.ndarray, troops : np.ndarray, indptr : np.ndarray, indices : np.ndarray):
+        self.owner = owner
+        self.troops = troops
+        # CSR adjacency is static for a map, so it is shared between all copies of a board
+        self.indptr = indptr
+        self.indices = indices
+        self.rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+        self.nodes = np.arange(1, len(owner), dtype=np.int32)
+        self.zobrist = zobristTable(len(owner))
+        self.hash = self.computeHash()
+
+
+    @classmethod
+    def fromGraph(cls, graph : nx.Graph) -> "Board":
+        """
+        Builds the board arrays and CSR adjacency from the node attributes of a map graph.
+        """
+        size = max(graph.nodes()) + 1
+        owner = np.full(size, -1, dtype=np.int32)
+        troops = np.zeros(size, dtype=np.int32)
+
+        # Neighbours are sorted so that CSR rows are deterministic
+        indptr = np.zeros(size + 1, dtype=np.int32)
+        neighbourLists = [[] for _ in range(size)]
+        for node, data in graph.nodes(data=True):
+            owner[node] = data["player"]
+            troops[node] = data["troops"]
+            neighbourLists[node] = sorted(graph.neighbors(node))
+
+        for node in range(size):
+            indptr[node + 1] = indptr[node] + len(neighbourLists[node])
+        indices = np.array([neigh for neighs in neighbourLists for neigh in neighs], dtype=np.int32)
+
+        return cls(owner, troops, indptr, indices)
+
+
+    def copy(self) -> "Board":
+        """
+        Copies the owner and troop arrays, sharing the static adjacency.
+        """
+        board = Board.__new__(Board)
+        board.owner = self.owner.copy()
+        board.troops = self.troops.copy()
+        board.indptr = self.indptr
+        board.indices = self.indices
+        board.rows = self.rows
+        board.nodes = self.nodes
+        board.zobrist = self.zobrist
+        board.hash = self.hash
+        return board
+
+
+    def computeHash(self) -> int:
+        """
+        Computes the Zobrist hash of the board from scratch.
+        """
+        hash = 0
+        for terr, owner, troops in zip(self.nodes.tolist(), self.owner[1:].tolist(), self.troops[1:].tolist()):
+            hash ^= self.zobrist[terr][owner][troopBucket(troops)]
+        return hash
+
+
+    def setTroops(self, terr : int, troops : int):
+        """
+        Sets the troops on a territory, updating the hash.
+        """
+        owner, troops = int(self.owner[terr]), int(troops)
+        oldBucket, newBucket = troopBucket(int(self.troops[terr])), troopBucket(troops)
+        if oldBucket != newBucket:
+            self.hash ^= self.zobrist[terr][owner][oldBucket] ^ self.zobrist[terr][owner][newBucket]
+        self.troops[terr] = troops
+
+
+    def setOwner(self, terr : int, owner : int):
+        """
+        Sets the owner of a territory, updating the hash.
+        """
+        bucket, owner = troopBucket(int(self.troops[terr])), int(owner)
+        self.hash ^= self.zobrist[terr][int(self.owner[terr])][bucket] ^ self.zobrist[terr][owner][bucket]
+        self.owner[terr] = owner
+
+
+    def neighbours(self, terr : int) -> np.ndarray:
+        """
+        Gets the neighbours of a territory as a slice of the CSR indices.
+        """
+        return self.indices[self.indptr[terr]:self.indptr[terr + 1]]
+
+
+    def foreignNeighbours(self) -> np.ndarray:
+        """
+        Counts, for every territory, how many of its neighbours are owned by a different player.
+        """
+        foreign = self.owner[self.rows] != self.owner[self.indices]
+        return np.bincount(self.rows, weights=foreign, minlength=len(self.owner)).astype(np.int32)
+
+
+    def frontier(self, player : int) -> np.ndarray:
+        """
+        Gets all territories not owned by player which are adjacent to one of its territories.
+        """
+        edgeMask = (self.owner[self.rows] == player) & (self.owner[self.indices] != player)
+        return np.unique(self.indices[edgeMask])
+
+
+    def attach(self, graph : nx.Graph):
+        """
+        Replaces the attribute dictionary of every node in graph with a view onto this board,
+        so that existing graph.nodes[n]["troops"] style access reads and writes the arrays.
+        """
+        # networkx holds node attribute dicts in _node, which the NodeView reads from directly
+        for node in graph.nodes():
+            graph._node[node] = TerritoryView(self, node, graph._node[node])
+
+
+    def bindGraph(self, graph : nx.Graph) -> nx.Graph:
+        """
+        Creates a new graph sharing the adjacency of graph, whose nodes are views onto this board.
+        Much cheaper than graph.copy() as no edges are copied.
+        """
+        bound = graph.__class__()
+        bound.graph = graph.graph
+        # Adjacency is never mutated after a map is created so it is safe to share
+        bound._adj = graph._adj
+        bound._node = {node: TerritoryView(self, node, graph._node[node]) for node in graph._node}
+        return bound
+
+
+class TerritoryView(MutableMapping):
+    """
+    Thin dict-like view of a single territory. The "troops" and "player" keys read and write
+    the board arrays, all other attributes such as "name" and "bonus" are held statically.
+
+    Attributes:
+        board (Board): The board holding the dynamic territory data.
+        terr (int): The territory ID viewed.
+        static (dict): All node attributes which are not stored in the board.
+    """
+    __slots__ = ("board", "terr", "static")
+
+    def __init__(self, board : Board, terr : int, attrs):
+        self.board = board
+        self.terr = terr
+        # Static attributes never change during a game so they are shared between views
+        if isinstance(attrs, TerritoryView):
+            self.static = attrs.static
+        else:
+            self.static = {key: val for key, val in attrs.items() if key not in DYNAMICATTRS}
+
+    def __getitem__(self, key):
+        if key == "troops":
+            return int(self.board.troops[self.terr])
+        if key == "player":
+            return int(self.board.owner[self.terr])
+        return self.static[key]
+
+    def __setitem__(self, key, value):
+        if key == "troops":
+            self.board.setTroops(self.terr, value)
+        elif key == "player":
+            self.board.setOwner(self.terr, value)
+        else:
+            self.static[key] = value
+
+    def __delitem__(self, key):
+        if key in DYNAMICATTRS:
+            raise KeyError(f"Cannot delete board attribute {key}")
+        del self.static[key]
+
+    def __iter__(self):
+        yield from self.static
+        yield from DYNAMICATTRS
+
+    def __len__(self):
+        return len(self.static) + len(DYNAMICATTRS)
+
+    def copy(self) -> dict:
+        """
+        Returns a plain dictionary snapshot, used by networkx when graphs are copied.
+        """
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -0,0 +1,238 @@
+# Stored positions for benchmarking the agent. A corpus is a single file of binary snapshots
+# which is memory mapped, so any position can be restored without reading the rest. Positions
+# are dealt at random or recorded from self-play, and replaying a corpus runs the search, the
+# attack planner and the heuristic over every position, recording what each chose and how
+# long it took, to give a baseline that changes to the agent can be measured against.
+from .structures import *
+from .snapshot import pack, unpack
+from .simulate import Game, Agent, newGame, makeAgent, MAXROUNDS
+from .riskAi import riskAgent
+from .simpleAI import attackGraphSimple, attackPlanCache, steinerGraphCache, steinerGraphLock
+from .stackPaths import stackPathsCache, stackPathsLock
+from .heuristic import heuristic
+from typing import Iterable, Iterator
+import contextlib
+import io
+import json
+import random
+import struct
+import time
+import click
+import numpy as np
+
+
+# Start of every corpus file
+CORPUSMAGIC = b"RSKC"
+
+CORPUSVERSION = 1
+
+# Magic, version and the number of positions, followed by the offset of every snapshot
+CORPUSHEADER = struct.Struct("<4sHI")
+
+# Latency percentiles reported by replays
+PERCENTILES = (50, 90, 99)
+
+
+def writeCorpus(path : str, states : Iterable[GameState]) -> int:
+    """
+    Writes game states to a corpus file, returning how many were written. The snapshots are
+    stored back to back after a table of where each starts.
+    """
+    snapshots = [pack(gameState) for gameState in states]
+    offsets = np.cumsum([0] + [len(snapshot) for snapshot in snapshots], dtype="<u8")
+    offsets += CORPUSHEADER.size + 8 * len(offsets)
+    with open(path, "wb") as file:
+        file.write(CORPUSHEADER.pack(CORPUSMAGIC, CORPUSVERSION, len(snapshots)))
+        file.write(offsets.tobytes())
+        for snapshot in snapshots:
+            file.write(snapshot)
+    return len(snapshots)
+
+
+class Corpus:
+    """
+    A memory mapped corpus file, restoring each position when it is indexed.
+
+    Attributes:
+        path (str): The corpus file.
+        data (np.memmap): Bytes of the file.
+        offsets (np.ndarray): Where each snapshot starts, with the end of the file last.
+    """
+    def __init__(self, path : str):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, count = CORPUSHEADER.unpack_from(self.data)
+        if magic != CORPUSMAGIC:
+            raise ValueError(f"Not a position corpus: {path}")
+        if version != CORPUSVERSION:
+            raise ValueError(f"Unsupported corpus version: {version}")
+        self.offsets = np.frombuffer(self.data, dtype="<u8", count=count + 1, offset=CORPUSHEADER.size)
+
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+    def __getitem__(self, i : int) -> GameState:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return unpack(self.data[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes())
+
+
+    def __iter__(self) -> Iterator[GameState]:
+        return (self[i] for i in range(len(self)))
+
+
+# ---------------------------- Generating positions ----------------------------
+
+def dealtPositions(count : int, seed : int = 0, playerCounts : tuple[int, ...] = (2, 3, 4, 5, 6)) -> list[GameState]:
+    """
+    Deals random starting positions, cycling through the player counts.
+    """
+    rng = random.Random(seed)
+    return [newGame(playerCounts[i % len(playerCounts)], rng) for i in range(count)]
+
+
+def selfPlayPositions(count : int, seed : int = 0, agent : str = "randAI", playerCounts : tuple[int, ...] = (2, 3, 4, 5, 6),
+                      timeConstraint : float = 1, maxRounds : int = MAXROUNDS) -> list[GameState]:
+    """
+    Records the position at the start of every turn of games played between copies of an
+    agent, from the view of the player to move, until count positions are recorded. Each
+    game is seeded in turn from seed and cycles through the player counts.
+    """
+    positions = []
+
+    def recorder(player : Agent) -> Agent:
+        def record(gameState : GameState) -> Move:
+            if len(positions) < count:
+                positions.append(pack(gameState))
+            return player(gameState)
+        return record
+
+    game = 0
+    while len(positions) < count:
+        numPlayers = playerCounts[game % len(playerCounts)]
+        agents = [recorder(makeAgent(agent, timeConstraint, seed + game * numPlayers + seat)) for seat in range(numPlayers)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            Game(agents, seed + game).play(maxRounds)
+        game += 1
+    return [unpack(snapshot) for snapshot in positions]
+
+
+# ---------------------------- Replaying positions ----------------------------
+
+def clearCaches():
+    """
+    Empties every cache of plans and paths so each position is timed from scratch.
+    """
+    attackPlanCache.clear()
+    with steinerGraphLock:
+        steinerGraphCache.clear()
+    with stackPathsLock:
+        stackPathsCache.clear()
+
+
+def moveData(move : Move) -> list:
+    """
+    Converts a move into JSON values, with cards as (type, territory).
+    """
+    (trades, placements), attacks, fortify = move
+    trades = [[(card.type.value, card.territory) for card in trade] for trade in trades]
+    return [[trades, placements], attacks, fortify]
+
+
+def replayPosition(gameState : GameState, timeConstraint : float) -> dict:
+    """
+    Runs the search, the attack planner and the heuristic on a position, recording the result
+    and time of each. The planner is given the territories the search chose to attack, or the
+    three weakest territories next to the agent if it chose not to attack.
+    """
+    clearCaches()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        move = riskAgent(gameState, timeConstraint)
+    searchSeconds = time.perf_counter() - start
+
+    targets = {attack[1] for attack in move[1]}
+    if len(targets) == 0:
+        frontier = gameState.board.frontier(gameState.agentID)
+        targets = set(frontier[np.argsort(gameState.board.troops[frontier], kind="stable")[:3]].tolist())
+    clearCaches()
+    start = time.perf_counter()
+    plan = attackGraphSimple(gameState, targets)
+    planSeconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    value = heuristic(gameState)
+    heuristicSeconds = time.perf_counter() - start
+
+    return {"move": moveData(move), "targets": sorted(targets),
+            "plan": sorted(plan[0].edges()) if plan is not None else None,
+            "heuristic": value, "searchSeconds": searchSeconds, "planSeconds": planSeconds,
+            "heuristicSeconds": heuristicSeconds}
+
+
+def latencies(seconds : list[float]) -> dict:
+    """
+    Summarises timings by their percentiles, mean and maximum, in milliseconds.
+    """
+    milliseconds = np.array(seconds) * 1000
+    summary = {f"p{percentile}": float(np.percentile(milliseconds, percentile)) for percentile in PERCENTILES}
+    summary.update({"mean": float(milliseconds.mean()), "max": float(milliseconds.max())})
+    return summary
+
+
+def replay(corpus : Corpus, timeConstraint : float = 1, out : Optional[str] = None, limit : Optional[int] = None) -> dict:
+    """
+    Replays every position of a corpus, up to limit, writing the record of each position to
+    out as JSON lines, and returns the latency percentiles of each function.
+    """
+    count = len(corpus) if limit is None else min(limit, len(corpus))
+    records = []
+    with open(out, "w") if out is not None else contextlib.nullcontext() as file:
+        for i in range(count):
+            record = {"position": i, **replayPosition(corpus[i], timeConstraint)}
+            records.append(record)
+            if file is not None:
+                file.write(json.dumps(record) + "\n")
+
+    if count == 0:
+        return {"positions": 0}
+    return {"positions": count, **{name: latencies([record[f"{name}Seconds"] for record in records])
+                                   for name in ("search", "plan", "heuristic")}}
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.argument("path")
+@click.option("--positions", "-n", default=200, show_default=True, help="Positions to store.")
+@click.option("--self-play", "selfPlay", is_flag=True, help="Record positions from self-play rather than dealing them.")
+@click.option("--agent", default="randAI", show_default=True, help="Agent playing the self-play games.")
+@click.option("--seed", default=0, show_default=True, help="Seed of the first position.")
+def generate(path, positions, selfPlay, agent, seed):
+    """Writes a corpus of positions to PATH."""
+    states = selfPlayPositions(positions, seed, agent) if selfPlay else dealtPositions(positions, seed)
+    click.echo(f"Wrote {writeCorpus(path, states)} positions to {path}")
+
+
+@main.command("replay")
+@click.argument("path")
+@click.option("--time", "timeConstraint", default=1.0, show_default=True, help="Seconds the search is given per position.")
+@click.option("--limit", type=int, default=None, help="Replay only the first positions.")
+@click.option("--out", "-o", default=None, help="JSON lines file to record the result of every position to.")
+def replayCommand(path, timeConstraint, limit, out):
+    """Replays the corpus at PATH, reporting latency percentiles."""
+    summary = replay(Corpus(path), timeConstraint, out, limit)
+    click.echo(f"Replayed {summary['positions']} positions")
+    for name in ("search", "plan", "heuristic"):
+        if name in summary:
+            stats = summary[name]
+            click.echo(f"{name}: " + ", ".join(f"{key} {value:.3f}ms" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
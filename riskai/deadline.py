@@ -0,0 +1,64 @@
+# Cooperative time limits for the anytime searches. Searches poll a Deadline between
+# units of work rather than being interrupted by a signal, so they can run on any
+# thread and always stop with the game state in a consistent position.
+import time
+import threading
+
+
+class Deadline:
+    """
+    Point in time after which a search should stop and return its best result so far.
+    Uses a monotonic clock so has sub-second resolution, and only reads shared state so
+    one deadline can be polled by many threads at once.
+
+    Attributes:
+        end (float): Monotonic time at which the deadline expires.
+        cancelled (threading.Event): Set to stop any search polling this deadline early.
+    """
+    def __init__(self, seconds : float):
+        self.end = time.monotonic() + seconds
+        self.cancelled = threading.Event()
+
+
+    @classmethod
+    def of(cls, limit) -> "Deadline":
+        """
+        Gets a deadline from either an existing deadline or a time limit in seconds.
+        """
+        if isinstance(limit, Deadline):
+            return limit
+        return cls(limit)
+
+
+    @classmethod
+    def at(cls, end : float) -> "Deadline":
+        """
+        Gets a deadline expiring at a monotonic time. The monotonic clock is shared by all 
+        processes on a machine, so this recreates a deadline inside worker processes. 
+        """
+        deadline = cls(0)
+        deadline.end = end
+        return deadline
+
+
+    def remaining(self) -> float:
+        """
+        Gets the seconds left before the deadline, which is 0 once it has expired.
+        """
+        if self.cancelled.is_set():
+            return 0.0
+        return max(self.end - time.monotonic(), 0.0)
+
+
+    def expired(self) -> bool:
+        """
+        Checks whether the deadline has passed or been cancelled.
+        """
+        return self.cancelled.is_set() or time.monotonic() >= self.end
+
+
+    def cancel(self):
+        """
+        Expires the deadline immediately, can be called from any thread.
+        """
+        self.cancelled.set()
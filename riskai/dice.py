@@ -1,24 +1,448 @@
-import pandas as pd
+import numpy as np
 import os
+import functools
+import random
+import click
+from typing import Optional, Tuple
 
 # Get the directory of the current script
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Construct the path to the diceData folder
-dice_data_dir = os.path.join(current_dir, '..', 'diceData')
+# Construct the path to the DiceData folder
+dice_data_dir = os.path.join(current_dir, '..', 'DiceData')
 
-# Read the CSV files using the constructed paths
-minAttLostDf = pd.read_csv(os.path.join(dice_data_dir, 'MinAttLost.csv'), index_col=0)
-avgAttLostDf = pd.read_csv(os.path.join(dice_data_dir, 'AvgAttLost.csv'), index_col=0)
-perfDiceDf = pd.read_csv(os.path.join(dice_data_dir, 'PerfectDice.csv'))
+# Tables compiled from the CSVs by compileTables, memory mapped when first used
+ATTREMAININGFILE = os.path.join(dice_data_dir, 'AttRemaining.npy')
+PERFECTDICEFILE = os.path.join(dice_data_dir, 'PerfectDice.npy')
 
+# Memoised exact battle odds, loaded if they have been saved with battleChain().save()
+BATTLEODDSFILE = os.path.join(dice_data_dir, 'BattleOdds.npy')
 
-def averageAttLost(attacking : int, defending : int) ->  int:
-    return minAttLostDf.iloc[attacking, defending] 
+
+def compileTables(directory : str = dice_data_dir):
+    """
+    Compiles the dice CSVs into the binary tables read by this module. The minimum, average and 
+    maximum attackers remaining are stacked into one array indexed [table][attacking - 1][defending - 1], 
+    and the perfect dice attackers are kept as an array indexed by defending - 1. 
+    """
+    tables = [np.loadtxt(os.path.join(directory, name), delimiter=',', skiprows=1)[:, 1:]
+              for name in ('MinAttLost.csv', 'AvgAttLost.csv', 'MaxAttLost.csv')]
+    np.save(os.path.join(directory, 'AttRemaining.npy'), np.stack(tables))
+    
+    perfect = np.loadtxt(os.path.join(directory, 'PerfectDice.csv'), delimiter=',', skiprows=1, dtype=np.int32)
+    # Rows must run from 1 defender upwards for the array to be indexed by defenders
+    assert (perfect[:, 0] == np.arange(1, len(perfect) + 1)).all()
+    np.save(os.path.join(directory, 'PerfectDice.npy'), perfect[:, 1])
+    
+    
+@functools.cache
+def attRemainingTables() -> np.ndarray:
+    """
+    The minimum, average and maximum attackers remaining tables of the game's dice, from 1 
+    attacker and 1 defender. 
+    """
+    return np.load(ATTREMAININGFILE, mmap_mode='r')
+
+
+@functools.cache
+def perfectDiceTable() -> np.ndarray:
+    return np.load(PERFECTDICEFILE, mmap_mode='r')
+
+
+def inTables(attacking : int, defending : int) -> bool:
+    """
+    Checks a battle is covered by the attackers remaining tables. 
+    """
+    _, rows, columns = attRemainingTables().shape
+    return 1 <= attacking <= rows and 1 <= defending <= columns
+
+
+# The attack tables are indexed from 1 attacker and 1 defender, and hold attackers remaining
+def minAttLost(attacking : int, defending : int) ->  int:
+    return int(attRemainingTables()[0, attacking - 1, defending - 1])
 
 def averageAttLost(attacking : int, defending : int) ->  float:
-    return avgAttLostDf.iloc[attacking, defending] 
+    return float(attRemainingTables()[1, attacking - 1, defending - 1])
+
+def maxAttLost(attacking : int, defending : int) ->  int:
+    return int(attRemainingTables()[2, attacking - 1, defending - 1])
     
     
 def perfectDice(defending : int) -> int:
-    return perfDiceDf.loc[defending, 'Attackers']
\ No newline at end of file
+    """
+    Attackers needed for a perfect dice attack on defending troops. Defences larger than the 
+    table are extrapolated from the attackers each extra defender needed at its end. 
+    """
+    table = perfectDiceTable()
+    if defending <= len(table):
+        return int(table[defending - 1])
+    slope = int(table[-1] - table[-2])
+    return int(table[-1]) + slope * (defending - len(table))
+
+
+@functools.cache
+def captureLoss(defending : int) -> float:
+    """
+    Expected attackers lost capturing a territory when attacking with perfect dice. The average 
+    table holds attackers remaining, indexed by attackers then defenders, and defences too large 
+    for the table are taken from the exact battle odds instead. 
+    """
+    attacking = perfectDice(defending)
+    if inTables(attacking, defending):
+        return float(attacking - averageAttLost(attacking, defending))
+    
+    return float(attacking - expectedRemaining(attacking, defending)[0])
+
+
+
+def roundOdds(attDice : int, defDice : int) -> list[Tuple[int, int, float]]:
+    """
+    Exact outcomes of a single roll as (attackers lost, defenders lost, probability), found by 
+    enumerating every roll. Highest dice are compared in pairs with ties going to the defender. 
+    """
+    rolls = np.indices((6,) * (attDice + defDice)).reshape(attDice + defDice, -1) + 1
+    att = -np.sort(-rolls[:attDice], axis=0)
+    defn = -np.sort(-rolls[attDice:], axis=0)
+    pairs = min(attDice, defDice)
+    counts = np.bincount((att[:pairs] > defn[:pairs]).sum(axis=0), minlength=pairs + 1).tolist()
+        
+    total = 6 ** (attDice + defDice)
+    return [(pairs - defLost, defLost, counts[defLost] / total) for defLost in range(pairs, -1, -1) if counts[defLost] > 0]
+
+
+# Outcomes of every roll indexed by [attacking dice][defending dice], used when sampling battles
+ROUNDODDS = {(att, defn): roundOdds(att, defn) for att in range(1, 4) for defn in range(1, 3)}
+
+
+
+class BattleChain:
+    """
+    Exact odds of blitz attacks with fair dice, from the Markov chain whose states are the 
+    attackers and defenders remaining. Every roll removes one or two troops in total, so the 
+    states are filled one anti-diagonal of equal total troops at a time, each as a single 
+    vectorised step over the states on it. Odds are memoised for every battle up to the size 
+    of the arrays, which double whenever a larger battle is asked for. As in blitz, attacking 
+    is the troops able to roll, so excludes the troop left behind. 
+
+    Attributes:
+        size (int): Battles with fewer attackers and defenders than this are memoised.
+        winProbs (np.ndarray): Probability the attack captures, indexed [attacking][defending].
+        attRemaining (np.ndarray): Expected attackers remaining, counting 0 for a failed attack.
+        defRemaining (np.ndarray): Expected defenders remaining, counting 0 for a capture.
+    """
+    def __init__(self, size : int = 64):
+        self.size = 0
+        self.resize(size)
+        
+        
+    def resize(self, size : int):
+        """
+        Fills the memo arrays for every battle smaller than size.
+        """
+        winProbs = np.zeros((size, size))
+        attRemaining = np.zeros((size, size))
+        defRemaining = np.zeros((size, size))
+        winProbs[1:, 0] = 1
+        attRemaining[:, 0] = np.arange(size)
+        defRemaining[0, :] = np.arange(size)
+        
+        for total in range(2, 2 * size - 1):
+            attacking = np.arange(max(1, total - size + 1), min(total, size))
+            defending = total - attacking
+            for (attDice, defDice), odds in ROUNDODDS.items():
+                rolling = (np.minimum(attacking, 3) == attDice) & (np.minimum(defending, 2) == defDice)
+                if not rolling.any():
+                    continue
+                att, defn = attacking[rolling], defending[rolling]
+                for attLost, defLost, prob in odds:
+                    winProbs[att, defn] += prob * winProbs[att - attLost, defn - defLost]
+                    attRemaining[att, defn] += prob * attRemaining[att - attLost, defn - defLost]
+                    defRemaining[att, defn] += prob * defRemaining[att - attLost, defn - defLost]
+        
+        self.size = size
+        self.winProbs, self.attRemaining, self.defRemaining = winProbs, attRemaining, defRemaining
+        
+        
+    def cover(self, attacking : int, defending : int):
+        """
+        Grows the memo arrays to cover a battle, at least doubling them each time.
+        """
+        if attacking >= self.size or defending >= self.size:
+            self.resize(max(attacking + 1, defending + 1, 2 * self.size))
+            
+    
+    def winProbability(self, attacking : int, defending : int) -> float:
+        self.cover(attacking, defending)
+        return float(self.winProbs[attacking, defending])
+    
+    
+    def expectedRemaining(self, attacking : int, defending : int) -> Tuple[float, float]:
+        self.cover(attacking, defending)
+        return (float(self.attRemaining[attacking, defending]), float(self.defRemaining[attacking, defending]))
+    
+    
+    def save(self, path : str = BATTLEODDSFILE):
+        """
+        Saves the memo arrays as one array of shape (3, size, size).
+        """
+        np.save(path, np.stack([self.winProbs, self.attRemaining, self.defRemaining]))
+        
+        
+    @classmethod
+    def load(cls, path : str = BATTLEODDSFILE) -> "BattleChain":
+        """
+        Loads saved memo arrays, or fills new ones if there is no file at path. 
+        """
+        if not os.path.exists(path):
+            return cls()
+        chain = cls(0)
+        chain.winProbs, chain.attRemaining, chain.defRemaining = np.load(path)
+        chain.size = len(chain.winProbs)
+        return chain
+    
+
+
+@functools.cache
+def battleChain() -> BattleChain:
+    """
+    The shared battle odds, loaded or filled when first used. 
+    """
+    return BattleChain.load()
+
+
+def winProbability(attacking : int, defending : int) -> float:
+    """
+    Exact probability a blitz attack with fair dice captures the territory. 
+    """
+    return battleChain().winProbability(attacking, defending)
+
+
+def expectedRemaining(attacking : int, defending : int) -> Tuple[float, float]:
+    """
+    Exact expected attackers and defenders remaining after a blitz attack with fair dice. 
+    """
+    return battleChain().expectedRemaining(attacking, defending)
+
+
+@functools.lru_cache(maxsize=4096)
+def remainingDistribution(attacking : int, defending : int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact distributions of the attackers and defenders remaining after a blitz attack with fair 
+    dice. Index 0 of the attackers is the probability the attack fails and index 0 of the 
+    defenders the probability it captures. Found by pushing the probability of the starting 
+    state down the chain one anti-diagonal at a time. The arrays are shared, so are read only. 
+    """
+    mass = np.zeros((attacking + 1, defending + 1))
+    mass[attacking, defending] = 1
+    
+    for total in range(attacking + defending, 1, -1):
+        att = np.arange(max(1, total - defending), min(total, attacking + 1))
+        defn = total - att
+        for (attDice, defDice), odds in ROUNDODDS.items():
+            rolling = (np.minimum(att, 3) == attDice) & (np.minimum(defn, 2) == defDice)
+            if not rolling.any():
+                continue
+            rollAtt, rollDef = att[rolling], defn[rolling]
+            current = mass[rollAtt, rollDef]
+            for attLost, defLost, prob in odds:
+                mass[rollAtt - attLost, rollDef - defLost] += prob * current
+    
+    attacked = mass[:, 0].copy()
+    attacked[0] = mass[0, 1:].sum()
+    defended = mass[0, :].copy()
+    defended[0] = mass[1:, 0].sum()
+    attacked.setflags(write=False)
+    defended.setflags(write=False)
+    return (attacked, defended)
+
+
+@functools.lru_cache(maxsize=256)
+def captureMatrix(defending : int, size : int) -> np.ndarray:
+    """
+    Exact probabilities of capturing against defending troops with each number of attackers 
+    remaining, for every attack of fewer than size attackers, indexed [attacking][remaining]. 
+    Rows sum to the win probability. Filled backwards from the captured states one anti-diagonal 
+    at a time, carrying the distribution over attackers remaining for every state on it. The 
+    array is shared, so is read only. 
+    """
+    # Distributions for every state of attackers and defenders left, indexed [attacking][defending][remaining]
+    remaining = np.zeros((size, defending + 1, size))
+    remaining[np.arange(1, size), 0, np.arange(1, size)] = 1
+    
+    for total in range(2, size + defending):
+        att = np.arange(max(1, total - defending), min(total, size))
+        defn = total - att
+        for (attDice, defDice), odds in ROUNDODDS.items():
+            rolling = (np.minimum(att, 3) == attDice) & (np.minimum(defn, 2) == defDice)
+            if not rolling.any():
+                continue
+            rollAtt, rollDef = att[rolling], defn[rolling]
+            for attLost, defLost, prob in odds:
+                remaining[rollAtt, rollDef] += prob * remaining[rollAtt - attLost, rollDef - defLost]
+    
+    matrix = remaining[:, defending].copy()
+    matrix.setflags(write=False)
+    return matrix
+
+
+def blitz(attacking : int, defending : int, rng : random.Random) -> Tuple[int, int]:
+    """
+    Samples a blitz attack, rolling until either side has no troops left. Attacking is the troops 
+    able to roll, so excludes the troop left behind. Returns the attackers and defenders remaining. 
+    """
+    while attacking > 0 and defending > 0:
+        odds = ROUNDODDS[(min(attacking, 3), min(defending, 2))]
+        roll = rng.random()
+        for attLost, defLost, prob in odds:
+            roll -= prob
+            if roll < 0:
+                break
+        attacking -= attLost
+        defending -= defLost
+    return (attacking, defending)
+
+
+
+def tableBlitz(attacking : int, defending : int, rng : random.Random) -> Tuple[int, int]:
+    """
+    Samples a blitz attack from the dice tables, which hold the minimum, average and maximum 
+    attackers remaining for the dice of the game rather than exact dice. Attackers remaining are 
+    drawn from a triangular distribution over the table's range with its mode placed to match the 
+    average. On a failed attack defenders are reduced at the loss rate of a perfect dice attack. 
+    Battles too large for the tables are rolled with exact dice. 
+    """
+    if not inTables(attacking, defending):
+        return blitz(attacking, defending, rng)
+    
+    low, average, high = attRemainingTables()[:, attacking - 1, defending - 1].tolist()
+    remaining = int(low)
+    if low < high:
+        # Mean of a triangular distribution is the average of its low, high and mode. Averages 
+        # too close to an end for any mode are met by sometimes returning that end instead. 
+        mode = 3 * average - low - high
+        if mode < low and rng.random() < 1 - 3 * (average - low) / (high - low):
+            sample = low
+        elif mode > high and rng.random() < 1 - 3 * (high - average) / (high - low):
+            sample = high
+        else:
+            sample = rng.triangular(low, high, min(max(mode, low), high))
+        # Rounds up with probability of the fractional part so the average is kept
+        remaining = int(sample) + (rng.random() < sample - int(sample))
+        
+    if remaining > 0:
+        return (remaining, 0)
+    
+    killed = int(attacking * defending / (captureLoss(defending) + defending))
+    return (0, max(defending - killed, 1))
+
+
+
+
+# ---------------------------- Batched battles ----------------------------
+# Many blitz attacks rolled at once with exact dice. Every round each unfinished battle draws 
+# one outcome of its roll from the cumulative odds of its dice, indexed [attacking dice][defending dice]. 
+
+def outcomeArrays() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Cumulative probabilities, attackers lost and defenders lost of the outcomes of every roll, 
+    each indexed [attacking dice][defending dice][outcome]. 
+    """
+    cumulative = np.ones((4, 3, 3))
+    attLosses = np.zeros((4, 3, 3), dtype=np.int64)
+    defLosses = np.zeros((4, 3, 3), dtype=np.int64)
+    for (attDice, defDice), odds in ROUNDODDS.items():
+        for i, (attLost, defLost, prob) in enumerate(odds):
+            attLosses[attDice, defDice, i], defLosses[attDice, defDice, i] = attLost, defLost
+        cumulative[attDice, defDice, :len(odds)] = np.cumsum([prob for _, _, prob in odds])
+        cumulative[attDice, defDice, len(odds) - 1] = 1
+    return (cumulative, attLosses, defLosses)
+
+
+CUMULATIVEODDS, ATTLOSSES, DEFLOSSES = outcomeArrays()
+
+
+def blitzBatch(attacking : np.ndarray, defending : np.ndarray, rng : np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rolls a blitz attack for every pair of attackers and defenders at once, returning new arrays 
+    of the attackers and defenders remaining. As in blitz, attacking excludes the troop left behind. 
+    """
+    attacking = np.array(attacking, dtype=np.int64)
+    defending = np.array(defending, dtype=np.int64)
+    active = np.flatnonzero((attacking > 0) & (defending > 0))
+    
+    while len(active) > 0:
+        att, defn = attacking[active], defending[active]
+        attDice, defDice = np.minimum(att, 3), np.minimum(defn, 2)
+        # Index of the first outcome whose cumulative probability passes the roll
+        roll = rng.random(len(active))
+        outcome = (roll[:, None] >= CUMULATIVEODDS[attDice, defDice]).sum(axis=1)
+        attacking[active] = att - ATTLOSSES[attDice, defDice, outcome]
+        defending[active] = defn - DEFLOSSES[attDice, defDice, outcome]
+        active = active[(attacking[active] > 0) & (defending[active] > 0)]
+        
+    return (attacking, defending)
+
+
+def simulateBattles(attacking : int, defending : int, n : int, rng : Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rolls n blitz attacks with exact dice, returning histograms of the attackers lost and the 
+    defenders lost, indexed by troops lost. An attack captures when every defender is lost. 
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    attRemaining, defRemaining = blitzBatch(np.full(n, attacking), np.full(n, defending), rng)
+    return (np.bincount(attacking - attRemaining, minlength=attacking + 1), 
+            np.bincount(defending - defRemaining, minlength=defending + 1))
+
+
+def simulateAttack(troops : np.ndarray, attack : list[Tuple[int, int, int, int]], n : int, 
+                   rng : Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rolls n times through the attacks of a move, in order, from the troops on every territory 
+    such as GameState.board.troops. Captures move troops as GameState.apply does, so chains of 
+    attacks along the paths made by simpleAI.graphToAttack carry their losses forward. Returns 
+    whether each roll captured every target, and the troops on every territory after each roll. 
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    troops = np.tile(np.asarray(troops, dtype=np.int64), (n, 1))
+    captured = np.ones(n, dtype=bool)
+    
+    for fromTerr, toTerr, _, moved in attack:
+        # Rolls which already failed, or have nothing to attack with, stop attacking
+        rolling = np.flatnonzero(captured & (troops[:, fromTerr] > 1))
+        captured[:] = False
+        attRemaining, defRemaining = blitzBatch(troops[rolling, fromTerr] - 1, troops[rolling, toTerr], rng)
+        
+        won = defRemaining == 0
+        moving = np.minimum(max(moved, 1), attRemaining)
+        troops[rolling, fromTerr] = 1 + attRemaining - np.where(won, moving, 0)
+        troops[rolling, toTerr] = np.where(won, moving, defRemaining)
+        captured[rolling[won]] = True
+        
+    return (captured, troops)
+
+
+def attackSuccess(troops : np.ndarray, attack : list[Tuple[int, int, int, int]], n : int = 1000, 
+                  rng : Optional[np.random.Generator] = None) -> float:
+    """
+    Estimates the probability that every attack of a move captures its target. 
+    """
+    if len(attack) == 0:
+        return 1.0
+    return float(simulateAttack(troops, attack, n, rng)[0].mean())
+
+
+@click.command()
+@click.option("--battle-odds", type=int, default=0, help="Also save the exact odds of every battle smaller than this.")
+def main(battle_odds):
+    """
+    Regenerates the binary dice tables from the CSVs in DiceData.
+    """
+    compileTables()
+    click.echo(f"Compiled dice tables in {os.path.abspath(dice_data_dir)}")
+    if battle_odds > 0:
+        BattleChain(battle_odds).save()
+        click.echo(f"Saved odds of battles up to {battle_odds - 1} troops to {BATTLEODDSFILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -29,7 +29,7 @@ def drawBoard(gameState : GameState):
     
     
     
-    troopLabels = {node: data['troops'] for node, data in Classic.nodes(data=True)}
+    troopLabels = {node: data['troops'] for node, data in gameState.map.graph.nodes(data=True)}
     
     # Makes background image the background of the plot
     ax.imshow(backgroundIm, extent=[0, backgroundIm.shape[1], 0, backgroundIm.shape[0]])
@@ -119,7 +119,7 @@ def drawPath(gameState : GameState, arbGraph : nx.Graph, stack : int):
     # Gets filtered pos dict
     filtPos = {key: newClassicPosCoords[key] for key in arbGraph.nodes if key in newClassicPosCoords}
     
-    troopLabelsFull = {node: data['troops'] for node, data in Classic.nodes(data=True)}
+    troopLabelsFull = {node: data['troops'] for node, data in gameState.map.graph.nodes(data=True)}
     nx.draw(gameState.map.graph, pos = newClassicPosCoords, labels = troopLabelsFull, with_labels=True, font_weight="bold", node_color='grey')
     nx.draw_networkx(arbGraph, filtPos, labels = troopLabels, with_labels=True, font_weight="bold", node_size = 300, node_color=nodeColours, arrowstyle="->", arrowsize=10, width=2, edge_color = 'r')
 
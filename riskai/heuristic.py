@@ -1,5 +1,7 @@
 from .structures import *
 import statistics
+import numpy as np
+from maps.mapIndex import fromMask
 import math
 
 
@@ -19,17 +21,27 @@ OPPNORMALISE = 10
 
 
     
+def internalMask(player : int, gameState : GameState) -> int:
+    """
+    Bitboard version of findInternalTerritories, giving the mask of owned territories 
+    which are not adjacent to any territory held by another player.
+    """
+    index = gameState.map.index
+    ownedMask = gameState.playerDict[player]["territoryMask"]
+    return ownedMask & ~index.neighbourMaskOf(index.allMask & ~ownedMask)
+
+    
 def findInternalTerritories(player : int, gameState : GameState) -> Territories:
     """
     For a given player, finds all territories which have no external borders.
     """
-    internalTerr = []
-    # Iterate through player nodes and check their neighbours
-    for node in gameState.playerDict[player]["territories"]:
-        # Internal territories have all neighbours owned by the player
-        if all(neighbour in gameState.playerDict[player]["territories"] for neighbour in gameState.map.graph.neighbors(node)):
-            internalTerr.append(node)
-    return internalTerr
+    if gameState.bitboard:
+        return fromMask(internalMask(player, gameState))
+    
+    board = gameState.board
+    # Internal territories are owned by the player and have no neighbours owned by anyone else
+    internalTerrMask = (board.owner == player) & (board.foreignNeighbours() == 0)
+    return set(np.flatnonzero(internalTerrMask).tolist())
 
 
 
@@ -40,6 +52,11 @@ def findBorders(player : int, gameState : GameState) -> Territories:
     of bonuses. Typical play has player's using borders directly on top of bonuses, or a single tile over so 
     this is a useful metric. 
     """
+    if gameState.bitboard:
+        # Owned bonus borders which have any neighbour not owned by the player
+        ownedMask = gameState.playerDict[player]["territoryMask"]
+        return fromMask(gameState.map.index.borderMask & ownedMask & ~internalMask(player, gameState))
+    
     # Gets all classified borders owned by player
     ownedBorders = gameState.map.borderTerr & gameState.playerDict[player]["territories"]
     internalTerr = findInternalTerritories(player, gameState)
@@ -118,7 +135,7 @@ def heuristic(gameState : GameState) -> int:
     for card in gameState.cards:
         eval += card.type.value * CARDWEIGHT
         
-    for bonus in gameState.playerDict[gameState.agentID]["bonusHeld"]:
+    for bonus in gameState.playerDict[gameState.agentID]["bonusesHeld"]:
         eval += gameState.map.bonuses[bonus]["bonusVal"] * BONUSWEIGHT
     
     # Temp value for opponent evaluation
@@ -130,7 +147,7 @@ def heuristic(gameState : GameState) -> int:
       # Ensure only alive opponents are considered, filters out agent
       if opponent != gameState.agentID:
         # Add their bonuses to quick calculation
-        for bonus in gameState.playerDict[opponent]["bonusHeld"]:
+        for bonus in gameState.playerDict[opponent]["bonusesHeld"]:
           oppEval += gameState.map.bonuses[bonus]["bonusVal"] * BONUSWEIGHT
         
         # Add their previous income
@@ -157,3 +174,210 @@ def heuristic(gameState : GameState) -> int:
     
     
     return eval
+
+
+
+
+def heuristicBatch(gameState : GameState, owners : np.ndarray, troops : np.ndarray) -> np.ndarray:
+    """
+    Vectorised heuristic over a batch of candidate boards, giving the same value as heuristic() 
+    would for each. owners and troops are (N, territories + 1) arrays of post-move boards, such as 
+    rows of Board.owner and Board.troops. Data which is not on the board (cards, previous income, 
+    opponent card counts) is taken from gameState. 
+    """
+    board = gameState.board
+    agentID = gameState.agentID
+    numStates = owners.shape[0]
+    numPlayers = max(gameState.playerDict) + 1
+    numTerrs = len(board.nodes)
+    stateIdx = np.arange(numStates)[:, None]
+    
+    # Territory and troop totals per player for every state. Dummy index 0 is owned 
+    # by -1 and has no troops, so it is shifted out of the player columns. 
+    flatOwners = (stateIdx * (numPlayers + 1) + owners + 1).ravel()
+    terrCounts = np.bincount(flatOwners, minlength=numStates * (numPlayers + 1)).reshape(numStates, -1)[:, 1:]
+    troopTotals = np.bincount(flatOwners, weights=troops.ravel(), minlength=numStates * (numPlayers + 1)).reshape(numStates, -1)[:, 1:]
+    
+    alive = terrCounts > 0
+    numAlive = alive.sum(axis=1)
+    
+    # Agent should strongly bias towards removing players
+    eval = -numAlive * PLAYERWEIGHT
+    
+    # Troop average and median over alive players, dead players are masked out with NaN
+    aliveTroops = np.where(alive, troopTotals, np.nan)
+    avgTroops = np.nanmean(aliveTroops, axis=1)
+    medianTroops = np.nanmedian(aliveTroops, axis=1)
+    agentTroops = troopTotals[:, agentID]
+    eval = eval + (avgTroops - agentTroops) * TROOPWEIGHT
+    eval = eval + (medianTroops - agentTroops) * TROOPWEIGHT
+    
+    # A territory is internal if no neighbour has a different owner. Edges with a different 
+    # owner at each end are reduced over the CSR rows of their source territory, masking 
+    # out territories without edges, such as the dummy, which reduceat gives a neighbour's value. 
+    foreign = owners[:, board.rows] != owners[:, board.indices]
+    hasForeign = (np.add.reduceat(foreign, board.indptr[:-1], axis=1) > 0) & (np.diff(board.indptr) > 0)
+    
+    borderArr = np.zeros(len(board.owner), dtype=bool)
+    borderArr[list(gameState.map.borderTerr)] = True
+    agentOwned = owners == agentID
+    numBorders = (agentOwned & borderArr & hasForeign).sum(axis=1)
+    
+    # Fewer defence choke points is preferred, owning territories is preferred
+    eval = eval - numBorders * DEFENCEWEIGHT
+    eval = eval + terrCounts[:, agentID] * TERRITORYWEIGHT
+    
+    eval = eval + sum(card.type.value for card in gameState.cards) * CARDWEIGHT
+    
+    # Bonus values held by every player. A bonus is held if all its territories 
+    # have the same owner as its first territory. 
+    bonusVals = np.zeros((numStates, numPlayers), dtype=np.int64)
+    for bonus, vals in gameState.map.bonuses.items():
+        bonusOwners = owners[:, sorted(vals["territories"])]
+        held = (bonusOwners == bonusOwners[:, :1]).all(axis=1)
+        bonusVals[held, bonusOwners[held, 0]] += vals["bonusVal"]
+    eval = eval + bonusVals[:, agentID] * BONUSWEIGHT
+    
+    # Opponent evaluation as in heuristic(), normalised per opponent before subtracting
+    prevIncome = np.array([gameState.playerDict[p]["prevIncome"] if p in gameState.playerDict else 0 for p in range(numPlayers)])
+    cardsNum = np.array([gameState.playerDict[p]["cardsNum"] if p in gameState.playerDict else 0 for p in range(numPlayers)])
+    
+    terrPerc = terrCounts / numTerrs
+    troopScale = 0.35 * np.arctan(10*terrPerc - 3.5) + 0.5
+    oppEval = (bonusVals * BONUSWEIGHT + prevIncome * INCOMEWEIGHT + cardsNum * 8 * CARDWEIGHT 
+               + np.floor(troopScale * DANGERWEIGHT).astype(np.int64))
+    
+    isOpponent = alive.copy()
+    isOpponent[:, agentID] = False
+    eval = eval - np.where(isOpponent, oppEval // OPPNORMALISE, 0).sum(axis=1)
+    
+    return eval
+
+
+
+
+class IncrementalHeuristic:
+    """
+    Evaluates heuristic() for a game state while only doing work proportional to the size of each 
+    move. Per player partial sums are kept and updated from the territories a move changed, as 
+    returned by GameState.apply(). Call update after every apply or undo on the tracked state. 
+
+    Attributes:
+        gameState (GameState): The state being tracked.
+        owner (list[int]): Owner of every territory when last updated.
+        troops (list[int]): Troops on every territory when last updated.
+        terrCounts (dict): Territories held by each player.
+        troopTotals (dict): Troops held by each player.
+        bonusHolder (dict): The player holding each bonus, or None.
+        agentBorders (set[int]): Agent territories counted by findBorders.
+    """
+    def __init__(self, gameState : GameState):
+        self.gameState = gameState
+        board = gameState.board
+        self.neighbours = [board.neighbours(terr).tolist() for terr in range(len(board.owner))]
+        self.bonusOf = gameState.map.index.bonusOf
+        self.borderTerr = gameState.map.borderTerr
+        self.owner = board.owner.tolist()
+        self.troops = board.troops.tolist()
+        
+        self.terrCounts = {player: 0 for player in gameState.playerDict}
+        self.troopTotals = {player: 0 for player in gameState.playerDict}
+        for terr in board.nodes.tolist():
+            self.terrCounts[self.owner[terr]] += 1
+            self.troopTotals[self.owner[terr]] += self.troops[terr]
+            
+        self.bonusHolder = {bonus: self.findHolder(bonus) for bonus in gameState.map.bonuses}
+        self.agentBorders = {terr for terr in board.nodes.tolist() if self.isAgentBorder(terr)}
+        
+        
+    def findHolder(self, bonus : str) -> Optional[int]:
+        """
+        Gets the player holding all territories of a bonus, or None.
+        """
+        owners = {self.owner[terr] for terr in self.gameState.map.bonuses[bonus]["territories"]}
+        return owners.pop() if len(owners) == 1 else None
+    
+    
+    def isAgentBorder(self, terr : int) -> bool:
+        """
+        Checks whether a territory is an agent owned bonus border with an enemy neighbour. 
+        """
+        owner = self.owner[terr]
+        return (owner == self.gameState.agentID and terr in self.borderTerr 
+                and any(self.owner[neighbour] != owner for neighbour in self.neighbours[terr]))
+    
+    
+    def update(self, changed : list[int]):
+        """
+        Updates the partial sums from the territories whose owner or troops changed on the board. 
+        """
+        board = self.gameState.board
+        bonuses = set()
+        affected = set()
+        
+        for terr in set(changed):
+            prevOwner, prevTroops = self.owner[terr], self.troops[terr]
+            newOwner, newTroops = int(board.owner[terr]), int(board.troops[terr])
+            
+            self.troopTotals[prevOwner] -= prevTroops
+            self.troopTotals[newOwner] += newTroops
+            self.troops[terr] = newTroops
+            
+            if prevOwner != newOwner:
+                self.terrCounts[prevOwner] -= 1
+                self.terrCounts[newOwner] += 1
+                self.owner[terr] = newOwner
+                
+                # Ownership changes can only affect the bonus of the territory, and the 
+                # border status of the territory and its neighbours
+                bonuses.add(self.bonusOf[terr])
+                affected.add(terr)
+                affected.update(self.neighbours[terr])
+                
+        for bonus in bonuses:
+            self.bonusHolder[bonus] = self.findHolder(bonus)
+            
+        for terr in affected:
+            if self.isAgentBorder(terr):
+                self.agentBorders.add(terr)
+            else:
+                self.agentBorders.discard(terr)
+                
+                
+    def value(self) -> float:
+        """
+        Gets the heuristic value of the tracked state from the partial sums. 
+        """
+        gameState = self.gameState
+        agentID = gameState.agentID
+        alive = [player for player, count in self.terrCounts.items() if count > 0]
+        
+        eval = -len(alive) * PLAYERWEIGHT
+        
+        troopList = [self.troopTotals[player] for player in alive]
+        eval += (sum(troopList) / len(alive) - self.troopTotals[agentID]) * TROOPWEIGHT
+        eval += (statistics.median(troopList) - self.troopTotals[agentID]) * TROOPWEIGHT
+        
+        eval -= len(self.agentBorders) * DEFENCEWEIGHT
+        eval += self.terrCounts[agentID] * TERRITORYWEIGHT
+        
+        for card in gameState.cards:
+            eval += card.type.value * CARDWEIGHT
+            
+        bonusVals = {player: 0 for player in self.terrCounts}
+        for bonus, holder in self.bonusHolder.items():
+            if holder is not None:
+                bonusVals[holder] += gameState.map.bonuses[bonus]["bonusVal"]
+        eval += bonusVals[agentID] * BONUSWEIGHT
+        
+        numTerrs = len(self.owner) - 1
+        for opponent in alive:
+            if opponent != agentID:
+                oppEval = bonusVals[opponent] * BONUSWEIGHT
+                oppEval += gameState.playerDict[opponent]["prevIncome"] * INCOMEWEIGHT
+                oppEval += gameState.playerDict[opponent]["cardsNum"] * 8 * CARDWEIGHT
+                troopScale = 0.35 * math.atan(10*(self.terrCounts[opponent] / numTerrs) - 3.5) + 0.5
+                oppEval += int(troopScale * DANGERWEIGHT)
+                eval -= (oppEval // OPPNORMALISE)
+                
+        return eval
@@ -145,8 +145,9 @@ def setupGameState() -> GameState:
     
     # Initialises all player bonuses correctly
     for bonus, vals in map.bonuses.items():
-        if vals["territories"].issubset(playerDict[currPlayer]["territories"]):
-            playerDict[currPlayer]["bonusesHeld"].add(bonus)
+        for player in playerDict:
+            if vals["territories"].issubset(playerDict[player]["territories"]):
+                playerDict[player]["bonusesHeld"].add(bonus)
 
         
     
@@ -339,22 +340,10 @@ def getAttackOpp(player : int, gameState : GameState) -> Tuple[bool, Optional[in
             else:
                 troopsMoved = click.prompt(f"Enter the number of troops moved to the attacked territory", type=click.IntRange(min=3, max=gameState.map.graph.nodes[territoryIDAtt]["troops"]-1))
             
-            # Reassigns territory, adds opponents new troops to territory, updates old territory troops
-            gameState.map.graph.nodes[territoryIDDef]["player"] = player
-            gameState.map.graph.nodes[territoryIDDef]["troops"] = troopsMoved
+            # Reassigns territory with opponents new troops, updating territories and bonuses 
+            # of attacking and attacked players, then updates old territory troops
+            gameState.captureTerritory(territoryIDDef, player, troopsMoved)
             gameState.map.graph.nodes[territoryIDAtt]["troops"] -= troopsMoved
-            
-            # Updates territory counts for attacking and attacked players
-            gameState.playerDict[player]["territories"].add(territoryIDDef)
-            gameState.playerDict[attackedPlayer]["territories"].remove(territoryIDDef)
-            
-            # Updates bonuses
-            bonus = gameState.map.graph.nodes[territoryIDDef]["bonus"]
-            # Attacked player must have lost bonus
-            gameState.playerDict[attackedPlayer]["bonusesHeld"].discard(bonus)
-            # Check if attacking player now controls all of bonus
-            if gameState.map.bonuses[bonus]["territories"].issubset(gameState.playerDict[player]["territories"]):
-                gameState.playerDict[player]["bonusesHeld"].add(bonus)
                 
             
             # If all of an opponents territories are taken, they are eliminated, 
@@ -494,9 +483,9 @@ def instructTrade(trades : list[Trade], gameState : GameState) :
             
             # Updates card count
             gameState.playerDict[gameState.agentID]["cardsNum"] -= 3
-            gameState.cards.remove(trade[0])
-            gameState.cards.remove(trade[1])
-            gameState.cards.remove(trade[2])
+            gameState.removeCard(trade[0])
+            gameState.removeCard(trade[1])
+            gameState.removeCard(trade[2])
 
         
     
@@ -565,23 +554,11 @@ def instructAttack(attacks : Attack, gameState : GameState) -> Tuple[bool, Optio
                 click.echo(f"Move {troopsMoved} troops to the attacked territory.")   
                 
                          
-            # Reassigns territory, adds opponents new troops to territory, updates old territory troops
-            gameState.map.graph.nodes[territoryIDDef]["player"] = gameState.agentID
-            gameState.map.graph.nodes[territoryIDDef]["troops"] = troopsMoved
+            # Reassigns territory with agents new troops, updating territories and bonuses 
+            # of attacking and attacked players, then updates old territory troops
+            gameState.captureTerritory(territoryIDDef, gameState.agentID, troopsMoved)
             gameState.map.graph.nodes[territoryIDAtt]["troops"] -= troopsMoved
             
-            # Updates territory counts for attacking and attacked players
-            gameState.playerDict[gameState.agentID]["territories"].add(territoryIDDef)
-            gameState.playerDict[attackedPlayer]["territories"].remove(territoryIDDef)
-            
-            # Updates bonuses
-            bonus = gameState.map.graph.nodes[territoryIDDef]["bonus"]
-            # Attacked player must have lost bonus
-            gameState.playerDict[attackedPlayer]['bonusesHeld'].discard(bonus)
-            # Check if attacking player now controls all of bonus
-            if gameState.map.bonuses[bonus]["territories"].issubset(gameState.playerDict[gameState.agentID]["territories"]):
-                gameState.playerDict[gameState.agentID]["bonusesHeld"].add(bonus)
-            
             # If all of an opponents territories are taken, they are eliminated, 
             # and their cards are given to the attacker.
             if len(gameState.playerDict[attackedPlayer]["territories"]) == 0:
@@ -655,7 +632,7 @@ def executeAgentTurn(move: Move, gameState: GameState) -> bool:
         # Must manually enter cards gotten
         for _ in range(gameState.playerDict[killedPlayer]["cardsNum"]):
             newCard = getCard(gameState)
-            gameState.cards.append(newCard)
+            gameState.addCard(newCard)
             
         gameState.playersAlive.remove(killedPlayer)
         
@@ -679,7 +656,7 @@ def executeAgentTurn(move: Move, gameState: GameState) -> bool:
     
     if captureFlag:
         card = getCard(gameState)
-        gameState.cards.append(card)
+        gameState.addCard(card)
     
     return False
 
@@ -0,0 +1,327 @@
+from .structures import *
+from .actions import *
+from .riskAi import generateActionDict, validateActionSet, calculateActionSeq, evalAction, actionTargets
+from .heuristic import IncrementalHeuristic
+from .dice import blitz, tableBlitz
+from .deadline import Deadline
+from . import riskAi
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Dict
+import functools
+import random
+import math
+import click
+
+
+# Exploration constant of UCT, scaled by the spread of values seen
+EXPLORATION = 0.7
+
+# Least rollouts a node needs before its average can be chosen as the move
+MINVISITS = 4
+
+# Fraction of the rollouts of the previous tree kept as a prior for the same actions next turn
+REUSEDECAY = 0.5
+
+# Actions which can be combined into larger plans, matching the sequences of ids
+COMBINABLE = (ActionType.KILLPLAYER, ActionType.TAKEBONUS, ActionType.BREAKBONUS, ActionType.EXPANDBORDERS)
+
+
+class Node:
+    """
+    A set of abstract actions in the search tree. Children hold one more action than their
+    parent, so moving down the tree builds a larger plan. The move of a node is planned once
+    when the node is created, while its value is the average heuristic over rollouts where
+    the dice of its attacks are sampled.
+
+    Attributes:
+        actions (frozenset): The actions planned at this node.
+        parent (Node): The node this extends, None for the root.
+        move (Move): The planned move, None for the root.
+        untried (list[Action]): Actions not yet tried as children, least valuable first.
+        children (list[Node]): Expanded children.
+        visits (float): Rollouts through this node, including any reused from the previous turn.
+        total (float): Sum of the rollout values through this node.
+    """
+    def __init__(self, actions : frozenset, parent : Optional["Node"], move : Optional[Move], untried : list[Action]):
+        self.actions = actions
+        self.parent = parent
+        self.move = move
+        self.untried = untried
+        self.children = []
+        self.visits = 0.0
+        self.total = 0.0
+
+
+    def mean(self) -> float:
+        return self.total / self.visits if self.visits > 0 else float('-inf')
+
+
+class MCTS:
+    """
+    Monte Carlo tree search over abstract actions. Each node plans its move with the same
+    attack graphs as ids, but is valued by rolling its attacks out with sampled dice and
+    evaluating the resulting board, so plans that are likely to fail are valued as such.
+
+    Attributes:
+        gameState (GameState): The root state. Rollouts apply and undo moves on it.
+        rng (random.Random): Generator for dice and tie breaks.
+        battle (Callable): Resolves each attack, from the dice tables or exact dice.
+        root (Node): Root of the tree, holding no actions.
+        priors (dict): Rollout statistics kept from the previous tree, keyed by action set.
+        low (float): Lowest rollout value seen, used to scale exploration.
+        high (float): Highest rollout value seen.
+    """
+    def __init__(self, gameState : GameState, seed : Optional[int] = None, exactDice : bool = False, priors : Optional[dict] = None):
+        self.gameState = gameState
+        self.rng = random.Random(seed)
+        self.battle = functools.partial(blitz if exactDice else tableBlitz, rng=self.rng)
+        self.priors = priors or {}
+        self.low, self.high = float('inf'), float('-inf')
+
+        actionDict = generateActionDict(gameState.agentID, gameState)
+        self.targets = actionTargets(gameState, set().union(*actionDict.values()))
+        # Children are popped from the end, so the most valuable are tried first
+        ordered = sorted(self.targets, key=evalAction)
+        self.combinable = [action for action in ordered if action.action in COMBINABLE]
+
+        self.root = Node(frozenset(), None, None, ordered)
+        self.heuristic = IncrementalHeuristic(gameState)
+
+
+    def rebind(self, gameState : GameState):
+        """
+        Continues the tree on another game state object holding the same position, such as the
+        state passed on a later call. Rollouts apply moves to the new state, so the incremental
+        heuristic is rebuilt from it rather than kept tracking the old one. The targets and
+        planned moves only depend on the position, so they still hold.
+        """
+        self.gameState = gameState
+        self.heuristic = IncrementalHeuristic(gameState)
+
+
+    def search(self, deadline : Deadline, maxRollouts : Optional[int] = None):
+        """
+        Runs rollouts until the deadline expires or maxRollouts have been made. Each rollout
+        selects down the tree, expands one new child and samples the outcome of its move.
+        """
+        rollouts = 0
+        while not deadline.expired() and (maxRollouts is None or rollouts < maxRollouts):
+            node = self.select(self.root)
+            child = self.expand(node)
+            if child is None:
+                # Nothing left to try below a fully expanded leaf, so it is rolled out again
+                if node is self.root:
+                    return
+                child = node
+            self.backpropagate(child, self.rollout(child))
+            rollouts += 1
+
+
+    def select(self, node : Node) -> Node:
+        """
+        Descends by UCT through fully expanded nodes.
+        """
+        while not node.untried and node.children:
+            spread = max(self.high - self.low, 1.0)
+            logVisits = math.log(max(node.visits, 1.0))
+            node = max(node.children, key=lambda child: child.mean() +
+                       EXPLORATION * spread * math.sqrt(logVisits / max(child.visits, 1e-9)))
+        return node
+
+
+    def expand(self, node : Node) -> Optional[Node]:
+        """
+        Plans the next untried action of node as a child. Actions which conflict with the
+        node or cannot be planned are discarded. Returns None if nothing could be expanded.
+        """
+        while node.untried:
+            action = node.untried.pop()
+            actions = node.actions | {action}
+            if not validateActionSet(actions):
+                continue
+
+            result = calculateActionSeq(self.gameState, actions, len(actions))
+            if result is None:
+                continue
+            move, sumTroops, _ = result
+            # Same viability cut as ids, not attacking is always viable
+            if action.action != ActionType.NOATTACK and sumTroops * 2 > self.gameState.playerDict[self.gameState.agentID]["troops"]:
+                continue
+
+            # Only plans of combinable actions are extended further
+            untried = []
+            if all(act.action in COMBINABLE for act in actions):
+                untried = [act for act in self.combinable if act not in actions]
+            child = Node(frozenset(actions), node, move, untried)
+
+            # Statistics of the same plan last turn are carried over at a discount
+            if child.actions in self.priors:
+                visits, total = self.priors[child.actions]
+                child.visits, child.total = visits * REUSEDECAY, total * REUSEDECAY
+
+            node.children.append(child)
+            return child
+        return None
+
+
+    def rollout(self, node : Node) -> float:
+        """
+        Plays the move of node with sampled dice and evaluates the board, leaving the root
+        state as it was.
+        """
+        changed = self.gameState.apply(node.move, self.battle)
+        self.heuristic.update(changed)
+        value = self.heuristic.value()
+        self.gameState.undo()
+        self.heuristic.update(changed)
+
+        self.low, self.high = min(self.low, value), max(self.high, value)
+        return value
+
+
+    def backpropagate(self, node : Node, value : float):
+        while node is not None:
+            node.visits += 1
+            node.total += value
+            node = node.parent
+
+
+    def statistics(self) -> Dict[frozenset, Tuple[float, float, Move]]:
+        """
+        Gets the visits, value total and move of every node below the root, keyed by action set.
+        """
+        stats = {}
+        stack = list(self.root.children)
+        while stack:
+            node = stack.pop()
+            stats[node.actions] = (node.visits, node.total, node.move)
+            stack.extend(node.children)
+        return stats
+
+
+def bestPlan(stats : Dict[frozenset, Tuple[float, float, Move]]) -> Tuple[Move, float]:
+    """
+    Chooses the plan with the highest average value among those rolled out enough times,
+    falling back to the most rolled out plan.
+    """
+    if len(stats) == 0:
+        return (None, float('-inf'))
+
+    trusted = [(total / visits, move) for visits, total, move in stats.values() if visits >= MINVISITS]
+    if trusted:
+        value, move = max(trusted, key=lambda plan: plan[0])
+        return (move, value)
+
+    visits, total, move = max(stats.values(), key=lambda plan: plan[0])
+    return (move, total / visits)
+
+
+# ---------------------------- Root parallel search ----------------------------
+# Each worker grows its own tree from the root state with a different seed, then the
+# statistics of matching plans are summed. Reuses the worker setup of parallel ids.
+
+def searchWorker(search : int, compactState : tuple, end : float, seed : int, exactDice : bool, priors : dict) -> dict:
+    """
+    Grows a tree in a worker process until the shared deadline.
+    """
+    tree = MCTS(riskAi.rootState(search, compactState), seed, exactDice, priors)
+    tree.search(Deadline.at(end))
+    return tree.statistics()
+
+
+def mergeStatistics(results : list[dict]) -> dict:
+    """
+    Sums the statistics of the same plans from several trees.
+    """
+    merged = {}
+    for stats in results:
+        for actions, (visits, total, move) in stats.items():
+            if actions in merged:
+                prevVisits, prevTotal, move = merged[actions]
+                visits, total = visits + prevVisits, total + prevTotal
+            merged[actions] = (visits, total, move)
+    return merged
+
+
+class MCTSAgent:
+    """
+    Agent choosing moves with Monte Carlo tree search. The tree is kept between calls, so
+    searching exactly the same position again continues it. Any other position, such as the
+    agent's next turn, starts a new tree, with only the statistics of plans which can still
+    be made carried over as a discounted prior.
+
+    Attributes:
+        seed (int): Seed of the first tree, incremented for every tree after.
+        exactDice (bool): Whether rollouts roll exact dice rather than sampling the dice tables.
+        workers (int): Processes to grow trees in, 0 to search in this process.
+        pool (ProcessPoolExecutor): The worker processes, started on the first parallel search and kept after.
+        tree (MCTS): The tree of the last search.
+        rootKey (tuple): Exact key of the position the tree was grown from.
+        priors (dict): Statistics of the last search, keyed by action set.
+    """
+    def __init__(self, seed : Optional[int] = None, exactDice : bool = False, workers : int = 0):
+        self.seed = seed
+        self.exactDice = exactDice
+        self.workers = workers
+        self.pool = None
+        self.tree = None
+        self.rootKey = None
+        self.priors = {}
+
+
+    def nextSeed(self) -> Optional[int]:
+        if self.seed is None:
+            return None
+        self.seed += 1
+        return self.seed
+
+
+    def search(self, gameState : GameState, timeConstraint : float | Deadline) -> Tuple[Move, float]:
+        """
+        Searches until the deadline, returning the best move found and its average value.
+        """
+        deadline = Deadline.of(timeConstraint)
+
+        if self.workers > 0:
+            stats = self.parallelSearch(gameState, deadline)
+        else:
+            # Same position as last time, so the tree is still valid and grown further
+            if self.tree is None or self.rootKey != gameState.positionKey:
+                self.tree = MCTS(gameState, self.nextSeed(), self.exactDice, self.priors)
+                self.rootKey = gameState.positionKey
+            elif self.tree.gameState is not gameState:
+                self.tree.rebind(gameState)
+            self.tree.search(deadline)
+            stats = self.tree.statistics()
+
+        self.priors = {actions: (visits, total) for actions, (visits, total, _) in stats.items()}
+        return bestPlan(stats)
+
+
+    def parallelSearch(self, gameState : GameState, deadline : Deadline) -> dict:
+        """
+        Grows one tree per worker process and merges their statistics.
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers)
+        search, compactState = next(riskAi.searchCounter), gameState.compact()
+        futures = [self.pool.submit(searchWorker, search, compactState, deadline.end, self.nextSeed(), self.exactDice, self.priors)
+                   for _ in range(self.workers)]
+        try:
+            # Workers stop at the deadline themselves, the margin covers sending results back
+            done, _ = wait(futures, timeout=deadline.remaining() + 1)
+            return mergeStatistics([future.result() for future in done])
+        finally:
+            riskAi.stopWorkers(futures)
+
+
+    def __call__(self, gameState : GameState, timeConstraint : float | Deadline) -> Move:
+        move, _ = self.search(gameState, timeConstraint)
+        if move is None:
+            click.echo("Tree search found no viable plan, not attacking")
+            move = calculateActionSeq(gameState, frozenset({NoAttack(None)}), 0)[0]
+        return move
+
+
+# Agent used by the command line, keeping its tree between turns
+mctsAgent = MCTSAgent()
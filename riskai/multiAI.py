@@ -1,109 +1,83 @@
 from .structures import *
 from .actions import *
-from .drawInterface import drawArborescence, drawPath
-from .simpleAI import stackSelect, weightNode
+from .drawInterface import drawPath
+from .simpleAI import stackSelect, steinerGraphCached, graphToAttack, splitAttack
+from .agentHelper import makeTrade, draftTroopsAmount
 from .heuristic import findInternalTerritories
+from .dice import captureLoss
+from typing import Dict
 
 
-# Does not work as arborescence is the wrong function for the task. Could try territory drafting process. 
-def attackGraphMulti(gameState : GameState, territories : Territories) -> Tuple[nx.DiGraph, set[int], int]:
+def attackGraphMulti(gameState : GameState, territories : Territories, debug : bool = False) -> Optional[Tuple[Dict[int, nx.DiGraph], Dict[int, float]]]:
     """
-    Given a list of target territories, calculates the optimal attacking graph. Outputs the graph,
-    the stack attacking from, and the sum of all troops on territories to attack
+    Given a list of target territories, calculates the optimal attacking graphs from several stacks.
+    Outputs the attack tree of each stack used, keyed by the stack, and the troops each stack needs
+    to capture its tree, being the expected losses plus the troop left on every territory captured.
+    The trees are the cheapest Steiner forest from the external stacks over the targets, planned on
+    the same graph as attackGraphSimple. Returns None if the stacks cannot reach every target.
     """
-    
-    # Get all stacks with large enough size
-    stacks = stackSelect(gameState, gameState.agentID)
-    
-    # Gets internal territories to remove from graph
-    internalTerritories = findInternalTerritories(gameState.agentID, gameState)
-    print("Internal territories")
-    print(internalTerritories)
-    
     # Stacks must be external to be used
-    filteredStacks = stacks - set(internalTerritories)
-    
-    # Creates node weightings
-    weightDict = {node : weightNode(node, gameState, territories) for node in gameState.map.graph.nodes()}
- 
-    # Creates new directed graph for msa prep
-    directedGraph = nx.DiGraph(gameState.map.graph)
-    
-    # Removes all territories not to attack from 
-    ownedToRemove = set(gameState.playerDict[gameState.agentID]["territories"]) - filteredStacks
-    
-    print("Owned to remove", ownedToRemove)
-    directedGraph.remove_nodes_from(ownedToRemove)
-    print("Graph nodes after remove")
-    print(directedGraph.nodes())
-    
-    # Generates new weighted edges for graph. Weight is based on the desirablility 
-    # to go to that territory. High troop low connection neutral territories are the least desirable. 
-    for u, v in gameState.map.graph.edges():
-        # Ensure that edge is in the connected graph! Inefficient operation 
-        # style but should be negligible. 
-        if u in directedGraph.nodes() and v in directedGraph.nodes():
-            directedGraph.add_edge(u, v, weight=weightDict[v])
-            directedGraph.add_edge(v, u, weight=weightDict[u])
-        
-        
-    # Do special treatment of stack nodes afterwards    
-    for stack in filteredStacks:
-        # Remove all incoming edges to stack 
-        # Convert in_edges to a list before removing to avoid interation errors
-        edges_to_remove = list(directedGraph.in_edges(stack))
-        directedGraph.remove_edges_from(edges_to_remove)
-        
-        # Add outward edges to neighbours in stack, ensuring it is not a new 
-        # edge to another stack
-        for neighbour in gameState.map.graph.neighbors(stack):
-            if gameState.map.graph.nodes[neighbour]["player"] != gameState.agentID and neighbour in directedGraph.nodes():
-                # They should only be in the direction away from the stack
-                directedGraph.add_edge(stack, neighbour, weight=weightDict[neighbour] // 10)
-
-    print("Graph nodes")
-    print(directedGraph.nodes())
-    print("Graph edges")
-    print(directedGraph.edges())
-    drawArborescence(gameState, directedGraph, 100)
-    arborescence = nx.minimum_branching(directedGraph)
-    print("Arborescence edges")
-    print(arborescence.edges())
-    drawArborescence(gameState, arborescence, 500)
-
-    
-    # In this iteration neutral nodes includes stacks which can be filtered out
-    neutralNodes = set(arborescence.nodes()) - territories
-    
-    print("Neutral nodes")
-    print(neutralNodes)
-    drawArborescence(gameState, arborescence, 100)
-    
-    # Loop until no more neutral nodes can be removed
-    trimmedNode = True 
-    while trimmedNode:
-        trimmedNode = False
-        
-        # Creates a list so there is a separate object to loop over while neutral nodes is modified
-        for node in list(neutralNodes):
-            # If neutral node is a leaf then remove it
-            print("curr node is ", node)
-            if (arborescence.out_degree(node)) == 0:
-                print("Trimmed a node")
-                arborescence.remove_node(node)
-                # Importantly removes node from list of nodes to search and trim
-                neutralNodes.remove(node)
-
-                trimmedNode = True
-                
-    # Check how optimal the arborescence is
-    minTroops = 0 
-    
-    for node in arborescence.nodes():
-        minTroops += gameState.map.graph.nodes[node]["troops"]
-        
-    stacksUsed = {node for node in arborescence.nodes() if gameState.map.graph.nodes[node]["player"] == gameState.agentID}
-                
-    drawPath(gameState, arborescence, 200)
-    return arborescence, stacksUsed, minTroops
+    stacks = stackSelect(gameState, gameState.agentID) - findInternalTerritories(gameState.agentID, gameState)
 
+    result = steinerGraphCached(gameState).forest(territories, stacks)
+    if result is None:
+        return None
+    trees, _ = result
+
+    troops = gameState.board.troops
+    requirements = {stack: sum(captureLoss(int(troops[terr])) + 1 for terr in tree.nodes() if terr != stack)
+                    for stack, tree in trees.items()}
+
+    if debug:
+        for stack, tree in trees.items():
+            print("Stack", stack, "needs", requirements[stack], "troops to capture", set(tree.nodes()) - {stack})
+            drawPath(gameState, tree, stack)
+
+    return (trees, requirements)
+
+
+def multiDraft(gameState : GameState, requirements : Dict[int, float]) -> Draft:
+    """
+    Gets the greedy trade and drafts onto the attacking stacks. Troops go to the stacks short of
+    what their trees need, in proportion to how short they are, and any left over go to the stack
+    with the largest tree.
+    """
+    tradeList = makeTrade(gameState)
+    draftAmount = draftTroopsAmount(gameState, tradeList)
+
+    troops = gameState.board.troops
+    shortfalls = {stack: max(need - (int(troops[stack]) - 1), 0) for stack, need in requirements.items()}
+    totalShort = sum(shortfalls.values())
+
+    placements = {}
+    if totalShort > 0:
+        for stack, short in shortfalls.items():
+            placements[stack] = int(draftAmount * min(short / totalShort, 1))
+
+    largest = max(requirements, key=requirements.get)
+    placements[largest] = placements.get(largest, 0) + draftAmount - sum(placements.values())
+
+    return (tradeList, [(stack, amount) for stack, amount in placements.items() if amount > 0])
+
+
+def attackMulti(gameState : GameState, territories : Territories) -> Optional[Tuple[Draft, Attack, int]]:
+    """
+    Plans the draft and attacks to capture all territories from several stacks. Returns None if
+    the territories cannot be attacked together. Matches attackSimple, so the troops returned are
+    those on every territory of the trees, including the stacks.
+    """
+    result = attackGraphMulti(gameState, territories)
+    if result is None:
+        return None
+    trees, requirements = result
+
+    draft = multiDraft(gameState, requirements)
+    draftDict = dict(draft[1])
+
+    attack = []
+    for stack, tree in trees.items():
+        attack += graphToAttack(gameState, tree, stack, int(gameState.board.troops[stack]) + draftDict.get(stack, 0))
+    attack = splitAttack(gameState, attack, draft)
+
+    sumTroops = sum(int(gameState.board.troops[list(tree.nodes())].sum()) for tree in trees.values())
+    return (draft, attack, sumTroops)
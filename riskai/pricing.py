@@ -0,0 +1,81 @@
+# Fast pricing of abstract actions. Before an action sequence is planned in full, the troops
+# its targets cost and its chance of success are estimated from the stack path matrix and the
+# dice odds, so that sequences with no hope of succeeding are rejected before any attack
+# graph is built. Estimates are upper bounds, so only sequences which would fail anyway are cut.
+from .structures import *
+from .agentHelper import draftTroopsAmount
+from .stackPaths import stackPathsCached
+from .dice import winProbability
+import numpy as np
+
+
+# Sequences estimated to succeed less often than this are not planned
+MINSUCCESS = 0.05
+
+
+def availableTroops(gameState : GameState, stacks : list[int]) -> int:
+    """
+    Optimistic count of the troops the agent could attack with this turn: every troop that can
+    leave the stacks, everything drafted and the best trade for every set of three cards held.
+    """
+    troops = gameState.board.troops
+    return int((troops[stacks] - 1).sum()) + draftTroopsAmount(gameState, []) + 10 * (len(gameState.cards) // 3)
+
+
+class ActionPricer:
+    """
+    Prices the targets of actions on the root state of a search.
+
+    Attributes:
+        paths (StackPaths): Cheapest paths from the agent's stacks.
+        troops (list[int]): Troops on every territory.
+        available (int): Optimistic troops available to attack with.
+    """
+    def __init__(self, gameState : GameState):
+        self.paths = stackPathsCached(gameState)
+        self.troops = gameState.board.troops.tolist()
+        self.available = availableTroops(gameState, self.paths.stacks)
+
+
+    def cost(self, targets : Territories) -> float:
+        """
+        Lower bound on the troops expected to be spent capturing every target. Every target is
+        paid for, and the plan must also enter every territory on the way to whichever target
+        it reaches first, and to the target furthest from the stacks. Infinite if some target
+        cannot be reached.
+        """
+        if len(targets) == 0:
+            return 0.0
+        targets = list(targets)
+        nearest = self.paths.nearest[targets]
+        weights = self.paths.weights[targets]
+        return float(max(weights.sum() + (nearest - weights).min(), nearest.max()))
+
+
+    def success(self, targets : Territories) -> float:
+        """
+        Upper bound on the probability of capturing every target. Each target must be captured
+        in turn, and no attack can be made with more than every available troop, so this is the
+        product of the odds of all available troops capturing each target alone.
+        """
+        if len(targets) == 0:
+            return 1.0
+        if self.available <= 0:
+            return 0.0
+        return float(np.prod([winProbability(self.available, self.troops[terr]) for terr in targets]))
+
+
+    def price(self, targets : Territories) -> Tuple[float, float]:
+        """
+        Gets the troop cost and success probability of capturing the targets.
+        """
+        return (self.cost(targets), self.success(targets))
+
+
+    def feasible(self, targets : Territories) -> bool:
+        """
+        Whether the targets are worth planning, being affordable and likely enough to succeed.
+        As capturing more targets never costs less or succeeds more often, no superset of
+        infeasible targets is feasible either.
+        """
+        return self.cost(targets) <= self.available and self.success(targets) >= MINSUCCESS
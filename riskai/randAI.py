@@ -5,7 +5,7 @@ from .agentHelper import makeTrade, draftTroopsAmount
 
 
 
-def randDraft(gameState : GameState) -> Draft:
+def randDraft(gameState : GameState, rng : random.Random) -> Draft:
     """
     Gets all possible trades to make, actions all of them, then 
     drafts all available troops to a single territory. 
@@ -16,14 +16,14 @@ def randDraft(gameState : GameState) -> Draft:
     
     territoriesList = list(gameState.playerDict[gameState.agentID]["territories"])
         
-    draftTerr = random.choice(territoriesList)
+    draftTerr = rng.choice(territoriesList)
     
     return (tradeList, [(draftTerr, draftAmount)])
     
 
 
 
-def randAttack(gameState : GameState) -> Attack:
+def randAttack(gameState : GameState, rng : random.Random) -> Attack:
     """
     Randomly selects an attack to make. 
     """
@@ -38,12 +38,12 @@ def randAttack(gameState : GameState) -> Attack:
     if len(attackable) == 0:
         return []
     else:
-        randAttack = random.choice(attackable)
+        randAttack = rng.choice(attackable)
         attack = (randAttack[0], randAttack[1], gameState.map.graph.nodes[node]["troops"], gameState.map.graph.nodes[node]["troops"])
         return [attack]
     
     
-def randFortify(gameState : GameState) -> Fortify:
+def randFortify(gameState : GameState, rng : random.Random) -> Fortify:
     """
     Randomly selects a fortify to make. 
     """
@@ -58,12 +58,19 @@ def randFortify(gameState : GameState) -> Fortify:
     if len(fortifiable) == 0:
         return None
     else:
-        randFortify = random.choice(fortifiable)
+        randFortify = rng.choice(fortifiable)
         return (randFortify[0], randFortify[1], gameState.map.graph.nodes[randFortify[0]]["troops"] - 1)
     
 
-def randAI(gameState : GameState) -> Move:
+def randAI(gameState : GameState, rng : Optional[random.Random] = None) -> Move:
     """
-    Randomly selects a move to make. 
+    Randomly selects a move to make, drawing from rng or the global generator if not given.
+    The hand is restored after drafting as trades are only carried out once the move is executed. 
     """
-    return (randDraft(gameState), randAttack(gameState), randFortify(gameState))
\ No newline at end of file
+    # The random module has the methods of its global generator
+    if rng is None:
+        rng = random
+    mark = gameState.checkpoint()
+    move = (randDraft(gameState, rng), randAttack(gameState, rng), randFortify(gameState, rng))
+    gameState.rollback(mark)
+    return move
\ No newline at end of file
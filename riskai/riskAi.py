@@ -1,11 +1,17 @@
 from .structures import *
 from .actions import *
-from typing import List, Dict
+from typing import List, Dict, Iterator, Iterable
+import functools
 import itertools
-import signal
 import click
+from concurrent.futures import ProcessPoolExecutor, Future, wait
 from .agentHelper import generalDraft, generalFortify
 from .simpleAI import attackSimple
+from .multiAI import attackMulti
+from .heuristic import heuristicBatch
+from .deadline import Deadline
+from .pricing import ActionPricer
+import numpy as np
 
 
 def generateActionDict(player: int, gameState : GameState) -> Dict[ActionType, Set[ActionSet]]:
@@ -50,19 +56,78 @@ def validateActionSet(actionSet : ActionSet) -> bool:
     return not ((killSet & breakSet) or (killSet & takeSet) or (breakSet & takeSet))
 
 
-def generateActionSeq(actionDict : Dict[ActionType, Set[ActionSet]], length : int) -> Set[ActionSet]:
+def generateActionSeq(gameState : GameState, actionDict : Dict[ActionType, Set[ActionSet]], length : int) -> Iterator[ActionSet]:
     """
     Given a list of actions, generates the sequence of actions that should be 
     taken. This should be the final step in the action generation process. 
+    Sequences are yielded lazily with the most valuable actions first, and a 
+    prefix is abandoned as soon as its actions conflict, the troops on its 
+    targets alone are over the budget used by ids or its targets are priced 
+    as infeasible, as every sequence extending it would fail the same way. 
     """
-    
     if length == 1:
-        return set().union(*actionDict.values())
-    
+        actions = set().union(*actionDict.values())
     else:
-        combSet = actionDict[ActionType.KILLPLAYER] | actionDict[ActionType.TAKEBONUS] | actionDict[ActionType.BREAKBONUS] | actionDict[ActionType.EXPANDBORDERS]
-        combinations = {frozenset(comb) for comb in itertools.combinations(combSet, length)}
-        return {comb for comb in combinations if validateActionSet(comb)}
+        actions = actionDict[ActionType.KILLPLAYER] | actionDict[ActionType.TAKEBONUS] | actionDict[ActionType.BREAKBONUS] | actionDict[ActionType.EXPANDBORDERS]
+    
+    troops = gameState.board.troops.tolist()
+    pricer = ActionPricer(gameState)
+    targets = {action: actionTargets for action, actionTargets in actionTargets(gameState, actions).items() 
+               if pricer.feasible(actionTargets)}
+    
+    # Most valuable first, then cheapest first within actions of equal value
+    ordered = sorted(targets, key=lambda action: (-evalAction(action), pricer.cost(targets[action])))
+    
+    budget = gameState.playerDict[gameState.agentID]["troops"]
+    yield from extendActionSeq(ordered, targets, troops, budget, pricer, length, [], frozenset())
+
+
+def actionTargets(gameState : GameState, actions : Set[Action]) -> Dict[Action, frozenset]:
+    """
+    Finds the territories each action attacks. Targets only depend on the root state so are 
+    found once per search. Taking territories depends on depth and not attacking has no 
+    targets, so both are given none. Actions without anywhere to attack can never be 
+    planned and are left out. 
+    """
+    targets = {}
+    for action in actions:
+        if action.action in (ActionType.TAKETERRITORIES, ActionType.NOATTACK):
+            targets[action] = frozenset()
+            continue
+        territories = calculateAction(gameState, action)
+        if territories is None or None in territories:
+            continue
+        targets[action] = frozenset(territories)
+    return targets
+
+
+def extendActionSeq(ordered : list[Action], targets : Dict[Action, frozenset], troops : list[int], budget : int, 
+                    pricer : ActionPricer, length : int, prefix : list[Action], covered : frozenset) -> Iterator[ActionSet]:
+    """
+    Depth first extension of a sequence prefix with actions later in the ordering, yielding 
+    every valid sequence of the given length. 
+    """
+    if len(prefix) == length:
+        yield frozenset(prefix)
+        return
+    
+    start = ordered.index(prefix[-1]) + 1 if prefix else 0
+    # Leaves enough actions after each choice to complete the sequence
+    for i in range(start, len(ordered) - (length - len(prefix)) + 1):
+        action = ordered[i]
+        
+        # Troops on the targets are a lower bound on the troops the attack will need
+        newCovered = covered | targets[action]
+        if sum(troops[terr] for terr in newCovered) * 2 > budget:
+            continue
+        if not validateActionSet(prefix + [action]):
+            continue
+        if newCovered != covered and not pricer.feasible(newCovered):
+            continue
+        
+        prefix.append(action)
+        yield from extendActionSeq(ordered, targets, troops, budget, pricer, length, prefix, newCovered)
+        prefix.pop()
     
 
 
@@ -80,7 +145,7 @@ def calculateAction(gameState : GameState, action : Action) -> Optional[Territor
             return None
         case ActionType.TAKECARD:
             return tcData(gameState)
-        case ActionType.TAKECARD:
+        case ActionType.NOATTACK:
             return None
         case _:
             raise ValueError("Invalid agent type")
@@ -101,42 +166,59 @@ def evalAction(action : Action) -> int:
             return 10
         case ActionType.TAKECARD:
             return 40
-        case ActionType.TAKECARD:
+        case ActionType.NOATTACK:
             return 0
         case _:
             raise ValueError("Invalid agent type")
     
 
-# !Note: Iterative deepening search should save all maps of hard calculation  
-# paths into a dictionary for lookup. Iterative deepening should then also 
-# prioritise continuing from nodes which have already been calculated.
-# @ This is now far beyond the scope of the project.
-def calculateActionSeq(gameState : GameState, actionSet : ActionSet, depth : int) -> Optional[Tuple[Move, int]]:
+# !Note: Hard calculation paths are saved for lookup in simpleAI.attackPlanCache, 
+# so sequences sharing targets across depths reuse their attack graphs. Iterative 
+# deepening should also prioritise continuing from nodes which have already been calculated.
+def calculateActionSeq(gameState : GameState, actionSet : ActionSet, depth : int) -> Optional[Tuple[Move, int, int]]:
     """
     Given an action from the heavily pruned list of actions, perform 
     pathing calculations using definitive action rules. Should return 
-    Moves calculated and heuristic value. 
+    Moves calculated, troops on the territories to take and the value of 
+    the actions. Returns None if the targets cannot be attacked together. 
     """
-    actionEval = 0
-    
-    totalTerritories = set()
-    for action in actionSet:
-        actionEval += evalAction(action)
-        territories = calculateAction(gameState, action)
-        if territories is None:
-            if action.action == ActionType.TAKETERRITORIES:
-                territories = ttData(gameState, depth)
-            if action.action == ActionType.NOATTACK:
-                move = (generalDraft(gameState), [], generalFortify(gameState))
-                return (move, 0)
-            
-        totalTerritories = totalTerritories.union(territories)
-    
-    draft, attack, sumTroops = attackSimple(gameState, totalTerritories)
-    
-    fortify = generalFortify(gameState)
-    
-    return ((draft, attack, fortify), sumTroops, actionEval)
+    # Drafting trades cards out of the hand, so every change is journalled and 
+    # rolled back to leave the root state untouched for the next sequence
+    mark = gameState.checkpoint()
+    try:
+        actionEval = 0
+        
+        totalTerritories = set()
+        for action in actionSet:
+            actionEval += evalAction(action)
+            territories = calculateAction(gameState, action)
+            if territories is None:
+                if action.action == ActionType.TAKETERRITORIES:
+                    territories = ttData(gameState, depth)
+                if action.action == ActionType.NOATTACK:
+                    move = (generalDraft(gameState), [], generalFortify(gameState))
+                    return (move, 0, actionEval)
+                
+            totalTerritories = totalTerritories.union(territories)
+        
+        # Targets priced as infeasible are not worth building attack graphs for
+        if not ActionPricer(gameState).feasible(totalTerritories):
+            return None
+        
+        attackResult = attackSimple(gameState, totalTerritories)
+        # Targets out of reach of any single stack may still be reached from several
+        if attackResult is None:
+            attackResult = attackMulti(gameState, totalTerritories)
+        # Targets may not be reachable together
+        if attackResult is None:
+            return None
+        draft, attack, sumTroops = attackResult
+        
+        fortify = generalFortify(gameState)
+        
+        return ((draft, attack, fortify), sumTroops, actionEval)
+    finally:
+        gameState.rollback(mark)
     
     
     
@@ -148,72 +230,210 @@ def calculateActionSeq(gameState : GameState, actionSet : ActionSet, depth : int
 
 
 
-# Creating error classes and handling to implement a timer interupt for the 
-# iterative deepening search.
-class TimeoutError(Exception):
-    pass
+# How many sibling sequences are scored together by the batch heuristic
+BATCHSIZE = 32
+
+
+def scoreCandidates(gameState : GameState, candidates : list[Tuple[Move, int]]) -> np.ndarray:
+    """
+    Scores a batch of candidate moves by the value of their actions plus the heuristic of the 
+    board after each move. Each move is applied and undone on the root state to read off its 
+    board, then all boards are evaluated together. 
+    """
+    owners = np.empty((len(candidates), len(gameState.board.owner)), dtype=gameState.board.owner.dtype)
+    troops = np.empty((len(candidates), len(gameState.board.troops)), dtype=gameState.board.troops.dtype)
+    
+    for i, (move, _) in enumerate(candidates):
+        gameState.apply(move)
+        owners[i] = gameState.board.owner
+        troops[i] = gameState.board.troops
+        gameState.undo()
+        
+    return heuristicBatch(gameState, owners, troops) + np.array([actionEval for _, actionEval in candidates])
+
+
+def bestCandidate(gameState : GameState, candidates : list[Tuple[Move, int]], bestMove : Tuple[Move, float]) -> Tuple[Move, float]:
+    """
+    Scores a batch of candidate moves, returning the better of the best candidate and the 
+    current best move. 
+    """
+    if len(candidates) == 0:
+        return bestMove
+    
+    evals = scoreCandidates(gameState, candidates)
+    best = int(np.argmax(evals))
+    
+    if evals[best] > bestMove[1]:
+        return (candidates[best][0], float(evals[best]))
+    return bestMove
+
+
+def noAttackMove(gameState : GameState, actionDict : Dict[ActionType, Set[ActionSet]]) -> Tuple[Move, float]:
+    """
+    Scores not attacking. This is always possible, so searches start from it to guarantee 
+    a move to return however early their deadline expires. 
+    """
+    move, _, actionEval = calculateActionSeq(gameState, frozenset(actionDict[ActionType.NOATTACK]), 0)
+    return bestCandidate(gameState, [(move, actionEval)], (None, float('-inf')))
+
+
+
+
+def searchSequences(gameState : GameState, actionSeqs, depth : int, deadline : Deadline, bestMove : Tuple[Move, float]) -> Tuple[Move, float]:
+    """
+    Calculates each action sequence in turn and scores the viable ones in batches, returning 
+    the better of the best sequence and the current best move. Stops between sequences once 
+    the deadline expires, still scoring the sequences already calculated. 
+    """
+    # Viable sibling sequences are scored together by the batch heuristic
+    candidates = []
+    
+    for seq in actionSeqs:
+        if deadline.expired():
+            break
+        
+        result = calculateActionSeq(gameState, seq, depth)
+        if result is None:
+            continue
+        move, sumTroops, actionEval = result
+        
+        # Early stopping if sequence isn't viable
+        if sumTroops * 2 > gameState.playerDict[gameState.agentID]["troops"]:
+             continue
+
+        candidates.append((move, actionEval))
+        if len(candidates) == BATCHSIZE:
+            bestMove = bestCandidate(gameState, candidates, bestMove)
+            candidates = []
+    
+    return bestCandidate(gameState, candidates, bestMove)
 
-def timeout_handler(signum, frame):
-    raise TimeoutError("Search timed out after 45 seconds")
 
-def ids (gameState : GameState, timeConstraint : int) -> Move:    
+def ids (gameState : GameState, timeConstraint : float | Deadline, workers : int = 0) -> Tuple[Move, float]:    
     """
     Iterative deepening search which generates "nodes" that each represent
     an abstract action that the AI can take (such as killing a player, taking 
     a bonus etc). Given time constraints, this will perform a continuous search 
     of all possible combinations of actions until the time constraint it met. 
     It should then return the action with the highest utility as measured by the 
-    heuristic function. Note that it should exit at any point during execution 
-    as soon as the time constraint is met. 
+    heuristic function. The deadline is checked between sequence evaluations, 
+    which always roll back their changes, so the search stops with gameState 
+    untouched and returns the best move found so far. If workers is set, each 
+    depth is split between that many processes. 
     """
+    deadline = Deadline.of(timeConstraint)
     actionDict = generateActionDict(gameState.agentID, gameState)
-    depth = 0
-    bestMove = (float('-inf'), None)
+    bestMove = noAttackMove(gameState, actionDict)
+    
+    if workers > 0:
+        return parallelIds(gameState, actionDict, deadline, bestMove, workers)
+
+    # Perform iterative deepening search, starting from single actions. Search ends 
+    # early once a depth has no valid sequences as no deeper one can either. 
+    for depth in itertools.count(1):
+        actionSeqs = generateActionSeq(gameState, actionDict, depth)
+        first = next(actionSeqs, None)
+        if first is None:
+            return bestMove
+        
+        bestMove = searchSequences(gameState, itertools.chain([first], actionSeqs), depth, deadline, bestMove)
+        if deadline.expired():
+            click.echo(f"Search stopped at depth {depth} as the time constraint was met")
+            return bestMove
+
+
+
+
+# ---------------------------- Parallel search ----------------------------
+# Sequences at each depth are independent given the root state, so they are split 
+# into batches and calculated by a process pool. Pools are kept between searches so 
+# workers only start once. Every search is numbered, and a worker rebuilds the root 
+# state from the compact copy sent with each batch only when the number changes. 
+
+# Root state of a search worker process and the number of the search it is from
+workerState = None
+workerSearch = None
+
+# Numbers every search sent to the pools
+searchCounter = itertools.count()
+
+
+@functools.cache
+def searchPool(workers : int) -> ProcessPoolExecutor:
+    """
+    Gets the pool of worker processes of that size, starting it on first use. 
+    """
+    return ProcessPoolExecutor(workers)
+
+
+def rootState(search : int, compactState : tuple) -> GameState:
+    """
+    Gets the root state of a search inside a worker process, rebuilding it for a new search. 
+    """
+    global workerState, workerSearch
+    if workerSearch != search:
+        workerState = GameState.fromCompact(compactState)
+        workerSearch = search
+    return workerState
+
+
+def stopWorkers(futures : Iterable[Future]):
+    """
+    Cancels tasks not yet started and waits for running ones, which check the deadline 
+    themselves, so no worker is still searching once a search returns. 
+    """
+    for future in futures:
+        future.cancel()
+    wait(futures)
+
+
+def searchBatch(search : int, compactState : tuple, actionSeqs : list[ActionSet], depth : int, end : float) -> Tuple[Move, float]:
+    """
+    Searches a batch of sequences on the root state, stopping at the shared deadline.
+    """
+    return searchSequences(rootState(search, compactState), actionSeqs, depth, Deadline.at(end), (None, float('-inf')))
 
-    # Set up timer to interrupt after specified length of time. 
-    signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(timeConstraint)
 
+def parallelIds(gameState : GameState, actionDict : Dict[ActionType, Set[ActionSet]], deadline : Deadline, bestMove : Tuple[Move, float], workers : int) -> Tuple[Move, float]:
+    """
+    Iterative deepening search with the sequences of each depth spread over a pool of 
+    worker processes. The best move of every finished batch is merged into bestMove, 
+    and batches still running at the deadline are stopped before returning. 
+    """
+    pool = searchPool(workers)
+    search, compactState = next(searchCounter), gameState.compact()
+    futures = []
     try:
-        # Perform iterative deepening search
-        depth = 0
-        
-        actionSeqs = generateActionSeq(actionDict, depth)
-        
-        while len(actionSeqs) > 0:
+        for depth in itertools.count(1):
+            actionSeqs = list(generateActionSeq(gameState, actionDict, depth))
+            if len(actionSeqs) == 0:
+                return bestMove
             
-            for seq in actionSeqs:
-                move, sumTroops, eval = calculateActionSeq(gameState, seq, depth)
-                
-                # Early stopping if sequence isn't viable
-                if sumTroops * 2 > gameState.playerDict[gameState.agentID]["troops"]:
-                     continue
-    
-                
-                if eval > bestMove[1]:
-                    bestMove = (move, eval)
+            futures = [pool.submit(searchBatch, search, compactState, actionSeqs[i:i + BATCHSIZE], depth, deadline.end) 
+                       for i in range(0, len(actionSeqs), BATCHSIZE)]
+            done, notDone = wait(futures, timeout=deadline.remaining())
             
-            depth += 1
-            actionSeqs = generateActionSeq(actionDict, depth)
-
-        # If the search completes within time constraint, cancel the alarm
-        signal.alarm(0)
-        return bestMove 
-
-    except TimeoutError:
-        # Handle the timeout here
-        click.echo(f"Search timed out after {timeConstraint} seconds")
-        return bestMove 
+            for future in done:
+                move, value = future.result()
+                if value > bestMove[1]:
+                    bestMove = (move, value)
+                    
+            if notDone or deadline.expired():
+                click.echo(f"Search stopped at depth {depth} as the time constraint was met")
+                return bestMove
+    finally:
+        stopWorkers(futures)
 
 
 
 
-def riskAgent(gameState : GameState, timeConstraint : int) -> Move:
+def riskAgent(gameState : GameState, timeConstraint : float | Deadline, workers : int = 0) -> Move:
     """
     Main function to call AI agent. Gets move from iterative deepening search.
-    Should define the time constraints on the search. 
+    The time constraint is either seconds or a Deadline shared with other searches. 
+    Setting workers searches in parallel over that many processes. 
     """
-    return ids(gameState, timeConstraint)[0]
+    return ids(gameState, timeConstraint, workers)[0]
     
 
     
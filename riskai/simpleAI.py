@@ -2,197 +2,159 @@ from .structures import *
 from .actions import *
 from .agentHelper import makeTrade, draftTroopsAmount, stackSelect, ownedTerrConnected, splitTroops
 from .dice import perfectDice
-from .drawInterface import drawArborescence, drawPath
+from .attackOdds import optimiseSplits
+from .steiner import SteinerGraph
+from .drawInterface import drawPath
+from collections import OrderedDict
+import threading
+from typing import Hashable
 
 
 
-def weightNode(node : int, gameState : GameState, territories : Territories) -> int:
+def attackGraphSimple(gameState : GameState, territories : Territories, debug : bool = False) -> Tuple[nx.DiGraph, int, int]:
     """
-    Given a node, calculates the weight of the node based on the current game state and territories. 
+    Given a list of target territories, calculates the optimal attacking graph. Outputs the graph,
+    the stack attacking from, and the sum of all troops on territories to attack including the stack. 
+    The graph is the cheapest Steiner arborescence from any stack over the targets, where every 
+    territory entered costs its troops, so neutral territories are only crossed when they are the 
+    cheapest way through. Returns None if no stack can reach every target. Debug prints and draws 
+    the arborescence found, which should be off while searching. 
     """
-    # The weight of nodes are assigned orders of magnitude. The 10^0 order is for territories
-    # to capture as these are by far the most desirable. The 10^2 order is for territories which 
-    # are from an attacking stack as they should be undesirable but used frequently. The 10^4 order
-    # is for neutral territories which should not be attacked unless necessary. A 10^2 difference 
-    # in magnitude is used to clearly ensure the MSA algorithm prioritises the correct territories. 
-    
-    
-    
-    # Weights are calculated based on the number of troops in the territory, the number of adjacent 
-    # enemy territories, and the number of adjacent friendly territories. 
-    nodeWeight = 0
+    steinerGraph = steinerGraphCached(gameState)
+    
+    # Without targets the plan is just the largest stack
+    if len(territories) == 0:
+        if len(steinerGraph.roots) == 0:
+            return None
+        stack = max(steinerGraph.roots, key=lambda terr: int(gameState.board.troops[terr]))
+        arborescence = nx.DiGraph()
+        arborescence.add_node(stack)
+        return (arborescence, stack, int(gameState.board.troops[stack]))
+    
+    result = steinerGraph.arborescence(territories)
+    if result is None:
+        return None
+    arborescence, stack, _ = result
     
-    # If the territory is owned by the player, the weight is the number of troops in the territory
-    if gameState.map.graph.nodes[node]["player"] == gameState.agentID:
-        # Balances troop sum to be relative to player's total troop count to ensure comparison is 
-        # normalised for games with many and few troops. 
-        return (gameState.map.graph.nodes[node]["troops"] // gameState.playerDict[gameState.map.graph.nodes[node]["player"]]["troops"] )* 100
-        
-        
-    # If the territory is not owned by the player, the weight is the number of troops in the territory 
-    # plus the number of adjacent friendly (territories to attack) territories minus the number of 
-    # adjacent enemy territories. 
-    else:
-        # Normalises troop weight
-        nodeWeight = gameState.map.graph.nodes[node]["troops"] // gameState.playerDict[gameState.map.graph.nodes[node]["player"]]["troops"] 
-        
-        nodeWeight += len(list(gameState.map.graph.neighbors(node))) // 10
+    if debug:
+        print("Stack is ", stack)
+        print("Neutral nodes")
+        print(set(arborescence.nodes()) - set(territories) - {stack})
+        drawPath(gameState, arborescence, stack)
         
-        for neighbour in gameState.map.graph.neighbors(node):
-            if neighbour in territories:
-                nodeWeight -= 0.1
-            elif gameState.map.graph.nodes[neighbour]["player"] != gameState.agentID:
-                nodeWeight += 0.1
-                
-    if node not in territories:
-        nodeWeight = nodeWeight * 10000
-                     
-    return nodeWeight
+    sumTroops = int(gameState.board.troops[list(arborescence.nodes())].sum())
+    return (arborescence, stack, sumTroops)
+      
+      
+# Steiner graphs of recent boards. The paths depend only on the board and the agent's 
+# stacks, so every target set planned on a board shares one graph. 
+steinerGraphCache = OrderedDict()
 
+# Guards the Steiner graph cache, as searches may run on several threads at once
+steinerGraphLock = threading.Lock()
 
-def attackGraphSimple(gameState : GameState, territories : Territories) -> Tuple[nx.DiGraph, int, int]:
+# Most boards with a Steiner graph held
+STEINERCACHESIZE = 64
+
+
+def steinerGraphCached(gameState : GameState) -> SteinerGraph:
     """
-    Given a list of target territories, calculates the optimal attacking graph. Outputs the graph,
-    the stack attacking from, and the sum of all troops on territories to attack
+    Gets the Steiner graph of the board from the agent's stacks, building it on first use. 
+    Stacks depend on the agent's troop total in playerDict as well as the board, so they are 
+    part of the key. 
     """
-    # Firstly removes all owned territories from a copied graph so that we 
-    # can search only on the attackable space. 
-    filterGraph = gameState.map.graph.copy()
-    filterGraph.remove_nodes_from(gameState.playerDict[gameState.agentID]["territories"])
-    
-    # Check if all territories to capture are even connected
-    
-    components = nx.connected_components(filterGraph)
-    
-    foundComponent = {} 
-    foundFlag = False
-    
-    for component in components:
-        if all(terr in component for terr in territories):
-            foundComponent = component
-            foundFlag = True
-            break
-    
-    if not foundFlag:
-        return None
-    
-    # Get all stacks with large enough size
-    stacks = stackSelect(gameState, gameState.agentID)
-    
-    # Filter to stacks which have a connection to the component
-    filteredStacks = set()
-    for stack in stacks:
-        if any(neigh in foundComponent for neigh in gameState.map.graph.neighbors(stack)):
-            filteredStacks.add(stack)
-            
-    """ Suggested code to streamline prcess 
-    filteredStacks = {stack for stack in stacks if any(neigh in foundComponent for neigh in gameState.graph.neighbors(stack))} """
-            
-            
-    # Getting base graph to perform MSA over
-    componentGraph = gameState.map.graph.subgraph(foundComponent)
-    
-    # Removes all edges from the graph. Could be an inefficient process
-    # componentGraph.remove_edges_from(list(componentGraph.edges))
-    
-    
-    weightDict = {node : weightNode(node, gameState, territories) for node in componentGraph.nodes()}
- 
-    directedGraph = nx.DiGraph(componentGraph)
-    
-    # Unsure as to whether this correctly creates the directed graph
-    for u, v in componentGraph.edges():
-        directedGraph.add_edge(u, v, weight=weightDict[v])
-        directedGraph.add_edge(v, u, weight=weightDict[u])
-        
-    minTroops = float('inf')
-    minBranches = float('inf')
-    minArborescence = nx.DiGraph()
-    minStack = 0    
-    
-    for stack in filteredStacks:
-        print("Stack is ", stack)
-        
-        # Add stack node to the graph for MSA 
-        directedGraph.add_node(stack)
-        
-        # Add paths exiting the stack to the component to attack
-        for neighbour in gameState.map.graph.neighbors(stack):
-            if neighbour in foundComponent:
-                # They should only be in the direction away from the stack
-                directedGraph.add_edge(stack, neighbour, weight=weightDict[neighbour] // 10)
-                
-                
-        # Make arborescence
-        arborescence = nx.minimum_spanning_arborescence(directedGraph)
-    
-        # Filter out neutral territories as best as possible
-        # Get all neutral nodes which are not desired to attack and are not the 
-        # stack attacking from 
-        neutralNodes = set(arborescence.nodes()) - territories - {stack}
-        print("Neutral nodes")
-        print(neutralNodes)
-        print(type(neutralNodes))
-        drawArborescence(gameState, arborescence, (stack + 100))
-       
-        # Loop until no more neutral nodes can be removed
-        trimmedNode = True 
-        while trimmedNode:
-            trimmedNode = False
-            
-            # Creates a list so there is a separate object to loop over while neutral nodes is modified
-            for node in list(neutralNodes):
-                # If neutral node is a leaf then remove it
-                print("curr node is ", node)
-                if (arborescence.out_degree(node)) == 0:
-                    print("Trimmed a node")
-                    arborescence.remove_node(node)
-                    # Importantly removes node from list of nodes to search and trim
-                    neutralNodes.remove(node)
+    stacks = frozenset(stackSelect(gameState, gameState.agentID))
+    key = (gameState.positionKey, stacks)
+    with steinerGraphLock:
+        steinerGraph = steinerGraphCache.get(key)
+        if steinerGraph is not None:
+            steinerGraphCache.move_to_end(key)
+            return steinerGraph
+    
+    # Built outside the lock so other threads are not held up
+    steinerGraph = SteinerGraph(gameState.board, gameState.agentID, stacks)
+    with steinerGraphLock:
+        steinerGraphCache[key] = steinerGraph
+        if len(steinerGraphCache) > STEINERCACHESIZE:
+            steinerGraphCache.popitem(last=False)
+    return steinerGraph
+      
+      
+      
+      
+# Sentinel for plans not in the cache, as None is a valid plan
+MISSING = object()
 
-                    trimmedNode = True
-                    
-        drawPath(gameState, arborescence, stack)
 
+class AttackPlanCache:
+    """
+    Bounded least recently used cache of attack graphs, keyed by the exact position of the game 
+    state and the frozenset of target territories. Planning is deterministic for a board and target set, so 
+    repeated requests for the same targets within a turn are served without recalculating. 
+    Every access holds a lock so searches on several threads can share the cache.
+
+    Attributes:
+        maxSize (int): The most plans held before the least recently used is evicted.
+        hits (int): Number of lookups served from the cache.
+        misses (int): Number of lookups which had to be calculated.
+    """
+    def __init__(self, maxSize : int = 4096):
+        self.maxSize = maxSize
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
         
-        # Check how optimal the arborescence is
-        tempTroops = 0 
-        
-        for node in arborescence.nodes():
-            tempTroops += gameState.map.graph.nodes[node]["troops"]
-            
-        # Updates minimum arborescence if it requires less troop expenditure
-        if tempTroops < minTroops:
-            minTroops = tempTroops
-            
-            # The continuity of the path found is used as a tiebreaker. 
-            # Ideally, the path should branch as few times as possible.
-            minBranches = 0
-            for deg in dict(arborescence.out_degree()).values():
-                if deg > 1:
-                    minBranches += deg
-            
-            minStack = stack
-            minArborescence = arborescence
+    def get(self, key : Hashable):
+        """
+        Gets a cached plan, which may itself be None for unreachable targets. Returns 
+        MISSING if the plan has not been calculated. 
+        """
+        with self.lock:
+            plan = self.plans.get(key, MISSING)
+            if plan is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.plans.move_to_end(key)
+            return plan
+    
+    def put(self, key : Hashable, plan):
+        """
+        Adds a plan, evicting the least recently used plan if the cache is full.
+        """
+        with self.lock:
+            self.plans[key] = plan
+            self.plans.move_to_end(key)
+            if len(self.plans) > self.maxSize:
+                self.plans.popitem(last=False)
             
-        # Perform tiebreak     
-        elif tempTroops == minTroops:
-            tempBranches = 0
-            for deg in dict(arborescence.out_degree()).values():
-                if deg > 1:
-                    tempBranches += deg
-            
-            if tempBranches < minBranches:
-                minBranches = tempBranches
-                minStack = stack
-                minArborescence = arborescence
-                
-        # Remove stack node from the graph to clean for next iteration
-        directedGraph.remove_node(stack)
+    def clear(self):
+        """
+        Empties the cache and resets the counters.
+        """
+        with self.lock:
+            self.plans.clear()
+            self.hits = 0
+            self.misses = 0
         
-    return (minArborescence, minStack, minTroops)
-      
-      
+
+# Shared cache used by the agents
+attackPlanCache = AttackPlanCache()
+
+
+def attackGraphCached(gameState : GameState, territories : Territories) -> Optional[Tuple[nx.DiGraph, int, int]]:
+    """
+    Memoised attackGraphSimple. The returned graph is shared with the cache so must not be modified.
+    """
+    # Keyed on the exact position, as plans differ for troop counts the Zobrist hash buckets together, 
+    # and on the stacks planned from, which also depend on the agent's troop total
+    key = (gameState.positionKey, frozenset(stackSelect(gameState, gameState.agentID)), frozenset(territories))
+    plan = attackPlanCache.get(key)
+    if plan is MISSING:
+        plan = attackGraphSimple(gameState, territories)
+        attackPlanCache.put(key, plan)
+    return plan
       
       
 def simpleDraft(gameState : GameState, stack : int) -> Draft:
@@ -216,15 +178,17 @@ def graphToAttackRec(gameState : GameState, attackGraph : nx.DiGraph, currNode :
         return []    
           
     # Gets a list of how to distribute troops
-    splitList = splitTroops(currTroops, len(attackGraph.neighbors(currNode)))
+    splitList = splitTroops(currTroops, attackGraph.out_degree(currNode))
     splitIndex = 0
     
     addingList = []    
     
     for neighbour in attackGraph.neighbors(currNode):
-        # Always asks for perfect attack currently, no matter how many troops there are
-        # Also moves troops assuming no losses. !Should be revamped in the future.
-        thisAttack = (currNode, neighbour, perfectDice(gameState.map.graph.nodes[neighbour]["troops"]), currTroops)
+        # Always asks for perfect attack currently, no matter how many troops there are. 
+        # Earlier branches move their split so later branches keep troops to attack with, 
+        # while the last branch moves everything left. 
+        moved = currTroops if splitIndex == len(splitList) - 1 else splitList[splitIndex]
+        thisAttack = (currNode, neighbour, perfectDice(gameState.map.graph.nodes[neighbour]["troops"]), moved)
         addingList += [thisAttack]
         
         # Recurses until all branches are added
@@ -243,9 +207,30 @@ def graphToAttack(gameState : GameState, attackGraph : nx.DiGraph, stack : int,
     return graphToAttackRec(gameState, attackGraph, stack, troops)
 
 
+def splitAttack(gameState : GameState, attack : Attack, draft : Draft) -> Attack:
+    """
+    Replaces the even troop splits of a branching attack with those most likely to capture 
+    every target, given the troops on the board after the draft. 
+    """
+    if len({fromTerr for fromTerr, _, _, _ in attack}) == len(attack):
+        return attack
+    
+    troops = gameState.board.troops.copy()
+    for terr, placed in draft[1]:
+        troops[terr] += placed
+    return optimiseSplits(troops, attack)[0]
+
+
         
-def attackSimple(gameState : GameState, territories : Territories) -> Tuple[Draft, Attack, int]:
-    attackGraph, stack, sumTroops = attackGraphSimple(gameState, territories)
+def attackSimple(gameState : GameState, territories : Territories) -> Optional[Tuple[Draft, Attack, int]]:
+    """
+    Plans the draft and attacks to capture all territories from a single stack. Returns None 
+    if the territories cannot be attacked together. 
+    """
+    attackResult = attackGraphCached(gameState, territories)
+    if attackResult is None:
+        return None
+    attackGraph, stack, sumTroops = attackResult
     
     draft = simpleDraft(gameState, stack)
     
@@ -254,6 +239,7 @@ def attackSimple(gameState : GameState, territories : Territories) -> Tuple[Draf
     
     # Gets troops number by amount of current troops plus draft amount
     attack = graphToAttack(gameState, attackGraph, stack, gameState.map.graph.nodes[stack]["troops"] + draftDict[stack])
+    attack = splitAttack(gameState, attack, draft)
     
     return (draft, attack, sumTroops)
 
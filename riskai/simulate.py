@@ -0,0 +1,328 @@
+# Headless game engine for playing agents against each other without prompts. Drafts,
+# attacks, captures, cards, eliminations and fortifies are all resolved internally, with
+# battles decided by the dice tables or exact dice from a seeded generator.
+from .structures import *
+from .agentHelper import draftTroopsAmount, ownedTerrConnected
+from .dice import blitz, tableBlitz
+from .randAI import randAI
+from .riskAi import riskAgent
+from .beamAI import beamAgent
+from .mctsAI import MCTSAgent
+from .simpleAI import attackPlanCache
+from maps.mapStructures import Map, MapType
+from typing import Callable
+import functools
+import logging
+import random
+import time
+import traceback
+
+
+logger = logging.getLogger(__name__)
+
+# Troops each player starts with for each amount of players
+STARTINGTROOPS = {2: 40, 3: 35, 4: 30, 5: 25, 6: 20}
+
+# Games still running after this many rounds are drawn
+MAXROUNDS = 200
+
+COLOURS = ["Red", "Blue", "Green", "Yellow", "Purple", "Black"]
+
+
+Agent: TypeAlias = Callable[[GameState], Move]
+"""
+Any function giving the move to make for gameState.agentID, such as randAI.
+"""
+
+
+class GameResult(TypedDict):
+    """
+    Summary of a finished game.
+
+    Attributes:
+        seed (int): Seed the game was played with.
+        winner (Optional[int]): ID of the winning player, None if the game was drawn.
+        rounds (int): Rounds played.
+        turns (int): Turns played.
+        territories (list[int]): Territories held by each player at the end.
+        errors (list[int]): Turns each player lost to its agent raising an error.
+        failures (list[dict]): The player, round and traceback of every error raised by an agent.
+        turnSeconds (list[float]): Time each player's agent spent choosing moves.
+        playerTurns (list[int]): Turns played by each player.
+        nodes (list[int]): Attack plans looked up by each player's agent, measuring how much it searched.
+        seconds (float): Time taken to play the game.
+    """
+    seed: int
+    winner: Optional[int]
+    rounds: int
+    turns: int
+    territories: list[int]
+    errors: list[int]
+    failures: list[dict]
+    turnSeconds: list[float]
+    playerTurns: list[int]
+    nodes: list[int]
+    seconds: float
+
+
+def makeAgent(name : str, timeConstraint : float = 1, seed : Optional[int] = None) -> Agent:
+    """
+    Creates an agent by the name used in __main__.getAgentTurn. Searching agents are given
+    timeConstraint seconds per turn. Tree search agents keep their tree between turns, so
+    each player needs its own. Random agents draw from their own generator seeded by seed.
+    """
+    match name:
+        case "randAI":
+            return randAI if seed is None else functools.partial(randAI, rng=random.Random(seed))
+        case "actionAI":
+            return functools.partial(riskAgent, timeConstraint=timeConstraint)
+        case "beamAI":
+            return functools.partial(beamAgent, timeConstraint=timeConstraint)
+        case "mctsAI":
+            return functools.partial(MCTSAgent(seed), timeConstraint=timeConstraint)
+        case _:
+            raise ValueError("Invalid agent type")
+
+
+def newGame(numPlayers : int, rng : random.Random, mapType : MapType = MapType.CLASSIC) -> GameState:
+    """
+    Sets up the start of a game. Territories are dealt out in a random order with one troop
+    each, then the rest of every player's starting troops are placed on random territories
+    they own.
+    """
+    map = Map(mapType)
+    territories = sorted(map.graph.nodes())
+    rng.shuffle(territories)
+
+    owned = {player: [] for player in range(numPlayers)}
+    for i, terr in enumerate(territories):
+        owned[i % numPlayers].append(terr)
+        map.graph.nodes[terr]["player"] = i % numPlayers
+        map.graph.nodes[terr]["troops"] = 1
+
+    for player, terrs in owned.items():
+        for _ in range(STARTINGTROOPS.get(numPlayers, 20) - len(terrs)):
+            map.graph.nodes[rng.choice(terrs)]["troops"] += 1
+
+    playerDict = {}
+    for player, terrs in owned.items():
+        playerDict[player] = {"id": player, "colour": COLOURS[player % len(COLOURS)], "troops": sum(map.graph.nodes[terr]["troops"] for terr in terrs),
+                              "territories": set(terrs), "diceAggression": 0, "territoryAggression": 0, "bonusAggression": 0,
+                              "bonusesHeld": {bonus for bonus, vals in map.bonuses.items() if vals["territories"].issubset(terrs)},
+                              "prevIncome": 0, "cardsNum": 0, "dangerLevel": 0}
+
+    relationsMatrix = [[0 for _ in range(numPlayers)] for _ in range(numPlayers)]
+    return GameState(map, 0, 1, playerDict, list(range(numPlayers)), relationsMatrix, [])
+
+
+def makeDeck(map : Map, rng : random.Random) -> list[Card]:
+    """
+    Creates the shuffled deck of one card per territory, with types dealt in turn, plus two wilds.
+    """
+    types = [CardType.INFANTRY, CardType.CAVALRY, CardType.ARTILLERY]
+    deck = [Card(types[i % 3], terr) for i, terr in enumerate(sorted(map.graph.nodes()))]
+    deck += [Card(CardType.WILD, None), Card(CardType.WILD, None)]
+    rng.shuffle(deck)
+    return deck
+
+
+def validTrade(trade : Trade) -> bool:
+    """
+    Checks a trade is three cards of the same type or of three different types, with wilds
+    standing in for any type.
+    """
+    if len(trade) != 3:
+        return False
+    types = [card.type for card in trade if card.type != CardType.WILD]
+    return len(set(types)) <= 1 or len(set(types)) == len(types)
+
+
+class Game:
+    """
+    A game between agents played without any prompts. The game state is always held from
+    the view of the player whose turn it is, so agents can be called exactly as in
+    __main__.getAgentTurn. Hands of all players are held by the game and swapped in as
+    the agent's cards each turn.
+
+    Attributes:
+        gameState (GameState): The state of the game.
+        agents (list[Agent]): The agent playing each player.
+        seed (int): Seed of the game.
+        rng (random.Random): Generator for the setup, the deck, battles and random agents.
+        battle (Callable): Resolves each attack, from the dice tables or exact dice.
+        deck (list[Card]): Cards left to draw, drawn from the end.
+        hands (dict): Cards held by each player.
+        turns (int): Turns played so far.
+        errors (list[int]): Turns each player lost to its agent raising an error.
+        failures (list[dict]): The player, round and traceback of every error raised by an agent.
+        turnSeconds (list[float]): Time each player's agent has spent choosing moves.
+        playerTurns (list[int]): Turns played by each player.
+        nodes (list[int]): Attack plans looked up by each player's agent.
+    """
+    def __init__(self, agents : list[Agent], seed : int, exactDice : bool = False, mapType : MapType = MapType.CLASSIC):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        # Unseeded random agents draw from the game's generator so games are repeatable
+        self.agents = [functools.partial(randAI, rng=self.rng) if agent is randAI else agent for agent in agents]
+        self.battle = functools.partial(blitz if exactDice else tableBlitz, rng=self.rng)
+
+        self.gameState = newGame(len(agents), self.rng, mapType)
+        self.deck = makeDeck(self.gameState.map, self.rng)
+        self.hands = {player: [] for player in range(len(agents))}
+        self.turns = 0
+        self.errors = [0] * len(agents)
+        self.failures = []
+        self.turnSeconds = [0.0] * len(agents)
+        self.playerTurns = [0] * len(agents)
+        self.nodes = [0] * len(agents)
+
+
+    def play(self, maxRounds : int = MAXROUNDS) -> GameResult:
+        """
+        Plays turns in order until a player has won or maxRounds rounds have been played.
+        """
+        start = time.perf_counter()
+        gameState = self.gameState
+
+        while gameState.round <= maxRounds:
+            for player in list(gameState.playersAlive):
+                # Players can be eliminated earlier in the round
+                if player not in gameState.playersAlive:
+                    continue
+                self.turns += 1
+                if self.playTurn(player):
+                    return self.result(player, gameState.round, start)
+            gameState.round += 1
+
+        return self.result(None, maxRounds, start)
+
+
+    def playTurn(self, player : int) -> bool:
+        """
+        Gets the move of a player from its agent and plays it. Returns whether the player won.
+        """
+        gameState = self.gameState
+        gameState.agentID = player
+        gameState.setHand(self.hands[player])
+
+        lookups = attackPlanCache.hits + attackPlanCache.misses
+        start = time.perf_counter()
+        try:
+            move = self.agents[player](gameState)
+        except Exception:
+            # The turn is lost rather than the game, but the failure is reported and kept
+            logger.exception("Agent of player %d failed in round %d of game %d", player, gameState.round, self.seed)
+            self.errors[player] += 1
+            self.failures.append({"player": player, "round": gameState.round, "error": traceback.format_exc()})
+            move = None
+        self.turnSeconds[player] += time.perf_counter() - start
+        self.playerTurns[player] += 1
+        self.nodes[player] += attackPlanCache.hits + attackPlanCache.misses - lookups
+
+        # Agents should undo their own searching, but a failed agent may not have
+        if gameState.checkpoints:
+            gameState.rollback(gameState.checkpoints[0])
+
+        (trades, placements), attacks, fortify = self.sanitise(move)
+        gameState.playerDict[player]["prevIncome"] = sum(troops for _, troops in placements)
+
+        owned = len(gameState.playerDict[player]["territories"])
+        alive = list(gameState.playersAlive)
+        gameState.apply(((trades, placements), attacks, None), self.battle)
+        gameState.commit()
+
+        # Traded cards go back under the deck
+        for trade in trades:
+            self.deck[:0] = trade
+
+        # Hands of eliminated players pass to the attacker
+        for eliminated in alive:
+            if eliminated not in gameState.playersAlive:
+                for card in self.hands[eliminated]:
+                    gameState.addCard(card)
+                self.hands[eliminated] = []
+                gameState.playerDict[eliminated]["cardsNum"] = 0
+
+        # A card is drawn for capturing at least one territory
+        if len(gameState.playerDict[player]["territories"]) > owned and self.deck:
+            gameState.addCard(self.deck.pop())
+        gameState.playerDict[player]["cardsNum"] = len(gameState.cards)
+        self.hands[player] = gameState.cards
+
+        if len(gameState.playersAlive) == 1:
+            return True
+
+        if fortify is not None:
+            self.fortify(player, fortify)
+        return False
+
+
+    def sanitise(self, move : Optional[Move]) -> Move:
+        """
+        Makes a move legal for the agent. Trades must be valid sets of cards in the hand and
+        placements must be on owned territories, with every troop drafted placed exactly once.
+        Attacks must be between neighbours, while the owners of each attack are checked as it
+        is made. A missing move drafts everything onto a random territory.
+        """
+        gameState = self.gameState
+        if move is None:
+            move = (([], []), [], None)
+        (trades, placements), attacks, fortify = move
+
+        hand = list(gameState.cards)
+        validTrades = []
+        for trade in trades:
+            if validTrade(trade) and all(trade.count(card) <= hand.count(card) for card in trade):
+                for card in trade:
+                    hand.remove(card)
+                validTrades.append(tuple(trade))
+
+        owned = gameState.playerDict[gameState.agentID]["territories"]
+        remaining = draftTroopsAmount(gameState, validTrades)
+        validPlacements = []
+        for terr, troops in placements:
+            if terr in owned and troops > 0 and remaining > 0:
+                validPlacements.append((terr, min(troops, remaining)))
+                remaining -= min(troops, remaining)
+
+        # Undrafted troops are added to the first placement, or a random territory
+        if remaining > 0:
+            terr = validPlacements[0][0] if validPlacements else self.rng.choice(sorted(owned))
+            validPlacements.append((terr, remaining))
+
+        neighbourMasks = gameState.map.index.neighbourMasks
+        validAttacks = [attack for attack in attacks if neighbourMasks[attack[0]] >> attack[1] & 1]
+
+        return ((validTrades, validPlacements), validAttacks, fortify)
+
+
+    def fortify(self, player : int, fortify : Fortify):
+        """
+        Makes a fortify if both territories are owned and connected through owned territories,
+        moving at most all but one troop.
+        """
+        gameState = self.gameState
+        fromTerr, toTerr, troops = fortify
+        owned = gameState.playerDict[player]["territories"]
+        if fromTerr == toTerr or fromTerr not in owned or toTerr not in owned:
+            return
+
+        troops = min(troops, int(gameState.board.troops[fromTerr]) - 1)
+        if troops > 0 and ownedTerrConnected(player, gameState, fromTerr, toTerr):
+            gameState.moveTroops(fromTerr, toTerr, troops)
+
+
+    def result(self, winner : Optional[int], rounds : int, start : float) -> GameResult:
+        gameState = self.gameState
+        return {"seed": self.seed, "winner": winner, "rounds": rounds, "turns": self.turns,
+                "territories": [len(gameState.playerDict[player]["territories"]) for player in range(len(self.agents))],
+                "errors": self.errors, "failures": self.failures, "turnSeconds": self.turnSeconds, "playerTurns": self.playerTurns,
+                "nodes": self.nodes, "seconds": time.perf_counter() - start}
+
+
+def playGame(agents : list[Agent], seed : int, exactDice : bool = False, maxRounds : int = MAXROUNDS,
+             mapType : MapType = MapType.CLASSIC) -> GameResult:
+    """
+    Plays a full game between agents, seated in the order given.
+    """
+    return Game(agents, seed, exactDice, mapType).play(maxRounds)
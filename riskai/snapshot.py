@@ -0,0 +1,128 @@
+# Saving and loading game states without prompts. A snapshot holds everything in
+# GameState.compact: the map type, the owner and troops of every territory, the players,
+# the agent's cards and the round. Snapshots are written either as JSON, to be read and
+# edited by hand, or as a compact binary form which restores in well under a millisecond,
+# for batch jobs working through thousands of positions.
+from .structures import *
+import json
+import struct
+import numpy as np
+
+
+# Version of both snapshot formats, bumped whenever either changes
+SNAPSHOTVERSION = 1
+
+# Start of every binary snapshot
+MAGIC = b"RSKS"
+
+# Magic, version, map type, agent ID, round, bitboard flag, board length and metadata length
+HEADER = struct.Struct("<4sHHiiBII")
+
+
+def playerData(playerDict : PlayerDict) -> dict:
+    """
+    Converts the player data into JSON values. Territories are left out as they are found
+    from the owners of the board when loaded.
+    """
+    return {str(player): {**{key: value for key, value in data.items() if key not in ("territories", "territoryMask")},
+                          "bonusesHeld": sorted(data["bonusesHeld"])}
+            for player, data in playerDict.items()}
+
+
+def playerDictOf(players : dict, owner : np.ndarray) -> PlayerDict:
+    """
+    Rebuilds the player data written by playerData, giving each player the territories it owns.
+    """
+    playerDict = {}
+    for player, data in players.items():
+        player = int(player)
+        playerDict[player] = {**data, "territories": set(np.flatnonzero(owner == player).tolist()),
+                              "bonusesHeld": set(data["bonusesHeld"])}
+    return playerDict
+
+
+def metadata(gameState : GameState) -> dict:
+    return {"players": playerData(gameState.playerDict), "playersAlive": gameState.playersAlive,
+            "relationsMatrix": gameState.relationsMatrix,
+            "cards": [(card.type.value, card.territory) for card in gameState.cards]}
+
+
+# ---------------------------- JSON ----------------------------
+
+def toJson(gameState : GameState) -> dict:
+    """
+    Gets the snapshot of a game state as JSON values. Owners and troops are listed by
+    territory ID, including the dummy territory 0.
+    """
+    return {"version": SNAPSHOTVERSION, "map": gameState.map.mapType.name.lower(), "agentID": gameState.agentID,
+            "round": gameState.round, "bitboard": gameState.bitboard, "owner": gameState.board.owner.tolist(),
+            "troops": gameState.board.troops.tolist(), **metadata(gameState)}
+
+
+def fromJson(data : dict) -> GameState:
+    """
+    Restores a game state from the JSON values written by toJson.
+    """
+    if data["version"] != SNAPSHOTVERSION:
+        raise ValueError(f"Unsupported snapshot version: {data['version']}")
+    owner = np.array(data["owner"], dtype=np.int32)
+    return GameState.fromCompact((MapType.from_str(data["map"]).value, data["agentID"], data["round"], owner,
+                                  np.array(data["troops"], dtype=np.int32), playerDictOf(data["players"], owner),
+                                  data["playersAlive"], data["relationsMatrix"], data["cards"], data["bitboard"]))
+
+
+# ---------------------------- Binary ----------------------------
+# A fixed header, then the owner and troops of every territory as int32 arrays, then the
+# players and cards as JSON. Only the header and arrays grow with the board.
+
+def pack(gameState : GameState) -> bytes:
+    """
+    Packs a game state into a binary snapshot.
+    """
+    meta = json.dumps(metadata(gameState), separators=(",", ":")).encode()
+    board = gameState.board
+    header = HEADER.pack(MAGIC, SNAPSHOTVERSION, gameState.map.mapType.value, gameState.agentID, gameState.round,
+                         gameState.bitboard, len(board.owner), len(meta))
+    return header + board.owner.astype("<i4").tobytes() + board.troops.astype("<i4").tobytes() + meta
+
+
+def unpack(data : bytes) -> GameState:
+    """
+    Restores a game state from a binary snapshot made by pack.
+    """
+    magic, version, mapType, agentID, round, bitboard, size, metaLength = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary snapshot")
+    if version != SNAPSHOTVERSION:
+        raise ValueError(f"Unsupported snapshot version: {version}")
+
+    arrays = np.frombuffer(data, dtype="<i4", count=2 * size, offset=HEADER.size)
+    owner, troops = arrays[:size], arrays[size:]
+    meta = json.loads(data[HEADER.size + 8 * size:HEADER.size + 8 * size + metaLength])
+    return GameState.fromCompact((mapType, agentID, round, owner, troops, playerDictOf(meta["players"], owner),
+                                  meta["playersAlive"], meta["relationsMatrix"], meta["cards"], bool(bitboard)))
+
+
+# ---------------------------- Files ----------------------------
+
+def saveSnapshot(gameState : GameState, path : str):
+    """
+    Saves a game state, as JSON if path ends in .json and as a binary snapshot otherwise.
+    """
+    if path.endswith(".json"):
+        with open(path, "w") as file:
+            json.dump(toJson(gameState), file, indent=1)
+    else:
+        with open(path, "wb") as file:
+            file.write(pack(gameState))
+
+
+def loadSnapshot(path : str) -> GameState:
+    """
+    Loads a game state saved by saveSnapshot.
+    """
+    if path.endswith(".json"):
+        with open(path) as file:
+            return fromJson(json.load(file))
+    with open(path, "rb") as file:
+        return unpack(file.read())
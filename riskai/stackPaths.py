@@ -0,0 +1,169 @@
+# Cheapest attacking paths from the agent's stacks. A single multi-source Dijkstra run over the
+# board finds, for every stack at once, the troops expected to be lost reaching each enemy
+# territory, so actions can price their targets from one cost matrix found once per turn
+# rather than searching the graph for every stack and target.
+from .structures import *
+from .dice import captureLoss
+from collections import OrderedDict
+import heapq
+import threading
+import numpy as np
+
+
+def stackSelect(gameState : GameState, player: int) -> Territories:
+    """
+    Generally, optimal play is to have a very high troop
+    density, with troops placement tending to be 1 in all internal and non-important territories, and
+    as high as possible for critical and mobile locations. Selects the territories which are considered
+    a "stack" with a significant amount of troops. This is both relative to the player and the game. Stacks
+    should have a significant % of the players troops, and it should also be considered in comparison to
+    other players totals. Beyond a certain point, say 10 troops these territories have significant mobility and attacking
+    power and should also be considered stacks.
+    """
+    # This defines a stack to have at least 10% of the player's total troops. Should and can be changed during testing.
+    totalTroopPercent = 10
+    percCutoff = gameState.playerDict[player]["troops"] // totalTroopPercent
+
+    # Any territories with more than 10 troops are considered stacks
+    largeStackSize = 10
+
+    board = gameState.board
+    stackMask = (board.owner == player) & ((board.troops >= percCutoff) | (board.troops >= largeStackSize))
+
+    return set(np.flatnonzero(stackMask).tolist())
+
+
+def captureWeights(board : Board, agentID : int) -> np.ndarray:
+    """
+    Troops expected to be spent capturing each territory, indexed by territory ID. This is the
+    attackers lost with perfect dice from the dice tables, plus the troop left behind on it.
+    Territories the agent owns are never captured so cost nothing.
+    """
+    weights = np.zeros(len(board.owner))
+    enemy = board.nodes[board.owner[board.nodes] != agentID]
+    weights[enemy] = [captureLoss(int(troops)) + 1 for troops in board.troops[enemy]]
+    return weights
+
+
+class StackPaths:
+    """
+    The cheapest path from every stack to every territory, where a path costs the weight of
+    every territory it enters. Paths may only enter enemy territories, matching the attacks
+    planned by SteinerGraph, so territories the agent owns other than the stacks are never
+    reached.
+
+    Attributes:
+        stacks (list[int]): Territories paths start from, in ascending order.
+        row (dict): Row of the cost matrix of each stack.
+        weights (np.ndarray): Cost of entering each territory.
+        costs (np.ndarray): Cost of the cheapest path from each stack, by row, to each territory,
+        and inf where there is no path.
+        predecessors (np.ndarray): Territory before each territory on the cheapest path from each
+        stack, and -1 for the stacks themselves and territories without a path.
+        nearest (np.ndarray): Cost of each territory from the closest stack.
+        closestStack (np.ndarray): The closest stack to each territory, and -1 where none reach.
+    """
+    def __init__(self, board : Board, agentID : int, stacks : Territories, weights : Optional[np.ndarray] = None):
+        self.stacks = sorted(stacks)
+        self.row = {stack: i for i, stack in enumerate(self.stacks)}
+        self.weights = captureWeights(board, agentID) if weights is None else np.asarray(weights, dtype=float)
+
+        size = len(board.owner)
+        costs = np.full((len(self.stacks), size), np.inf)
+        predecessors = np.full((len(self.stacks), size), -1, dtype=np.int64)
+
+        # Every stack is searched in the same run, each entry being labelled by the stack it is from
+        indptr, indices = board.indptr.tolist(), board.indices.tolist()
+        enemy = (board.owner != agentID).tolist()
+        weights = self.weights.tolist()
+        heap = [(0.0, i, stack) for i, stack in enumerate(self.stacks)]
+        costs[np.arange(len(self.stacks)), self.stacks] = 0
+        settled = set()
+        while heap:
+            cost, i, terr = heapq.heappop(heap)
+            if (i, terr) in settled:
+                continue
+            settled.add((i, terr))
+            for neighbour in indices[indptr[terr]:indptr[terr + 1]]:
+                if not enemy[neighbour]:
+                    continue
+                newCost = cost + weights[neighbour]
+                if newCost < costs[i, neighbour]:
+                    costs[i, neighbour] = newCost
+                    predecessors[i, neighbour] = terr
+                    heapq.heappush(heap, (newCost, i, neighbour))
+
+        self.costs = costs
+        self.predecessors = predecessors
+        if len(self.stacks):
+            self.nearest = costs.min(axis=0)
+            self.closestStack = np.where(self.nearest < np.inf, np.asarray(self.stacks)[costs.argmin(axis=0)], -1)
+        else:
+            self.nearest = np.full(size, np.inf)
+            self.closestStack = np.full(size, -1)
+
+
+    def path(self, stack : int, terr : int) -> Optional[list[int]]:
+        """
+        Gets the territories on the cheapest path from stack to terr, including both, or None
+        if there is no path.
+        """
+        i = self.row[stack]
+        if self.costs[i, terr] == np.inf:
+            return None
+        path = [terr]
+        while path[-1] != stack:
+            path.append(int(self.predecessors[i, path[-1]]))
+        return path[::-1]
+
+
+    def reachable(self, territories : Territories) -> bool:
+        """
+        Whether every territory can be reached from some stack.
+        """
+        return all(self.nearest[terr] < np.inf for terr in territories)
+
+
+    def cheapest(self, territories : Territories) -> Optional[int]:
+        """
+        Gets the territory closest to any stack, with ties going to the lowest territory ID, or
+        None if no stack reaches any of them.
+        """
+        ordered = sorted(territories)
+        if len(ordered) == 0:
+            return None
+        terr = ordered[int(np.argmin(self.nearest[ordered]))]
+        return terr if self.nearest[terr] < np.inf else None
+
+
+
+stackPathsCache = OrderedDict()
+
+# Guards the stack paths cache, as searches may run on several threads at once
+stackPathsLock = threading.Lock()
+
+# Most boards with stack paths held
+STACKPATHSCACHESIZE = 64
+
+
+def stackPathsCached(gameState : GameState) -> StackPaths:
+    """
+    Gets the paths from the agent's stacks on the board, finding them on first use. Stacks 
+    depend on the agent's troop total in playerDict as well as the board, so they are part 
+    of the key.
+    """
+    stacks = frozenset(stackSelect(gameState, gameState.agentID))
+    key = (gameState.positionKey, stacks)
+    with stackPathsLock:
+        stackPaths = stackPathsCache.get(key)
+        if stackPaths is not None:
+            stackPathsCache.move_to_end(key)
+            return stackPaths
+
+    # Found outside the lock so other threads are not held up
+    stackPaths = StackPaths(gameState.board, gameState.agentID, stacks)
+    with stackPathsLock:
+        stackPathsCache[key] = stackPaths
+        if len(stackPathsCache) > STACKPATHSCACHESIZE:
+            stackPathsCache.popitem(last=False)
+    return stackPaths
@@ -0,0 +1,281 @@
+# Node weighted Steiner arborescences for planning attacks. Capturing a set of targets from a
+# stack means finding the cheapest tree of territories rooted at the stack which reaches every
+# target, where the cost of the tree is the weight of every territory it enters. Small target
+# sets are solved exactly by the Dreyfus-Wagner dynamic program over subsets of targets, and
+# larger ones by repeatedly joining the closest target to the tree.
+from .structures import *
+from typing import Dict
+import functools
+import numpy as np
+
+
+# Most targets solved exactly, the exact program grows with 3 to the power of the targets
+EXACTTARGETS = 10
+
+
+@functools.cache
+def submasks(size : int) -> list[np.ndarray]:
+    """
+    For every subset of size targets as a bitmask, the array of its proper non-empty subsets
+    holding its lowest target, so that every split of the subset in two appears once.
+    """
+    splits = [np.zeros(0, dtype=np.int64)]
+    for subset in range(1, 1 << size):
+        lowest = subset & -subset
+        rest = subset ^ lowest
+        # Walks every submask of the rest, adding the lowest target back to each
+        subs = []
+        sub = rest
+        while sub:
+            subs.append(sub | lowest)
+            sub = (sub - 1) & rest
+        if rest:
+            subs.append(lowest)
+        # The subset itself is not a split of the subset
+        splits.append(np.array([sub for sub in subs if sub != subset], dtype=np.int64))
+    return splits
+
+
+class SteinerGraph:
+    """
+    The territories an agent could attack through, with the cheapest path between every pair.
+    Enemy territories can be entered from any neighbour, while the roots, being the agent's
+    stacks, can only be left, so no path passes through a territory the agent owns. Paths are
+    found once for a board so every target set planned on it reuses them.
+
+    Attributes:
+        nodes (np.ndarray): Territory of each local index, the enemy territories then the roots.
+        local (dict): Local index of each territory.
+        roots (list[int]): Territories attacks may start from.
+        weights (np.ndarray): Cost of entering each local node.
+        costs (np.ndarray): Cost of the cheapest path between every pair of local nodes, being the
+        weights of every node entered, and inf where there is no path.
+        nextHop (np.ndarray): The node after the first on each cheapest path.
+    """
+    def __init__(self, board : Board, agentID : int, roots : Territories, weights : Optional[np.ndarray] = None):
+        enemy = board.nodes[board.owner[board.nodes] != agentID]
+        self.roots = sorted(roots)
+        self.nodes = np.concatenate((enemy, np.array(self.roots, dtype=enemy.dtype))).astype(np.int64)
+        self.local = {int(terr): i for i, terr in enumerate(self.nodes)}
+        size = len(self.nodes)
+
+        # Territories cost their troops to enter unless weighted otherwise
+        weights = board.troops if weights is None else weights
+        self.weights = np.asarray(weights, dtype=float)[self.nodes]
+
+        # Only edges into enemy territories can be crossed
+        localOf = np.full(len(board.owner), -1)
+        localOf[self.nodes] = np.arange(size)
+        fromNodes, toNodes = localOf[board.rows], localOf[board.indices]
+        arcs = (fromNodes >= 0) & (toNodes >= 0) & (toNodes < len(enemy))
+
+        costs = np.full((size, size), np.inf)
+        costs[fromNodes[arcs], toNodes[arcs]] = self.weights[toNodes[arcs]]
+        np.fill_diagonal(costs, 0)
+        nextHop = np.tile(np.arange(size), (size, 1))
+
+        # Floyd-Warshall, relaxing every pair through each node at once
+        for via in range(size):
+            through = costs[:, via, None] + costs[None, via, :]
+            shorter = through < costs
+            costs = np.where(shorter, through, costs)
+            nextHop = np.where(shorter, nextHop[:, via, None], nextHop)
+
+        self.costs = costs
+        self.nextHop = nextHop
+
+
+    def path(self, start : int, end : int) -> list[int]:
+        """
+        Gets the local nodes of the cheapest path from start to end, including both.
+        """
+        path = [start]
+        while path[-1] != end:
+            path.append(int(self.nextHop[path[-1], end]))
+        return path
+
+
+    def terminalsOf(self, targets : Territories) -> Optional[list[int]]:
+        """
+        Gets the local nodes of the targets, or None if any cannot be attacked.
+        """
+        enemyCount = len(self.nodes) - len(self.roots)
+        if any(target not in self.local or self.local[target] >= enemyCount for target in targets):
+            return None
+        return [self.local[target] for target in sorted(targets)]
+
+
+    def toTree(self, edges : list[Tuple[int, int]], root : int) -> nx.DiGraph:
+        """
+        Builds the tree of territories from edges between local nodes.
+        """
+        tree = nx.DiGraph()
+        tree.add_node(int(self.nodes[root]))
+        for u, v in edges:
+            # A node reached twice at equal cost keeps its first parent so the tree stays an arborescence
+            if not tree.has_node(int(self.nodes[v])):
+                tree.add_edge(int(self.nodes[u]), int(self.nodes[v]))
+        return tree
+
+
+    def arborescence(self, targets : Territories) -> Optional[Tuple[nx.DiGraph, int, float]]:
+        """
+        Gets the cheapest tree capturing every target from any root, the root it is from and its
+        cost. Returns None if no root can reach every target.
+        """
+        terminals = self.terminalsOf(targets)
+        if terminals is None or len(self.roots) == 0:
+            return None
+
+        rootIndices = list(range(len(self.nodes) - len(self.roots), len(self.nodes)))
+        if len(terminals) <= EXACTTARGETS:
+            best, joins, extends = self.dreyfusWagner(terminals)
+            full = (1 << len(terminals)) - 1
+            root = rootIndices[int(best[full, rootIndices].argmin())]
+            cost = float(best[full, root])
+            edges = self.treeEdges(joins, extends, [(full, root)]) if cost < np.inf else []
+        else:
+            (edges, cost), root = min(((self.closestTargets(terminals, [root]), root) for root in rootIndices),
+                                      key=lambda result: result[0][1])
+        if cost == np.inf:
+            return None
+        return (self.toTree(edges, root), int(self.nodes[root]), float(cost))
+
+
+    def forest(self, targets : Territories, roots : Optional[Territories] = None) -> Optional[Tuple[Dict[int, nx.DiGraph], float]]:
+        """
+        Gets the cheapest set of trees from any of the roots which together capture every target,
+        with each tree keyed by its root, and their total cost. This is the Steiner arborescence
+        from a super source joined to every root at no cost, so each target is attacked from
+        whichever root makes the whole plan cheapest. Returns None if the targets cannot all be
+        reached.
+        """
+        terminals = self.terminalsOf(targets)
+        rootIndices = [self.local[root] for root in sorted(roots if roots is not None else self.roots) if root in self.local]
+        if terminals is None or len(rootIndices) == 0:
+            return None
+
+        if len(terminals) <= EXACTTARGETS:
+            best, joins, extends = self.dreyfusWagner(terminals)
+            # Cost of reaching each node from the closest root
+            fromRoots = self.costs[rootIndices]
+            closestRoot = np.asarray(rootIndices)[fromRoots.argmin(axis=0)]
+            sourceCosts = fromRoots.min(axis=0)
+
+            # Cheapest forest over each subset, either one tree from the best root or two forests
+            forests = np.full(len(best), np.inf)
+            choices = [None] * len(best)
+            splits = submasks(len(terminals))
+            for subset in range(1, len(best)):
+                node = int((sourceCosts + best[subset]).argmin())
+                forests[subset], choices[subset] = sourceCosts[node] + best[subset, node], node
+                if len(splits[subset]):
+                    options = forests[splits[subset]] + forests[subset ^ splits[subset]]
+                    if options.min() < forests[subset]:
+                        sub = int(splits[subset][options.argmin()])
+                        forests[subset], choices[subset] = options.min(), (sub,)
+
+            full = len(best) - 1
+            cost = float(forests[full])
+            if cost == np.inf:
+                return None
+
+            # Each tree runs from its root along the cheapest path to where it branches
+            edges, pending = {}, [full]
+            while pending:
+                subset = pending.pop()
+                if isinstance(choices[subset], tuple):
+                    pending += [choices[subset][0], subset ^ choices[subset][0]]
+                    continue
+                node = choices[subset]
+                root = int(closestRoot[node])
+                path = self.path(root, node)
+                edges.setdefault(root, [])
+                edges[root] += list(zip(path, path[1:])) + self.treeEdges(joins, extends, [(subset, node)])
+        else:
+            treeEdges, cost = self.closestTargets(terminals, rootIndices)
+            if cost == np.inf:
+                return None
+            # Edges are joined in order from the tree, so every edge's root is its parent's root
+            rootOf = {root: root for root in rootIndices}
+            edges = {}
+            for u, v in treeEdges:
+                rootOf[v] = rootOf[u]
+                edges.setdefault(rootOf[u], []).append((u, v))
+
+        trees = {int(self.nodes[root]): self.toTree(rootEdges, root) for root, rootEdges in edges.items() if rootEdges}
+        return (trees, cost)
+
+
+    def dreyfusWagner(self, terminals : list[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Exact cheapest trees over subsets of the terminals. best[subset][v] is the cheapest tree
+        from v over the terminals in subset, not counting v itself. Each subset is first joined at
+        every node from two smaller subsets, recorded in joins, then extended along the cheapest
+        path from every node, recorded in extends.
+        """
+        size = len(self.nodes)
+        subsets = 1 << len(terminals)
+        best = np.full((subsets, size), np.inf)
+        joins = np.zeros((subsets, size), dtype=np.int64)
+        extends = np.zeros((subsets, size), dtype=np.int64)
+        splits = submasks(len(terminals))
+
+        for subset in range(1, subsets):
+            if subset & (subset - 1) == 0:
+                joined = np.full(size, np.inf)
+                joined[terminals[subset.bit_length() - 1]] = 0
+            else:
+                subs = splits[subset]
+                options = best[subs] + best[subset ^ subs]
+                choice = options.argmin(axis=0)
+                joined = options[choice, np.arange(size)]
+                joins[subset] = subs[choice]
+
+            extended = self.costs + joined[None, :]
+            extends[subset] = extended.argmin(axis=1)
+            best[subset] = extended[np.arange(size), extends[subset]]
+
+        return (best, joins, extends)
+
+
+    def treeEdges(self, joins : np.ndarray, extends : np.ndarray, pending : list[Tuple[int, int]]) -> list[Tuple[int, int]]:
+        """
+        Follows the choices of the Dreyfus-Wagner program from each (subset, node) to get the
+        edges of the trees, as local nodes.
+        """
+        edges = []
+        while pending:
+            subset, node = pending.pop()
+            joinedAt = int(extends[subset, node])
+            path = self.path(node, joinedAt)
+            edges += list(zip(path, path[1:]))
+            if subset & (subset - 1):
+                sub = int(joins[subset, joinedAt])
+                pending += [(sub, joinedAt), (subset ^ sub, joinedAt)]
+        return edges
+
+
+    def closestTargets(self, terminals : list[int], sources : list[int]) -> Tuple[list[Tuple[int, int]], float]:
+        """
+        Heuristic tree for many terminals. Starting from the sources, the closest terminal to the
+        tree is joined along its cheapest path until all are joined. Returns the edges in the
+        order they were joined and the cost.
+        """
+        inTree = np.zeros(len(self.nodes), dtype=bool)
+        inTree[sources] = True
+        remaining = list(terminals)
+        edges, cost = [], 0.0
+        while remaining:
+            joinCosts = self.costs[inTree][:, remaining]
+            fromIndex, targetIndex = np.unravel_index(joinCosts.argmin(), joinCosts.shape)
+            if joinCosts[fromIndex, targetIndex] == np.inf:
+                return ([], np.inf)
+            path = self.path(int(np.flatnonzero(inTree)[fromIndex]), remaining.pop(targetIndex))
+            # Nodes already in the tree along the path are not paid for again
+            for u, v in zip(path, path[1:]):
+                if not inTree[v]:
+                    edges.append((u, v))
+                    cost += self.weights[v]
+                    inTree[v] = True
+        return (edges, cost)
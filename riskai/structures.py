@@ -2,8 +2,13 @@
 
 import networkx as nx
 from enum import Enum
-from typing import Optional, Tuple, TypeAlias, TypedDict, List, Set
+from typing import Optional, Tuple, TypeAlias, TypedDict, List, Set, Callable
 from maps.mapStructures import Map, MapType
+from maps.mapIndex import toMask
+from .board import Board, handTable
+import copy
+import functools
+import numpy as np
 
 
 class CardType(Enum):
@@ -44,6 +49,15 @@ class Card:
     def __init__(self, type : CardType, territory : int):
         self.type = type
         self.territory = territory
+        
+    # Cards are compared by value so that cards rebuilt in another process still match the hand
+    def __eq__(self, other):
+        if not isinstance(other, Card):
+            return False
+        return self.type == other.type and self.territory == other.territory
+    
+    def __hash__(self):
+        return hash((self.type, self.territory))
 
 
 Cards: TypeAlias = Set[Card]
@@ -87,6 +101,10 @@ ints in tuple are structured as (territoryID from, territoryID to, amount of tro
 
 
 
+# Position of each card type in the Zobrist card keys
+CARDINDEX = {cardType: i for i, cardType in enumerate(CardType)}
+
+
 Move: TypeAlias = Tuple[Draft, Attack, Fortify]
 """
 Represents a full turn which a player should take. Will be the output of the AI agent.
@@ -129,6 +147,9 @@ class PlayerDict(TypedDict):
         
         bonusesHeld Set[str]: The bonuses held by the player. String is ID for the bonus. 
         
+        territoryMask (int): Only present in bitboard mode. Bitmask of the territories held by the
+        player, with bit n set if territory n is owned.
+        
         cardsNum (int): amount of cards held by the player.
         
         dangerLevel (int): An overall measure of how dangerous the player is to the AI.
@@ -141,6 +162,7 @@ class PlayerDict(TypedDict):
     territoryAggression: int
     bonusAggression: int
     bonusesHeld: Set[str]
+    territoryMask: int
     prevIncome: int
     cardsNum: int
     dangerLevel: int # @For later expansion
@@ -157,6 +179,17 @@ x == y are irrelevant and will be 0.
 
 
 
+@functools.cache
+def mapTemplate(mapType : MapType) -> Tuple[Map, Board]:
+    """
+    A map of each type with its board, built once and shared by every game state restored 
+    with fromCompact. Only their static data is used, so neither is ever modified. 
+    """
+    map = Map(mapType)
+    return (map, Board.fromGraph(map.graph))
+
+
+
 # !note: Currently the user player is has data stored exactly the same as all other players, 
 # with a simple differentiation to decide 
 class GameState:
@@ -172,8 +205,13 @@ class GameState:
         decision making
         relationsMatrix (RelationShipMatrix): A matrix holding the relationships between all players
         cards (Cards): A list of cards held by the user player 
+        board (Board): Array representation of territory owners and troops. The node attributes 
+        "troops" and "player" of map.graph are views onto this board.
+        bitboard (bool): Whether player territories are also held as bitmasks, with held bonuses 
+        maintained incrementally on each capture.
+        bonusOwner (dict): Only used in bitboard mode. Maps each fully held bonus to its owner.
     """
-    def __init__(self, map: Map, agentID: int, round : int, playerDict : PlayerDict, playersAlive : list[int], relationsMatrix : RelationShipMatrix, cards : Cards):
+    def __init__(self, map: Map, agentID: int, round : int, playerDict : PlayerDict, playersAlive : list[int], relationsMatrix : RelationShipMatrix, cards : Cards, bitboard : bool = False):
         self.map = map
         self.agentID = agentID
         self.round = round
@@ -181,3 +219,431 @@ class GameState:
         self.playersAlive = playersAlive
         self.relationsMatrix = relationsMatrix # @Currently unimplemented
         self.cards = cards       
+        
+        # Board arrays become the single source of truth for troops and owners, with the 
+        # graph node attributes redirected to them.
+        self.board = Board.fromGraph(map.graph)
+        self.board.attach(map.graph)
+        
+        self.bitboard = False
+        self.bonusOwner = {}
+        if bitboard:
+            self.enableBitboard()
+            
+        # Undo journal of changes made while a checkpoint is open, and the journal
+        # position of every open checkpoint
+        self.journal = []
+        self.checkpoints = []
+        
+        self.handHash = sum(self.cardKey(card) for card in cards) % 2**64
+            
+            
+    def enableBitboard(self):
+        """
+        Switches on bitboard mode. Builds the territory mask of every player and recomputes 
+        held bonuses from the masks, after which captureTerritory keeps both up to date. 
+        """
+        bonusMasks = self.map.index.bonusMasks
+        self.bonusOwner = {}
+        
+        for player, data in self.playerDict.items():
+            data["territoryMask"] = toMask(data["territories"])
+            data["bonusesHeld"] = {bonus for bonus, mask in bonusMasks.items() if data["territoryMask"] & mask == mask}
+            for bonus in data["bonusesHeld"]:
+                self.bonusOwner[bonus] = player
+                
+        self.bitboard = True
+        
+        
+    def captureTerritory(self, terr : int, player : int, troops : int):
+        """
+        Transfers a territory to player with the given amount of troops on it, updating the 
+        territory sets and bonuses of the previous and new owner. Player troop totals are left 
+        to the caller as they depend on the losses of the attack. 
+        """
+        prevOwner = int(self.board.owner[terr])
+        bonus = self.map.index.bonusOf[terr]
+        
+        if self.checkpoints:
+            self.journal.append(("capture", terr, prevOwner, int(self.board.troops[terr]), player,
+                                 bonus in self.playerDict[prevOwner]["bonusesHeld"], 
+                                 bonus in self.playerDict[player]["bonusesHeld"], self.bonusOwner.get(bonus)))
+        
+        self.board.setOwner(terr, player)
+        self.board.setTroops(terr, troops)
+        
+        self.playerDict[prevOwner]["territories"].discard(terr)
+        self.playerDict[player]["territories"].add(terr)
+        
+        # Previous owner must have lost the bonus of the territory
+        self.playerDict[prevOwner]["bonusesHeld"].discard(bonus)
+        
+        if self.bitboard:
+            bit = 1 << terr
+            self.playerDict[prevOwner]["territoryMask"] &= ~bit
+            self.playerDict[player]["territoryMask"] |= bit
+            
+            if self.bonusOwner.get(bonus) == prevOwner:
+                del self.bonusOwner[bonus]
+                
+            # Only the bonus of the captured territory can have been completed
+            bonusMask = self.map.index.bonusMasks[bonus]
+            if self.playerDict[player]["territoryMask"] & bonusMask == bonusMask:
+                self.playerDict[player]["bonusesHeld"].add(bonus)
+                self.bonusOwner[bonus] = player
+                
+        elif self.map.bonuses[bonus]["territories"].issubset(self.playerDict[player]["territories"]):
+            self.playerDict[player]["bonusesHeld"].add(bonus)
+        
+        
+    def cardKey(self, card : Card) -> int:
+        """
+        Gets the Zobrist key of a card. Wild cards have no territory so share territory 0.
+        """
+        return handTable(len(self.board.owner))[card.territory or 0][CARDINDEX[card.type]]
+    
+    
+    @property
+    def zobrist(self) -> int:
+        """
+        Zobrist hash of the position from the agent's view: territory owners and troop buckets, the 
+        agent's hand and which player the agent is. The board part is updated in O(1) on every troop 
+        change or capture, and the hand part on every card added or removed with addCard/removeCard. 
+        Hand keys are summed rather than XORed so that duplicate wild cards do not cancel out. 
+        """
+        return self.board.hash ^ self.handHash ^ handTable(len(self.board.owner))[-1][self.agentID]
+
+
+    @property
+    def positionKey(self) -> Tuple[bytes, tuple, int]:
+        """
+        Exact key of the position from the agent's view, for caches which must only match the
+        same position: the owner and troops of every territory, the agent's hand and which player
+        the agent is. Unlike zobrist, large troop counts are not bucketed, so it is not updated
+        incrementally and is found from the board each time.
+        """
+        hand = tuple(sorted((CARDINDEX[card.type], card.territory or 0) for card in self.cards))
+        return (self.board.owner.tobytes() + self.board.troops.tobytes(), hand, self.agentID)
+
+    
+    # ---------------------------- Undo journal ----------------------------
+    # Mutations made through the methods below are recorded while a checkpoint is open, 
+    # so that a search can explore a hypothetical move and return to the root state 
+    # without copying it. 
+    
+    def checkpoint(self) -> int:
+        """
+        Opens a checkpoint which the state can later be rolled back to. Returns the journal
+        position to pass to rollback.
+        """
+        mark = len(self.journal)
+        self.checkpoints.append(mark)
+        return mark
+    
+    
+    def commit(self):
+        """
+        Closes the most recent checkpoint keeping its changes, such as one opened by apply when 
+        a move is actually played. The journal is emptied once no checkpoints remain open.
+        """
+        self.checkpoints.pop()
+        if not self.checkpoints:
+            self.journal.clear()
+            
+            
+    def rollback(self, mark : int):
+        """
+        Reverts every journalled change made since the checkpoint at mark, closing it and any
+        checkpoints opened after it.
+        """
+        while len(self.journal) > mark:
+            self.undoEntry(self.journal.pop())
+            
+        while self.checkpoints and self.checkpoints[-1] >= mark:
+            self.checkpoints.pop()
+            
+            
+    def undoEntry(self, entry : tuple):
+        """
+        Reverts a single journal entry.
+        """
+        match entry[0]:
+            case "troops":
+                _, terr, troops = entry
+                self.board.setTroops(terr, troops)
+            case "playerTroops":
+                _, player, troops = entry
+                self.playerDict[player]["troops"] = troops
+            case "cardsNum":
+                _, player, cardsNum = entry
+                self.playerDict[player]["cardsNum"] = cardsNum
+            case "removeCard":
+                _, card, position = entry
+                self.cards.insert(position, card)
+                self.handHash = (self.handHash + self.cardKey(card)) % 2**64
+            case "addCard":
+                self.cards.pop()
+                self.handHash = (self.handHash - self.cardKey(entry[1])) % 2**64
+            case "eliminate":
+                _, player, position = entry
+                self.playersAlive.insert(position, player)
+            case "capture":
+                _, terr, prevOwner, troops, player, prevHeld, playerHeld, bonusOwner = entry
+                bonus = self.map.index.bonusOf[terr]
+                self.board.setOwner(terr, prevOwner)
+                self.board.setTroops(terr, troops)
+                
+                self.playerDict[player]["territories"].discard(terr)
+                self.playerDict[prevOwner]["territories"].add(terr)
+                if self.bitboard:
+                    self.playerDict[player]["territoryMask"] &= ~(1 << terr)
+                    self.playerDict[prevOwner]["territoryMask"] |= 1 << terr
+                    
+                if not playerHeld:
+                    self.playerDict[player]["bonusesHeld"].discard(bonus)
+                if prevHeld:
+                    self.playerDict[prevOwner]["bonusesHeld"].add(bonus)
+                    
+                if bonusOwner is None:
+                    self.bonusOwner.pop(bonus, None)
+                else:
+                    self.bonusOwner[bonus] = bonusOwner
+            case _:
+                raise ValueError(f"Invalid journal entry {entry[0]}")
+            
+            
+    def addTroops(self, terr : int, troops : int):
+        """
+        Adds troops to a territory, which can be negative, and to the total of its owner.
+        """
+        player = int(self.board.owner[terr])
+        if self.checkpoints:
+            self.journal.append(("troops", terr, int(self.board.troops[terr])))
+        self.board.setTroops(terr, int(self.board.troops[terr]) + troops)
+        self.addPlayerTroops(player, troops)
+        
+        
+    def setTroops(self, terr : int, troops : int):
+        """
+        Sets the troops on a territory without changing the total of its owner.
+        """
+        if self.checkpoints:
+            self.journal.append(("troops", terr, int(self.board.troops[terr])))
+        self.board.setTroops(terr, troops)
+        
+        
+    def addPlayerTroops(self, player : int, troops : int):
+        """
+        Adds troops to the total of a player without placing them on a territory.
+        """
+        if self.checkpoints:
+            self.journal.append(("playerTroops", player, self.playerDict[player]["troops"]))
+        self.playerDict[player]["troops"] += troops
+        
+        
+    def moveTroops(self, fromTerr : int, toTerr : int, troops : int):
+        """
+        Moves troops between two territories of the same player.
+        """
+        if self.checkpoints:
+            self.journal.append(("troops", fromTerr, int(self.board.troops[fromTerr])))
+            self.journal.append(("troops", toTerr, int(self.board.troops[toTerr])))
+        self.board.setTroops(fromTerr, int(self.board.troops[fromTerr]) - troops)
+        self.board.setTroops(toTerr, int(self.board.troops[toTerr]) + troops)
+        
+        
+    def removeCard(self, card : Card):
+        """
+        Removes a card from the agent's hand.
+        """
+        position = self.cards.index(card)
+        if self.checkpoints:
+            self.journal.append(("removeCard", card, position))
+        del self.cards[position]
+        self.handHash = (self.handHash - self.cardKey(card)) % 2**64
+        
+        
+    def addCard(self, card : Card):
+        """
+        Adds a card to the agent's hand.
+        """
+        if self.checkpoints:
+            self.journal.append(("addCard", card))
+        self.cards.append(card)
+        self.handHash = (self.handHash + self.cardKey(card)) % 2**64
+        
+        
+    def setHand(self, cards : list[Card]):
+        """
+        Replaces the agent's hand, such as when a different player takes over as the agent.
+        """
+        self.cards = cards
+        self.handHash = sum(self.cardKey(card) for card in cards) % 2**64
+        
+        
+    def addCardsNum(self, player : int, cards : int):
+        """
+        Changes the amount of cards a player is known to hold.
+        """
+        if self.checkpoints:
+            self.journal.append(("cardsNum", player, self.playerDict[player]["cardsNum"]))
+        self.playerDict[player]["cardsNum"] += cards
+        
+        
+    def eliminatePlayer(self, player : int):
+        """
+        Removes a player from the alive players.
+        """
+        position = self.playersAlive.index(player)
+        if self.checkpoints:
+            self.journal.append(("eliminate", player, position))
+        del self.playersAlive[position]
+        
+        
+    def apply(self, move : Move, battle : Optional[Callable[[int, int], Tuple[int, int]]] = None) -> list[int]:
+        """
+        Applies a full move of the agent to the state under a new checkpoint, which undo reverts. 
+        By default attacks are assumed to succeed without attacking losses, moving the requested troops 
+        (limited to all but one) as graphToAttack plans them. If battle is given, each attack is instead 
+        resolved by calling it with the attackers able to roll and the defenders, such as dice.blitz with 
+        a random generator bound, which returns the attackers and defenders remaining. Returns the 
+        territories whose owner or troops changed.
+        """
+        self.checkpoint()
+        draft, attack, fortify = move
+        changed = []
+        
+        tradeList, placements = draft
+        for trade in tradeList:
+            for card in trade:
+                self.removeCard(card)
+            self.addCardsNum(self.agentID, -3)
+            # Only a single owned card territory gives its +2 bonus per trade
+            for card in trade:
+                if card.territory in self.playerDict[self.agentID]["territories"]:
+                    self.addTroops(card.territory, 2)
+                    changed.append(card.territory)
+                    break
+                
+        for terr, troops in placements:
+            self.addTroops(terr, troops)
+            changed.append(terr)
+            
+        for fromTerr, toTerr, _, moved in attack:
+            # Attack cannot be made if the territory was not taken or has no troops left
+            if self.board.owner[fromTerr] != self.agentID or self.board.owner[toTerr] == self.agentID or self.board.troops[fromTerr] <= 1:
+                continue
+            
+            defender = int(self.board.owner[toTerr])
+            attacking, defending = int(self.board.troops[fromTerr]) - 1, int(self.board.troops[toTerr])
+            if battle is None:
+                attRemaining, defRemaining = attacking, 0
+            else:
+                attRemaining, defRemaining = battle(attacking, defending)
+                
+            self.addTroops(fromTerr, attRemaining - attacking)
+            self.addTroops(toTerr, defRemaining - defending)
+            changed += [fromTerr, toTerr]
+            
+            # A failed attack leaves the territory with the defender, so attacks onward from it are skipped
+            if defRemaining > 0:
+                continue
+            
+            moved = min(max(moved, 1), attRemaining)
+            self.setTroops(fromTerr, int(self.board.troops[fromTerr]) - moved)
+            self.captureTerritory(toTerr, self.agentID, moved)
+            
+            # Cards of eliminated players are passed to the attacker
+            if len(self.playerDict[defender]["territories"]) == 0 and defender in self.playersAlive:
+                self.addCardsNum(self.agentID, self.playerDict[defender]["cardsNum"])
+                self.eliminatePlayer(defender)
+                
+        # Moved troops stay with the agent so its total is unchanged
+        if fortify is not None:
+            fromTerr, toTerr, troops = fortify
+            self.moveTroops(fromTerr, toTerr, troops)
+            changed += [fromTerr, toTerr]
+            
+        return changed
+    
+    
+    def undo(self):
+        """
+        Reverts the most recent checkpoint, such as one opened by apply.
+        """
+        self.rollback(self.checkpoints[-1])
+        
+        
+    def copy(self) -> "GameState":
+        """
+        Creates an independent copy of the game state for searching over. Board arrays and 
+        player data are copied, while static map data (adjacency, bonuses, names) is shared.
+        """
+        newState = GameState.__new__(GameState)
+        newState.board = self.board.copy()
+        
+        # Map is shallow copied with a graph bound to the new board
+        newState.map = copy.copy(self.map)
+        newState.map.graph = newState.board.bindGraph(self.map.graph)
+        
+        newState.agentID = self.agentID
+        newState.round = self.round
+        newState.playerDict = {
+            player: {**data, "territories": set(data["territories"]), "bonusesHeld": set(data["bonusesHeld"])}
+            for player, data in self.playerDict.items()
+        }
+        newState.playersAlive = list(self.playersAlive)
+        newState.relationsMatrix = self.relationsMatrix
+        newState.cards = copy.copy(self.cards)
+        newState.handHash = self.handHash
+        newState.bitboard = self.bitboard
+        newState.bonusOwner = dict(self.bonusOwner)
+        # Copies start with a fresh journal
+        newState.journal = []
+        newState.checkpoints = []
+        return newState
+    
+    
+    def compact(self) -> tuple:
+        """
+        Packs the game state into plain values and arrays which are cheap to pickle, for 
+        sending to other processes. The map is sent as its type and rebuilt on the other side. 
+        """
+        return (self.map.mapType.value, self.agentID, self.round, self.board.owner, self.board.troops, 
+                self.playerDict, self.playersAlive, self.relationsMatrix, 
+                [(card.type.value, card.territory) for card in self.cards], self.bitboard)
+    
+    
+    @classmethod
+    def fromCompact(cls, data : tuple) -> "GameState":
+        """
+        Rebuilds a game state packed by compact. Rather than building the map again, the shared 
+        map of its type is bound to a copy of its board, as in copy, so restoring is cheap enough 
+        to do for thousands of positions. 
+        """
+        mapType, agentID, round, owner, troops, playerDict, playersAlive, relationsMatrix, cards, bitboard = data
+        
+        map, board = mapTemplate(MapType(mapType))
+        newState = cls.__new__(cls)
+        newState.board = board.copy()
+        newState.board.owner[:] = owner
+        newState.board.troops[:] = troops
+        newState.board.hash = newState.board.computeHash()
+        
+        newState.map = copy.copy(map)
+        newState.map.graph = newState.board.bindGraph(map.graph)
+        
+        newState.agentID = agentID
+        newState.round = round
+        newState.playerDict = playerDict
+        newState.playersAlive = playersAlive
+        newState.relationsMatrix = relationsMatrix
+        newState.cards = [Card(CardType(cardType), territory) for cardType, territory in cards]
+        newState.bitboard = False
+        newState.bonusOwner = {}
+        if bitboard:
+            newState.enableBitboard()
+        newState.journal = []
+        newState.checkpoints = []
+        newState.handHash = sum(newState.cardKey(card) for card in newState.cards) % 2**64
+        return newState
@@ -0,0 +1,198 @@
+# Runs large batches of headless games between agents across processes, streaming the
+# result of every game to a file and summarising win rates as games finish.
+from .simulate import playGame, makeAgent, MAXROUNDS
+from maps.mapStructures import MapType
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional, TypedDict
+import contextlib
+import io
+import json
+import math
+import os
+import time
+import click
+
+
+# Normal quantile of the 95% confidence intervals reported for win rates
+CONFIDENCEZ = 1.96
+
+
+class Match(TypedDict):
+    """
+    A single game to be played in a tournament.
+
+    Attributes:
+        seed (int): Seed of the game.
+        agents (list[str]): Name of the agent in each seat, in turn order.
+        map (str): Name of the MapType to play on.
+        exactDice (bool): Whether battles roll exact dice rather than sampling the dice tables.
+        timeConstraint (float): Seconds searching agents are given per turn.
+        maxRounds (int): Rounds after which the game is drawn.
+    """
+    seed: int
+    agents: list[str]
+    map: str
+    exactDice: bool
+    timeConstraint: float
+    maxRounds: int
+
+
+def schedule(lineup : list[str], games : int, playerCounts : list[int], maps : list[str], seed : int = 0,
+             exactDice : bool = False, timeConstraint : float = 1, maxRounds : int = MAXROUNDS) -> list[Match]:
+    """
+    Creates the matches of a tournament. For every player count the lineup is cycled to fill
+    the seats, so a lineup of two agents in a four player game seats each twice, then each
+    game rotates the seats by one so every agent plays from every seat equally often. Each
+    game of every map and player count gets its own seed.
+    """
+    matches = []
+    for map in maps:
+        for numPlayers in playerCounts:
+            seats = [lineup[i % len(lineup)] for i in range(numPlayers)]
+            for game in range(games):
+                rotation = game % numPlayers
+                matches.append({"seed": seed + len(matches), "agents": seats[rotation:] + seats[:rotation], "map": map,
+                                "exactDice": exactDice, "timeConstraint": timeConstraint, "maxRounds": maxRounds})
+    return matches
+
+
+def playMatch(match : Match) -> dict:
+    """
+    Plays a match, returning its result along with the match details. Output printed by the
+    agents while searching is discarded.
+    """
+    agents = [makeAgent(name, match["timeConstraint"], match["seed"] + seat) for seat, name in enumerate(match["agents"])]
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = playGame(agents, match["seed"], match["exactDice"], match["maxRounds"], MapType.from_str(match["map"]))
+    return {**match, **result}
+
+
+class ResultSink:
+    """
+    Writes game results to a file as they arrive. JSON lines files are appended to one line
+    per game, while Parquet files, which need pyarrow installed, are written once on close.
+
+    Attributes:
+        path (str): The file written to.
+        rows (list[dict]): Results held until close when writing Parquet.
+    """
+    def __init__(self, path : str):
+        self.path = path
+        self.rows = []
+        self.parquet = path.endswith(".parquet")
+        self.file = None
+        if self.parquet:
+            # Fails before any games are played rather than once they have all finished
+            try:
+                import pyarrow
+            except ImportError:
+                raise ImportError("Writing Parquet results requires pyarrow from the parquet extra, use a .jsonl file instead")
+        else:
+            self.file = open(path, "a")
+
+
+    def write(self, row : dict):
+        if self.parquet:
+            self.rows.append(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+            self.file.flush()
+
+
+    def close(self):
+        if self.parquet:
+            import pyarrow
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(pyarrow.Table.from_pylist(self.rows), self.path)
+        else:
+            self.file.close()
+
+
+def wilson(wins : int, games : int, z : float = CONFIDENCEZ) -> tuple[float, float]:
+    """
+    Wilson score interval of a win rate, which stays within 0 and 1 for small samples.
+    """
+    if games == 0:
+        return (0.0, 1.0)
+    rate = wins / games
+    centre = (rate + z * z / (2 * games)) / (1 + z * z / games)
+    margin = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+    return (max(centre - margin, 0.0), min(centre + margin, 1.0))
+
+
+def summarise(rows : list[dict], seconds : float) -> dict:
+    """
+    Aggregates results by agent name. A seat's game counts as a win if it won, so an agent
+    seated twice in a game has two chances at it. Turn times and nodes are averaged per turn.
+    """
+    stats = {}
+    for row in rows:
+        for seat, name in enumerate(row["agents"]):
+            agent = stats.setdefault(name, {"seats": 0, "wins": 0, "draws": 0, "errors": 0, "turns": 0, "turnSeconds": 0.0, "nodes": 0})
+            agent["seats"] += 1
+            agent["wins"] += row["winner"] == seat
+            agent["draws"] += row["winner"] is None
+            agent["errors"] += row["errors"][seat]
+            agent["turns"] += row["playerTurns"][seat]
+            agent["turnSeconds"] += row["turnSeconds"][seat]
+            agent["nodes"] += row["nodes"][seat]
+
+    summary = {"games": len(rows), "gamesPerSecond": len(rows) / seconds if seconds > 0 else 0.0, "agents": {}}
+    for name, agent in stats.items():
+        low, high = wilson(agent["wins"], agent["seats"])
+        turns = max(agent["turns"], 1)
+        summary["agents"][name] = {"seats": agent["seats"], "wins": agent["wins"], "winRate": agent["wins"] / agent["seats"],
+                                   "winRateLow": low, "winRateHigh": high, "drawRate": agent["draws"] / agent["seats"],
+                                   "errors": agent["errors"], "meanTurnSeconds": agent["turnSeconds"] / turns,
+                                   "meanNodes": agent["nodes"] / turns}
+    return summary
+
+
+def runTournament(matches : list[Match], out : Optional[str] = None, workers : Optional[int] = None) -> dict:
+    """
+    Plays every match over a pool of worker processes, writing each result to out as it
+    finishes, and returns the summary of all results.
+    """
+    sink = ResultSink(out) if out is not None else None
+    rows = []
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(workers or os.cpu_count()) as pool:
+            futures = [pool.submit(playMatch, match) for match in matches]
+            for future in as_completed(futures):
+                row = future.result()
+                rows.append(row)
+                if sink is not None:
+                    sink.write(row)
+    finally:
+        if sink is not None:
+            sink.close()
+    return summarise(rows, time.perf_counter() - start)
+
+
+def printSummary(summary : dict):
+    click.echo(f"Played {summary['games']} games at {summary['gamesPerSecond']:.2f} games per second")
+    for name, agent in summary["agents"].items():
+        click.echo(f"{name}: won {agent['wins']} of {agent['seats']} seats, win rate {agent['winRate']:.3f} "
+                   f"[{agent['winRateLow']:.3f}, {agent['winRateHigh']:.3f}], draws {agent['drawRate']:.3f}, "
+                   f"{agent['meanTurnSeconds'] * 1000:.1f}ms and {agent['meanNodes']:.1f} nodes per turn, {agent['errors']} errors")
+
+
+@click.command()
+@click.option("--agents", "-a", multiple=True, default=["actionAI", "randAI"], show_default=True, help="Agents in the lineup, cycled to fill the seats.")
+@click.option("--games", "-g", default=100, show_default=True, help="Games per map and player count.")
+@click.option("--players", "-p", multiple=True, type=int, default=[2, 3, 4], show_default=True, help="Player counts to play.")
+@click.option("--maps", "-m", multiple=True, default=["classic"], show_default=True, help="Maps to play on.")
+@click.option("--seed", default=0, show_default=True, help="Seed of the first game.")
+@click.option("--exact-dice", is_flag=True, help="Roll exact dice instead of sampling the dice tables.")
+@click.option("--time", "timeConstraint", default=1.0, show_default=True, help="Seconds per turn for searching agents.")
+@click.option("--max-rounds", default=MAXROUNDS, show_default=True, help="Rounds after which games are drawn.")
+@click.option("--workers", "-w", type=int, default=None, help="Worker processes, defaults to the CPU count.")
+@click.option("--out", "-o", default="tournament.jsonl", show_default=True, help="Results file, .jsonl or .parquet.")
+def main(agents, games, players, maps, seed, exact_dice, timeConstraint, max_rounds, workers, out):
+    matches = schedule(list(agents), games, list(players), list(maps), seed, exact_dice, timeConstraint, max_rounds)
+    printSummary(runTournament(matches, out, workers))
+
+
+if __name__ == "__main__":
+    main()
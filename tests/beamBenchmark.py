@@ -0,0 +1,39 @@
+import time
+# Run either as a script from the tests folder or with python -m tests.<name>
+if __package__:
+    from .fixtures import randomState
+else:
+    from fixtures import randomState
+from riskai.riskAi import ids
+from riskai.beamAI import beamSearch
+from riskai.simpleAI import attackPlanCache
+
+
+# Compares the beam search against iterative deepening on random positions, giving both
+# the same time limit and reporting the value of the move each finds and the time taken.
+# Beam search drops plans expected to lose more troops than are available, which ids
+# keeps as moves are valued assuming no losses, so it can report lower values.
+
+TIMELIMIT = 2
+
+
+def main():
+    totals = {"ids": [0, 0.0], "beam": [0, 0.0]}
+    for seed in range(10):
+        testGS = randomState(4, seed)
+        for name, search in (("ids", ids), ("beam", beamSearch)):
+            # Each search plans from scratch rather than from the other's cached attack graphs
+            attackPlanCache.clear()
+            start = time.monotonic()
+            move, value = search(testGS, TIMELIMIT)
+            elapsed = time.monotonic() - start
+            totals[name][0] += elapsed
+            totals[name][1] += value
+            print(f"Seed {seed} {name}: value {value:.1f} in {elapsed:.3f} seconds.")
+
+    for name, (elapsed, value) in totals.items():
+        print(f"{name}: mean value {value / 10:.1f}, mean time {elapsed / 10:.3f} seconds.")
+
+
+if __name__ == "__main__":
+    main()
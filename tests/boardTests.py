@@ -0,0 +1,114 @@
+import time
+import random
+# Run either as a script from the tests folder or with python -m tests.<name>
+if __package__:
+    from .fixtures import randomState
+else:
+    from fixtures import randomState
+from riskai.heuristic import findBorders
+from riskai.snapshot import saveSnapshot, loadSnapshot, pack, unpack
+from riskai.structures import Card, CardType
+from riskai.agentHelper import firstTrade
+from riskai.actions import TakeBonus, BreakBonus, generateTBSet
+import copy
+import os
+import tempfile
+
+
+# Checks that the board arrays and the graph attribute views stay in sync, and
+# compares the time taken to copy a game state against copying the networkx graph.
+
+def main():
+    testGS = randomState(4, 0)
+
+    # Writes through the graph views must land in the board arrays
+    testGS.map.graph.nodes[5]["troops"] += 3
+    assert testGS.board.troops[5] == testGS.map.graph.nodes[5]["troops"]
+
+    # Copies must be independent of the original
+    copyGS = testGS.copy()
+    copyGS.map.graph.nodes[5]["troops"] = 100
+    copyGS.map.graph.nodes[5]["player"] = 3
+    assert testGS.map.graph.nodes[5]["troops"] != 100
+    assert copyGS.board.owner[5] == 3
+    assert sorted(copyGS.map.graph.neighbors(5)) == sorted(testGS.map.graph.neighbors(5))
+
+    # Bitboard mode must agree with the set based territories after captures
+    bitGS = testGS.copy()
+    bitGS.enableBitboard()
+    rng = random.Random(1)
+    for i in range(100):
+        terr, player = rng.randint(1, 42), rng.randrange(4)
+        testGS.captureTerritory(terr, player, 1)
+        bitGS.captureTerritory(terr, player, 1)
+        assert findBorders(player, testGS) == findBorders(player, bitGS)
+        assert testGS.playerDict[player]["bonusesHeld"] == bitGS.playerDict[player]["bonusesHeld"]
+    assert generateTBSet(0, testGS) == generateTBSet(0, bitGS)
+
+    # Equal actions must hash equally, so sets of actions hold each action once
+    for action, other in ((TakeBonus("Asia", 1), TakeBonus("Asia", None)), (BreakBonus(1, "Asia"), BreakBonus(2, "Asia"))):
+        assert action != other and len({action, other, copy.copy(action)}) == 2
+
+    # Applying then undoing a move must restore the board exactly
+    owned = sorted(testGS.playerDict[0]["territories"])
+    attacks = [(owned[0], neighbour, 3, 2) for neighbour in testGS.map.graph.neighbors(owned[0]) if testGS.board.owner[neighbour] != 0]
+    before = (testGS.board.owner.tolist(), testGS.board.troops.tolist(), testGS.playerDict[0]["troops"])
+    testGS.apply((([], [(owned[0], 10)]), attacks, None))
+    testGS.undo()
+    assert before == (testGS.board.owner.tolist(), testGS.board.troops.tolist(), testGS.playerDict[0]["troops"])
+
+    # The Zobrist hash must be restored by undo and match a hash computed from scratch
+    zobrist = testGS.zobrist
+    testGS.apply((([], [(owned[0], 100)]), attacks, None))
+    assert testGS.zobrist != zobrist and testGS.board.hash == testGS.board.computeHash()
+    testGS.undo()
+    assert testGS.zobrist == zobrist and testGS.board.hash == testGS.board.computeHash()
+
+    # Snapshots in both formats must restore the same position, including bitboard mode
+    bitGS.cards = [Card(CardType.INFANTRY, 3), Card(CardType.WILD, None)]
+    bitGS.handHash = sum(bitGS.cardKey(card) for card in bitGS.cards) % 2**64
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("state.json", "state.bin"):
+            path = os.path.join(directory, name)
+            saveSnapshot(bitGS, path)
+            loaded = loadSnapshot(path)
+            assert loaded.zobrist == bitGS.zobrist and loaded.bonusOwner == bitGS.bonusOwner
+            assert loaded.board.troops.tolist() == bitGS.board.troops.tolist() and loaded.cards == bitGS.cards
+            assert all(loaded.playerDict[player]["territories"] == bitGS.playerDict[player]["territories"] for player in range(4))
+            assert loaded.map.graph.nodes[5]["troops"] == bitGS.board.troops[5]
+
+    # Both wild cards count towards a trade even though they compare equal
+    tradeGS = testGS.copy()
+    tradeGS.setHand([Card(CardType.INFANTRY, 3), Card(CardType.WILD, None), Card(CardType.WILD, None)])
+    trade = firstTrade(tradeGS)
+    assert trade is not None and len(trade) == 3 and len(tradeGS.cards) == 0
+
+    print("Testing binary snapshot load time")
+    data = pack(testGS)
+    start = time.time()
+    for i in range(10000):
+        unpack(data)
+    print("Done. That took", time.time() - start, "seconds.")
+
+    # Large troop counts share a Zobrist bucket, but the exact position key tells them apart
+    bigGS = testGS.copy()
+    bigGS.board.setTroops(5, 70)
+    bigKey, bigZobrist = bigGS.positionKey, bigGS.zobrist
+    bigGS.board.setTroops(5, 120)
+    assert bigGS.zobrist == bigZobrist and bigGS.positionKey != bigKey
+
+    print("Testing GameState copy time")
+    start = time.time()
+    for i in range(10000):
+        testGS.copy()
+    print("Done. That took", time.time() - start, "seconds.")
+
+    print("Testing networkx graph copy time")
+    start = time.time()
+    for i in range(10000):
+        testGS.map.graph.copy()
+    print("Done. That took", time.time() - start, "seconds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import time
+import tempfile
+from riskai.corpus import Corpus, writeCorpus, dealtPositions, selfPlayPositions, replay
+
+
+# Stores dealt and self-play positions in a corpus, checking each is restored exactly,
+# then replays a few positions and reports how long restoring and replaying take.
+
+def main():
+    states = dealtPositions(20, seed=0) + selfPlayPositions(20, seed=0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "corpus.bin")
+        assert writeCorpus(path, states) == 40
+
+        corpus = Corpus(path)
+        assert len(corpus) == 40
+        for state, restored in zip(states, corpus):
+            assert restored.zobrist == state.zobrist and restored.round == state.round
+            assert restored.board.troops.tolist() == state.board.troops.tolist()
+            assert restored.playerDict.keys() == state.playerDict.keys()
+
+        start = time.perf_counter()
+        for i in range(1000):
+            corpus[i % len(corpus)]
+        print("Restored 1000 positions. That took", time.perf_counter() - start, "seconds.")
+
+        out = os.path.join(directory, "replay.jsonl")
+        start = time.perf_counter()
+        summary = replay(corpus, 0.1, out, limit=5)
+        print("Replayed 5 positions. That took", time.perf_counter() - start, "seconds.")
+        assert summary["positions"] == 5 and set(summary["plan"]) == {"p50", "p90", "p99", "mean", "max"}
+        with open(out) as file:
+            assert len(file.readlines()) == 5
+        print("Replay latencies:", summary)
+
+
+if __name__ == "__main__":
+    main()
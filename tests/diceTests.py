@@ -0,0 +1,60 @@
+import time
+import random
+from riskai.dice import BattleChain, winProbability, expectedRemaining, remainingDistribution, blitz, perfectDice, simulateBattles, attackSuccess
+import numpy as np
+from riskai.attackOdds import attackSuccessProbability, branchOdds, optimiseSplits
+from riskai.dice import simulateAttack
+
+
+# Checks the exact battle odds against known values and sampled blitz attacks, and reports
+# how long filling and growing the memo takes.
+
+def main():
+    assert abs(winProbability(1, 1) - 15 / 36) < 1e-12
+    assert winProbability(5, 0) == 1 and winProbability(0, 5) == 0
+
+    attacked, defended = remainingDistribution(10, 8)
+    assert abs(attacked.sum() - 1) < 1e-9 and abs(defended.sum() - 1) < 1e-9
+    assert abs(attacked[0] - (1 - winProbability(10, 8))) < 1e-9
+    assert abs(sum(i * p for i, p in enumerate(attacked)) - expectedRemaining(10, 8)[0]) < 1e-9
+
+    rng = random.Random(0)
+    samples = [blitz(10, 8, rng) for _ in range(50000)]
+    assert abs(sum(att > 0 for att, _ in samples) / len(samples) - winProbability(10, 8)) < 0.01
+
+    start = time.perf_counter()
+    chain = BattleChain(256)
+    print("Filled odds of every battle up to 255 troops. That took", time.perf_counter() - start, "seconds.")
+    assert abs(chain.winProbability(200, 150) - winProbability(200, 150)) < 1e-9
+
+    start = time.perf_counter()
+    attLost, defLost = simulateBattles(60, 50, 100000, np.random.default_rng(0))
+    print("Rolled 100000 battles of 60 against 50. That took", time.perf_counter() - start, "seconds.")
+    assert attLost.sum() == 100000
+    assert abs(defLost[50] / 100000 - winProbability(60, 50)) < 0.01
+    assert abs(attLost @ np.arange(61) / 100000 - (60 - expectedRemaining(60, 50)[0])) < 0.2
+
+    # A single attack along a chain succeeds as often as the exact odds of its battle
+    troops = np.array([0, 12, 5, 1])
+    assert abs(attackSuccess(troops, [(1, 2, 0, 11)], 50000, np.random.default_rng(1)) - winProbability(11, 5)) < 0.01
+    assert attackSuccess(troops, [(1, 2, 0, 11), (2, 3, 0, 11)], 50000) <= winProbability(11, 5)
+
+    # Exact odds of a branching attack match rolling it, and optimised splits do no worse
+    troops = np.array([0, 20, 3, 2, 4, 1, 2, 3])
+    attack = [(1, 2, 0, 10), (2, 3, 0, 5), (2, 4, 0, 10), (1, 5, 0, 20), (5, 6, 0, 20), (6, 7, 0, 20)]
+    captured, _ = simulateAttack(troops, attack, 100000, np.random.default_rng(2))
+    assert abs(attackSuccessProbability(troops, attack) - captured.mean()) < 0.01
+    assert abs(branchOdds(troops, attack)[2][0] - winProbability(19, 3)) < 1e-9
+
+    start = time.perf_counter()
+    splitAttack, success = optimiseSplits(troops, attack)
+    print("Optimised splits from", attackSuccessProbability(troops, attack), "to", success, "success. That took", time.perf_counter() - start, "seconds.")
+    assert success >= attackSuccessProbability(troops, attack)
+    assert abs(attackSuccessProbability(troops, splitAttack) - success) < 1e-12
+
+    # Beyond the perfect dice table
+    assert perfectDice(1001) > perfectDice(1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# Positions shared by the test scripts. Scripts import it as fixtures when run directly, where
+# the tests folder is on the path, and as .fixtures when run with python -m tests.<name>.
+from maps.mapStructures import Map, MapType
+from riskai.structures import GameState
+import random
+
+
+def randomState(numPlayers : int, seed : int, mapType : MapType = MapType.CLASSIC) -> GameState:
+    """
+    Sets up a position with every territory given to a random player with 1 to 20 troops,
+    from the view of player 0.
+    """
+    rng = random.Random(seed)
+    map = Map(mapType)
+    for node in map.graph.nodes:
+        map.graph.nodes[node]["player"] = rng.randrange(numPlayers)
+        map.graph.nodes[node]["troops"] = rng.randint(1, 20)
+
+    playerDict = {i: {"id": i, "colour": str(i), "troops": 0, "territories": set(), "bonusesHeld": set(), "prevIncome": 0, "cardsNum": 0}
+                  for i in range(numPlayers)}
+    for node in map.graph.nodes:
+        player = map.graph.nodes[node]["player"]
+        playerDict[player]["troops"] += map.graph.nodes[node]["troops"]
+        playerDict[player]["territories"].add(node)
+
+    return GameState(map, 0, 1, playerDict, list(range(numPlayers)), [], [])
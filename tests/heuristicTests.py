@@ -0,0 +1,48 @@
+import time
+import random
+import numpy as np
+# Run either as a script from the tests folder or with python -m tests.<name>
+if __package__:
+    from .fixtures import randomState
+else:
+    from fixtures import randomState
+from riskai.heuristic import heuristic, heuristicBatch, IncrementalHeuristic
+
+
+# Checks that the batch and incremental heuristics agree with heuristic() over random
+# moves, and compares how long each takes per evaluated state.
+
+def randomMove(gameState, rng : random.Random):
+    owned = sorted(gameState.playerDict[gameState.agentID]["territories"])
+    attacks = [(terr, neighbour, 3, rng.randint(1, 5)) for terr in rng.sample(owned, min(3, len(owned)))
+               for neighbour in gameState.map.graph.neighbors(terr) if gameState.board.owner[neighbour] != gameState.agentID]
+    return (([], [(owned[0], rng.randint(1, 9))]), attacks[:rng.randint(0, 6)], None)
+
+
+def main():
+    rng = random.Random(0)
+    testGS = randomState(4, 3)
+    incremental = IncrementalHeuristic(testGS)
+
+    owners, troops, evals = [], [], []
+    start = time.time()
+    for i in range(1000):
+        changed = testGS.apply(randomMove(testGS, rng))
+        incremental.update(changed)
+        evals.append(heuristic(testGS))
+        assert incremental.value() == evals[-1]
+
+        owners.append(testGS.board.owner.copy())
+        troops.append(testGS.board.troops.copy())
+        testGS.undo()
+        incremental.update(changed)
+    print("Evaluated 1000 states one by one. That took", time.time() - start, "seconds.")
+
+    start = time.time()
+    batchEvals = heuristicBatch(testGS, np.array(owners), np.array(troops))
+    print("Evaluated 1000 states in a batch. That took", time.time() - start, "seconds.")
+    assert np.array_equal(batchEvals, np.array(evals))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+# Run either as a script from the tests folder or with python -m tests.<name>
+if __package__:
+    from .fixtures import randomState
+else:
+    from fixtures import randomState
+from riskai.riskAi import ids, searchPool, generateActionDict, generateActionSeq, validateActionSet, evalAction, actionTargets
+from riskai.pricing import ActionPricer, MINSUCCESS
+from riskai.deadline import Deadline
+from riskai.mctsAI import MCTSAgent
+from riskai.simpleAI import AttackPlanCache
+
+
+# Runs several agent searches at once on separate threads under sub-second deadlines,
+# checking each stops on time and leaves its game state as it found it, then checks
+# the parallel search agrees with the serial one and tree search reuses its tree.
+
+def search(seed : int, seconds : float):
+    testGS = randomState(4, seed)
+    before = (testGS.zobrist, testGS.board.owner.tolist(), testGS.board.troops.tolist(), len(testGS.cards))
+    start = time.monotonic()
+    move, value = ids(testGS, Deadline(seconds))
+    elapsed = time.monotonic() - start
+    assert before == (testGS.zobrist, testGS.board.owner.tolist(), testGS.board.troops.tolist(), len(testGS.cards))
+    return move, value, elapsed
+
+
+def main():
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(search, range(4), [0.3] * 4))
+    for move, value, elapsed in results:
+        print("Search returned a move of value", value, "after", elapsed, "seconds.")
+        assert move is not None
+
+    # A small shared plan cache must survive threads evicting each other's plans
+    cache = AttackPlanCache(maxSize=8)
+    def churn(offset : int):
+        for i in range(20000):
+            cache.get((offset + i) % 32)
+            cache.put((offset + i) % 32, i)
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(churn, range(4)))
+    assert len(cache.plans) == 8
+
+    # Generated sequences must be valid, unique and start with the most valuable actions
+    testGS = randomState(4, 1)
+    actionDict = generateActionDict(testGS.agentID, testGS)
+    for depth in range(1, 4):
+        seqs = list(generateActionSeq(testGS, actionDict, depth))
+        assert len(seqs) == len(set(seqs)) and all(validateActionSet(seq) for seq in seqs)
+        firsts = [max(evalAction(action) for action in seq) for seq in seqs]
+        assert firsts == sorted(firsts, reverse=True)
+        
+    # Every generated sequence is priced as feasible, and more targets never succeed more often
+    pricer = ActionPricer(testGS)
+    targets = actionTargets(testGS, set().union(*actionDict.values()))
+    for seq in generateActionSeq(testGS, actionDict, 2):
+        assert pricer.feasible(frozenset().union(*(targets[action] for action in seq)))
+    for first in targets.values():
+        for second in targets.values():
+            assert pricer.success(first | second) <= pricer.success(first) + 1e-9
+
+    # Success is an upper bound, so spread out targets a stack can take in turn are not cut
+    spread = ActionPricer(testGS)
+    spread.available = 6
+    spread.troops = [1] * len(spread.troops)
+    assert spread.success(set(range(1, 6))) >= 0.24 > MINSUCCESS
+
+    # Parallel search must reach the same result as serial search when both finish
+    start = time.monotonic()
+    parallelMove, parallelValue = ids(randomState(4, 2), 60, workers=2)
+    print("Parallel search finished after", time.monotonic() - start, "seconds.")
+    start = time.monotonic()
+    serialMove, serialValue = ids(randomState(4, 2), 60)
+    print("Serial search finished after", time.monotonic() - start, "seconds.")
+    assert parallelValue == serialValue
+
+    # Parallel searches share one pool, and no batch is left running once a search returns
+    pool = searchPool(2)
+    start = time.monotonic()
+    ids(randomState(4, 3), 0.2, workers=2)
+    print("Short parallel search returned after", time.monotonic() - start, "seconds.")
+    assert searchPool(2) is pool and len(pool._pending_work_items) == 0
+
+    # Tree search must leave the state untouched and continue its tree on the same position
+    testGS = randomState(4, 0)
+    zobrist = testGS.zobrist
+    agent = MCTSAgent(seed=0)
+    move, value = agent.search(testGS, 0.5)
+    visits = agent.tree.root.visits
+    assert move is not None and testGS.zobrist == zobrist
+    agent.search(testGS, 0.2)
+    assert agent.tree.root.visits > visits
+    print("Tree search made", agent.tree.root.visits, "rollouts.")
+
+    # The same position in another state object continues the tree, evaluating on the new state
+    copyGS = testGS.copy()
+    visits = agent.tree.root.visits
+    agent.search(copyGS, 0.2)
+    assert agent.tree.root.visits > visits and agent.tree.heuristic.gameState is copyGS
+
+    # A cancelled deadline stops the search straight away
+    deadline = Deadline(60)
+    deadline.cancel()
+    start = time.monotonic()
+    ids(randomState(4, 0), deadline)
+    assert time.monotonic() - start < 1
+
+
+if __name__ == "__main__":
+    main()
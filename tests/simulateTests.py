@@ -0,0 +1,78 @@
+import time
+import random
+import logging
+from riskai.simulate import Game, playGame, makeAgent
+from riskai.randAI import randAI
+from riskai.tournament import schedule, runTournament, wilson
+
+
+# Plays headless games, checking they are repeatable for a seed, that player totals
+# match the board and no cards are lost, and reports the turns played per second.
+
+def checkState(game : Game):
+    gameState = game.gameState
+    for player, data in gameState.playerDict.items():
+        owned = gameState.board.owner == player
+        assert data["troops"] == int(gameState.board.troops[owned].sum())
+        assert data["territories"] == set(gameState.board.nodes[owned[1:]].tolist())
+        assert data["cardsNum"] == len(game.hands[player])
+    assert len(game.deck) + sum(len(hand) for hand in game.hands.values()) == 44
+
+
+def main():
+    first = playGame([randAI] * 4, 7)
+    second = playGame([randAI] * 4, 7)
+    for result in (first, second):
+        result.pop("seconds"), result.pop("turnSeconds")
+    assert first == second
+
+    # Games must leave the global generator alone
+    random.seed(3)
+    expected = random.random()
+    random.seed(3)
+    playGame([randAI] * 2, 7, maxRounds=5)
+    assert random.random() == expected
+
+    # Agents raising an error lose the turn, and the error is kept in the result
+    def failing(gameState):
+        raise RuntimeError("failing agent")
+    logging.disable(logging.CRITICAL)
+    result = playGame([failing, randAI], 0, maxRounds=2)
+    logging.disable(logging.NOTSET)
+    assert result["errors"][0] == len(result["failures"]) > 0
+    assert all(failure["player"] == 0 and "failing agent" in failure["error"] for failure in result["failures"])
+
+    turns = 0
+    start = time.perf_counter()
+    for seed in range(20):
+        game = Game([randAI] * 4, seed, exactDice=seed % 2 == 0)
+        for _ in range(50):
+            game.gameState.round = 0
+            if game.play(1)["winner"] is not None:
+                break
+            checkState(game)
+        turns += game.turns
+    print("Played", turns, "random agent turns. That took", time.perf_counter() - start, "seconds.")
+
+    result = playGame([makeAgent("actionAI", 0.2), randAI, randAI], 0, maxRounds=10)
+    print("Search agent game:", result)
+    assert result["errors"][0] == 0
+
+    # Every agent plays every seat equally often
+    matches = schedule(["actionAI", "randAI"], 4, [2, 4], ["classic"], maxRounds=5)
+    for numPlayers in (2, 4):
+        lineups = [match["agents"] for match in matches if len(match["agents"]) == numPlayers]
+        for seat in range(numPlayers):
+            assert sum(lineup[seat] == "actionAI" for lineup in lineups) == 2
+    assert len({match["seed"] for match in matches}) == len(matches)
+
+    low, high = wilson(5, 10)
+    assert 0 < low < 0.5 < high < 1
+
+    summary = runTournament(schedule(["randAI"], 8, [2, 3], ["classic"], maxRounds=20), workers=2)
+    print("Tournament:", summary)
+    assert summary["games"] == 16 and summary["agents"]["randAI"]["seats"] == 40
+
+
+if __name__ == "__main__":
+    main()
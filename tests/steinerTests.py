@@ -0,0 +1,124 @@
+import time
+import random
+import itertools
+import numpy as np
+import networkx as nx
+from riskai.board import Board
+from riskai.steiner import SteinerGraph
+from riskai.stackPaths import StackPaths, stackPathsCache, stackPathsCached
+from riskai.simulate import newGame
+from riskai.simpleAI import attackGraphSimple
+from riskai.multiAI import attackGraphMulti
+
+
+# Checks Steiner arborescences against every tree found by brute force on small random boards,
+# then reports how long planning takes on the classic map.
+
+def randomBoard(seed : int, size : int) -> tuple[Board, nx.Graph]:
+    rng = random.Random(seed)
+    graph = nx.relabel_nodes(nx.gnp_random_graph(size, 0.3, seed=seed), lambda node: node + 1)
+    indptr, indices = [0, 0], []
+    for node in range(1, size + 1):
+        indices += sorted(graph.neighbors(node))
+        indptr.append(len(indices))
+    owner = np.array([-1] + [rng.choice([0, 1, 1, 1]) for _ in range(size)], dtype=np.int32)
+    troops = np.array([0] + [rng.randint(1, 9) for _ in range(size)], dtype=np.int32)
+    return (Board(owner, troops, np.array(indptr, dtype=np.int32), np.array(indices, dtype=np.int32)), graph)
+
+
+def bruteForce(board : Board, graph : nx.Graph, roots : set, enemy : list, targets : set, forest : bool = False) -> float:
+    """
+    Cheapest set of enemy territories holding the targets which some root reaches entirely, or 
+    for a forest which the roots reach between them. 
+    """
+    best = np.inf
+    for count in range(len(targets), len(enemy) + 1):
+        for territories in map(set, itertools.combinations(enemy, count)):
+            if not targets <= territories:
+                continue
+            for starts in [roots] if forest else [{root} for root in roots]:
+                reached = set().union(*(nx.node_connected_component(graph.subgraph(territories | starts), start) for start in starts))
+                if territories <= reached:
+                    best = min(best, float(board.troops[list(territories)].sum()))
+    return best
+
+
+def main():
+    rng = random.Random(0)
+    for seed in range(40):
+        board, graph = randomBoard(seed, 11)
+        roots = set(np.flatnonzero(board.owner == 0).tolist())
+        enemy = [terr for terr in range(1, 12) if board.owner[terr] == 1]
+        if not roots or len(enemy) < 3:
+            continue
+        targets = set(rng.sample(enemy, rng.randint(1, 3)))
+
+        result = SteinerGraph(board, 0, roots).arborescence(targets)
+        cost = result[2] if result is not None else np.inf
+        assert cost == bruteForce(board, graph, roots, enemy, targets)
+        if result is not None:
+            assert nx.is_arborescence(result[0]) and targets <= set(result[0].nodes())
+
+        result = SteinerGraph(board, 0, roots).forest(targets)
+        cost = result[1] if result is not None else np.inf
+        assert cost == bruteForce(board, graph, roots, enemy, targets, forest=True)
+        if result is not None:
+            trees = result[0]
+            assert all(nx.is_arborescence(tree) and root in tree for root, tree in trees.items())
+            assert targets <= set().union(*(tree.nodes() for tree in trees.values()))
+            assert cost == sum(board.troops[list(tree.nodes())].sum() - board.troops[root] for root, tree in trees.items())
+
+        # Stack paths cost the same as the Steiner graph's paths from each root
+        paths = StackPaths(board, 0, roots, board.troops)
+        steinerGraph = SteinerGraph(board, 0, roots)
+        for root in roots:
+            for terr in enemy:
+                assert paths.costs[paths.row[root], terr] == steinerGraph.costs[steinerGraph.local[root], steinerGraph.local[terr]]
+                path = paths.path(root, terr)
+                if path is not None:
+                    assert path[0] == root and path[-1] == terr and all(graph.has_edge(u, v) for u, v in zip(path, path[1:]))
+                    assert board.troops[path[1:]].sum() == paths.costs[paths.row[root], terr]
+
+    start = time.perf_counter()
+    plans = 0
+    for seed in range(20):
+        gameState = newGame(3, random.Random(seed))
+        enemy = [terr for terr in gameState.board.nodes.tolist() if gameState.board.owner[terr] != 0]
+        for count in range(1, 13):
+            plans += attackGraphSimple(gameState, set(random.Random(count).sample(enemy, count))) is not None
+    print("Planned", plans, "of 240 target sets. That took", time.perf_counter() - start, "seconds.")
+
+    # Targets split between stacks are all attacked, each from one stack
+    start = time.perf_counter()
+    plans = 0
+    for seed in range(20):
+        gameState = newGame(3, random.Random(seed))
+        enemy = [terr for terr in gameState.board.nodes.tolist() if gameState.board.owner[terr] != 0]
+        for count in range(1, 13):
+            targets = set(random.Random(count).sample(enemy, count))
+            result = attackGraphMulti(gameState, targets)
+            if result is None:
+                continue
+            trees, requirements = result
+            plans += 1
+            assert targets <= set().union(*(tree.nodes() for tree in trees.values()))
+            assert set(requirements) == set(trees)
+    print("Planned", plans, "of 240 target sets from several stacks. That took", time.perf_counter() - start, "seconds.")
+
+    start = time.perf_counter()
+    for seed in range(20):
+        stackPathsCache.clear()
+        paths = stackPathsCached(newGame(3, random.Random(seed)))
+        assert (paths.nearest[paths.stacks] == 0).all()
+    print("Found paths from every stack on 20 boards. That took", time.perf_counter() - start, "seconds.")
+
+    # Stacks depend on the agent's troop total as well as the board, so a changed total is not served stale paths
+    gameState = newGame(3, random.Random(0))
+    before = stackPathsCached(gameState).stacks
+    gameState.playerDict[0]["troops"] = 0
+    after = stackPathsCached(gameState).stacks
+    assert before != after and set(after) == gameState.playerDict[0]["territories"]
+
+
+if __name__ == "__main__":
+    main()